@@ -0,0 +1,95 @@
+# Vectorized group aggregations shared by app.py and plots.py.
+#
+# The population-weighted means used to be
+#     df.groupby(keys).apply(lambda x: pd.Series({...}))
+# which calls back into Python once per group. Here the keys are factorized
+# into one integer code per row and the per-group sums are np.bincount calls.
+# Semantics follow the groupby: groups are sorted, rows with a missing key are
+# dropped, and NaN values are skipped in the sums.
+
+import numpy as np
+import pandas as pd
+
+
+def group_codes(df, by):
+    # one integer code per row (-1 for rows with a missing key) plus the
+    # sorted key values of every observed group
+    by = [by] if isinstance(by, str) else list(by)
+    codes = np.zeros(len(df), dtype=np.int64)
+    missing = np.zeros(len(df), dtype=bool)
+    uniques = []
+    for col in by:
+        col_codes, col_uniques = pd.factorize(df[col], sort=True)
+        missing |= col_codes < 0
+        codes = codes * len(col_uniques) + col_codes
+        uniques.append(col_uniques)
+
+    space = int(np.prod([len(col_uniques) for col_uniques in uniques]))
+    if space <= 4 * len(df) + 1024:
+        # small key space: find the observed groups with a bincount, no sort
+        observed = np.flatnonzero(np.bincount(codes[~missing], minlength=space))
+        remap = np.full(space, -1, dtype=np.int64)
+        remap[observed] = np.arange(len(observed))
+        codes = np.where(missing, -1, remap[np.where(missing, 0, codes)])
+    else:
+        observed, row_codes = np.unique(codes[~missing], return_inverse=True)
+        codes[missing] = -1
+        codes[~missing] = row_codes
+
+    # decode the mixed-radix group ids back into one code per key column
+    keys = {}
+    for col, col_uniques in zip(reversed(by), reversed(uniques)):
+        keys[col] = col_uniques.take(observed % len(col_uniques))
+        observed = observed // len(col_uniques)
+    keys = pd.DataFrame({col: keys[col] for col in by})
+    return codes, keys
+
+
+def group_sum(codes, values, n_groups):
+    # NaN is skipped like in a pandas sum; +-inf is kept
+    present = codes >= 0
+    values = np.asarray(values, dtype=np.float64)[present]
+    return np.bincount(codes[present], weights=np.where(np.isnan(values), 0, values), minlength=n_groups)
+
+
+def weighted_mean(df, by, value, weight, name):
+    # sum(value * weight) / sum(weight) per group, like the groupby.apply it replaces
+    codes, keys = group_codes(df, by)
+    values = df[value].to_numpy(dtype=np.float64)
+    weights = df[weight].to_numpy(dtype=np.float64)
+
+    # inf * 0 (a rate over a zero-population tract) is NaN, as in pandas
+    with np.errstate(divide="ignore", invalid="ignore"):
+        numerator = group_sum(codes, values * weights, len(keys))
+        denominator = group_sum(codes, weights, len(keys))
+        keys[name] = numerator / denominator
+    return keys
+
+
+def per_1000(count, population):
+    return count / population * 1000
+
+
+# columns of the tract-month table other than the per-category counts and
+# their `<category>_per_1000` rates
+TRACT_MONTH_FIXED = ["GEOID", "year_month", "violations_count", "population", "per_cap_inc", "violations_per_1000"]
+
+
+def align_categories(tract_month):
+    # a tract-month table stitched from parts with different category columns,
+    # as a full build writes it: a category missing from a part counted 0
+    # there, the rates are recomputed from the counts (so zero-population
+    # tracts keep their NaN and inf rates) and the columns are in full-build
+    # order
+    category_cols = sorted(
+        col for col in tract_month.columns
+        if col not in TRACT_MONTH_FIXED and not col.endswith("_per_1000")
+    )
+    tract_month = tract_month.copy()
+    tract_month[category_cols] = tract_month[category_cols].fillna(0)
+    for col in category_cols:
+        tract_month[f"{col}_per_1000"] = per_1000(tract_month[col], tract_month["population"])
+    return tract_month[[
+        *TRACT_MONTH_FIXED[:2], *category_cols, *TRACT_MONTH_FIXED[2:],
+        *[f"{col}_per_1000" for col in category_cols],
+    ]]
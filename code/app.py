@@ -5,71 +5,91 @@
 # fix tooltips on first two graphs
 # remove categories: other and permits
 # add address to map tooltip
-# consider adding a category for all
+
+import time
+
+# time to first render is measured from here
+run_started = time.perf_counter()
 
 import streamlit as st
 import pandas as pd
-import geopandas as gpd
-import pydeck as pdk
-from pathlib import Path
 import os
-import altair as alt
+import json
+
+# altair (with chart_data, which needs it) and pydeck are imported where the
+# charts and the map are built, so the title and counts render before those
+# imports run on a cold start
+import aggregation
+import cube
+import dashboard_data
+import derived_data
+import map_layers
+import tile_server
 
 st.set_page_config(layout="wide")
 
-# Load Data
-@st.cache_data
+# Load Data: the compact dashboard frame (no geometry, categorical text,
+# integer GEOID codes and day numbers, float32 coordinates), loaded once per
+# server process and shared read-only by every session
+@st.cache_resource
 def load_data():
-    BASE_DIR = Path(__file__).resolve().parents[1]
-    data_path = BASE_DIR / "data" / "derived-data" / "Building_Violations_w_ACS.gpkg"
-    gdf = gpd.read_file(data_path)
-    gdf = gdf.rename(columns={
-    "VIOLATION DATE": "violation_date",
-    "VIOLATION DESCRIPTION": "violation_description",
-    "VIOLATION STATUS": "violation_status"
-    })
-    gdf["violation_date"] = pd.to_datetime(gdf["violation_date"])
-    gdf["violation_date"] = gdf["violation_date"].dt.strftime("%Y-%m-%d")
-    #gdf["violation_date"] = pd.to_datetime(gdf["violation_date"])
-    #gdf["year_month"] = gdf["violation_date"].dt.to_period("M").astype(str)
-
-    gdf= gdf[
-    ~gdf["violation_category"].isin(
-        ["Permits / Administrative", "Other / Misc"]
-    )
-].copy()
+    return dashboard_data.DashboardData(dashboard_data.load())
 
-    return gdf
+@st.cache_resource
+def load_cube():
+    return derived_data.read_cube(), derived_data.read_tract_dimension()
 
-gdf = load_data()
+# whether this server process has logged its (cold start) render times yet
+@st.cache_resource
+def render_log():
+    return {"reported": False}
+
+data = load_data()
+violation_cube, tract_dimension = load_cube()
 
 # Sidebar Category Toggle
-categories = sorted(gdf["violation_category"].dropna().unique())
+categories = data.categories
+
+all_categories = st.sidebar.checkbox("All categories")
+if all_categories:
+    selected_categories = categories
+else:
+    selected_categories = st.sidebar.multiselect(
+        "Select Violation Categories",
+        categories,
+        default=categories[:1]
+    )
+if not selected_categories:
+    st.warning("Select at least one violation category.")
+    st.stop()
 
-selected_category = st.sidebar.selectbox(
-    "Select Violation Category",
-    categories
+selected_category = "All categories" if all_categories else ", ".join(selected_categories)
+
+# Map-only filters on violation status and inspection category
+selected_statuses = st.sidebar.multiselect(
+    "Violation Status (map)",
+    data.values("violation_status"),
+    default=data.values("violation_status")
+)
+selected_inspections = st.sidebar.multiselect(
+    "Inspection Category (map)",
+    data.values("INSPECTION CATEGORY"),
+    default=data.values("INSPECTION CATEGORY")
 )
 
 
 st.title("Chicago Building Violations from 2024-2026: {}".format(selected_category))
+first_render = time.perf_counter() - run_started
 
-filtered = gdf[gdf["violation_category"] == selected_category].copy()
-
-# Count violations by tract AND inspection category
-category_counts = (
-    filtered
-    .groupby(["GEOID", "INSPECTION CATEGORY"])
-    .size()
-    .reset_index(name="category_count")
+# Count violations by tract AND inspection category, and per tract, from the
+# precomputed cube instead of regrouping the raw points
+category_counts, tract_level, violations_shown = cube.tract_summary(
+    violation_cube, tract_dimension, selected_categories
 )
 
 # Get total violations per tract
-total_counts = (
-    filtered
-    .groupby("GEOID")
-    .size()
-    .reset_index(name="total_violations")
+total_counts = tract_level[["GEOID", "violations"]].rename(
+    columns={"violations": "total_violations"}
 )
 
 # Merge totals
@@ -85,23 +105,11 @@ category_counts["category_share"] = (
     category_counts["total_violations"]
 )
 
-# Aggregate to tract level
-tract_level = (
-    filtered
-    .groupby("GEOID")
-    .agg(
-        per_cap_inc=("per_cap_inc", "first"),
-        population=("population", "first"),
-        violations=("GEOID", "size")  
-    )
-    .reset_index()
-)
-
 # Calculate violations per 1,000 residents
-tract_level["violations_per_1000"] = (
-    tract_level["violations"] /
+tract_level["violations_per_1000"] = aggregation.per_1000(
+    tract_level["violations"],
     tract_level["population"]
-) * 1000
+)
 
 tract_categories = category_counts.merge(
     tract_level,
@@ -122,26 +130,20 @@ tract_categories = tract_categories.merge(
 )
 
 # calculate population weighted mean
-quintile_totals = (
-    tract_level
-    .groupby("income_quintile")
-    .apply(lambda x: pd.Series({
-        "weighted_avg_violations_per_1000":
-            (x["violations_per_1000"] * x["population"]).sum() /
-            x["population"].sum()
-    }))
-    .reset_index()
+quintile_totals = aggregation.weighted_mean(
+    tract_level,
+    "income_quintile",
+    value="violations_per_1000",
+    weight="population",
+    name="weighted_avg_violations_per_1000"
 )
 
-quintile_category_shares = (
-    tract_categories
-    .groupby(["income_quintile", "INSPECTION CATEGORY"])
-    .apply(lambda x: pd.Series({
-        "weighted_share":
-            (x["category_share"] * x["population"]).sum() /
-            x["population"].sum()
-    }))
-    .reset_index()
+quintile_category_shares = aggregation.weighted_mean(
+    tract_categories,
+    ["income_quintile", "INSPECTION CATEGORY"],
+    value="category_share",
+    weight="population",
+    name="weighted_share"
 )
 
 quintile_category_summary = quintile_category_shares.merge(
@@ -163,14 +165,23 @@ label_map = {
 
 quintile_category_summary["INSPECTION CATEGORY"] = (
     quintile_category_summary["INSPECTION CATEGORY"]
+    .astype(str)
     .replace(label_map)
 )
 
-st.write("Number of violations shown:", len(filtered))
+st.write("Number of violations shown:", violations_shown)
 
 st.subheader("Violations per 1,000 vs Per Capita Income (Tract Level)")
 
-bar_chart = alt.Chart(quintile_category_summary).mark_bar().encode(
+import altair as alt
+
+import chart_data
+
+# every chart gets only the rows and columns it draws; the regression line is
+# fitted here rather than by transform_regression in the browser
+bar_chart = alt.Chart(chart_data.columns(
+    quintile_category_summary, "income_quintile", "INSPECTION CATEGORY", "category_violations_per_1000"
+)).mark_bar().encode(
     x=alt.X(
         "income_quintile:N",
         title="Income Quintile",
@@ -194,7 +205,9 @@ bar_chart = alt.Chart(quintile_category_summary).mark_bar().encode(
     height=500
 )
 
-scatter = alt.Chart(tract_level).mark_circle(size=60, opacity=0.6).encode(
+scatter = alt.Chart(chart_data.columns(
+    tract_level, "GEOID", "per_cap_inc", "violations_per_1000", "violations"
+)).mark_circle(size=60, opacity=0.6).encode(
     x=alt.X("per_cap_inc:Q", title="Per Capita Income", scale=alt.Scale(domainMin=0)),
     y=alt.Y("violations_per_1000:Q", title="Violations per 1,000 Residents", scale=alt.Scale(domainMin=0)),
     tooltip=[
@@ -204,9 +217,8 @@ scatter = alt.Chart(tract_level).mark_circle(size=60, opacity=0.6).encode(
         "violations"
     ]
 )
-trendline = alt.Chart(tract_level).transform_regression(
-    "per_cap_inc",
-    "violations_per_1000"
+trendline = alt.Chart(
+    chart_data.regression_line(tract_level, "per_cap_inc", "violations_per_1000")
 ).mark_line(size=3, color="steelblue").encode(
     x=alt.X("per_cap_inc:Q", scale=alt.Scale(domainMin=0)),
     y=alt.Y("violations_per_1000:Q", scale=alt.Scale(domainMin=0))
@@ -224,25 +236,71 @@ with col1:
 with col2:
     st.altair_chart(bar_chart)
 
-# Month filtering for Map Only 
-#months = sorted(filtered["year_month"].dropna().unique().tolist())
-#month_options = ["All Months"] + months
-
-#selected_month = st.select_slider(
-   # "Select Month for Map",
-    #options=month_options,
-    #value="All Months"
-#)
-
-#if selected_month == "All Months":
-   # map_data = filtered
-#else:
-   # map_data = filtered[filtered["year_month"] == selected_month]
+# Month filtering for Map Only: the full range also keeps violations with no
+# date; any narrower range is a slice of the per-category month index
+month_range = None
+if data.months:
+    selected_months = st.select_slider(
+        "Select Months for Map",
+        options=data.months,
+        value=(data.months[0], data.months[-1])
+    )
+    if selected_months != (data.months[0], data.months[-1]):
+        month_range = selected_months
+
+# resolved through the precomputed bitmasks and month offsets; filters left
+# at "everything" are skipped
+map_data = data.select(
+    categories=None if all_categories else selected_categories,
+    statuses=None if len(selected_statuses) == len(data.values("violation_status")) else selected_statuses,
+    inspection_categories=(
+        None if len(selected_inspections) == len(data.values("INSPECTION CATEGORY")) else selected_inspections
+    ),
+    months=month_range
+)
 
-map_data = filtered
+# Map level of detail: binned counts when zoomed out, individual points (and
+# their tooltips) only inside the viewport once zoomed in. With a tile
+# pyramid built by preprocessing, the map can instead fetch vector tiles for
+# the current viewport from tile_server.py.
+tiles_path = derived_data.DERIVED_DIR / f"{derived_data.TILES}.mbtiles"
+tile_url = os.environ.get("VIOLATION_TILE_URL", tile_server.tile_url())
+
+# re-checked at most every 30 seconds, so a tile server started later shows up
+@st.cache_data(ttl=30, show_spinner=False)
+def tiles_served(url):
+    return tile_server.is_serving(url)
+
+map_source = "Server-side bins"
+if tiles_path.exists():
+    if tiles_served(tile_url):
+        map_source = st.sidebar.radio("Map data", ["Server-side bins", "Vector tiles"])
+    else:
+        st.sidebar.caption(
+            "Vector tiles are built, but no tile server answers at {}. "
+            "Start one with `python code/tile_server.py` to use them for the map.".format(tile_url)
+        )
+
+map_zoom = st.sidebar.slider("Map zoom", min_value=9, max_value=16, value=10)
+
+tract_centers = (
+    map_data[map_data["GEOID"] != dashboard_data.MISSING_GEOID]
+    .groupby("GEOID")[["LONGITUDE", "LATITUDE"]]
+    .median()
+)
+map_center = st.sidebar.selectbox(
+    "Center map on tract",
+    ["Chicago"] + tract_centers.index.tolist(),
+    format_func=lambda option: option if option == "Chicago" else dashboard_data.geoid_strings([option])[0]
+)
+if map_center == "Chicago":
+    center_lon, center_lat = -87.6298, 41.8781
+else:
+    center_lon, center_lat = tract_centers.loc[map_center].astype(float).tolist()
 
 # PyDeck Layer
 st.subheader("Interactive Map")
+import pydeck as pdk
 st.markdown("""
 <div style="display: flex; gap: 30px; align-items: center;">
     <div><span style="color:rgb(255,0,0); font-size:20px;">●</span> OPEN</div>
@@ -251,34 +309,115 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-layer = pdk.Layer(
-    "ScatterplotLayer",
-    data=map_data,
-    get_position='[LONGITUDE, LATITUDE]',
-    get_radius=50,   
-    get_fill_color="""
-    violation_status === 'OPEN'
-        ? [255, 0, 0, 180]
-        : violation_status === 'COMPLIED'
-            ? [0, 200, 0, 180]
-            : [150, 150, 150, 140]
-""",
-    pickable=True,
-)
+if map_source == "Vector tiles":
+    st.caption("Tract shading shows {} violations per 1,000 residents; points appear from zoom 12.".format(selected_category))
+
+    # tract features carry GEOID and per-category counts, point features
+    # their category, status and inspection category; the sidebar selection
+    # is applied on the client
+    selected_count = " + ".join(
+        "(properties[{}] || 0)".format(json.dumps(category)) for category in selected_categories
+    )
+    outside_months = "false"
+    if month_range:
+        month = "(properties.violation_date || '').slice(0, 7)"
+        outside_months = f"({month} < {json.dumps(month_range[0])} || {month} > {json.dumps(month_range[1])})"
+    layer = pdk.Layer(
+        "MVTLayer",
+        data=tile_url,
+        min_zoom=8,
+        max_zoom=14,
+        binary=False,
+        point_type="circle",
+        get_point_radius=50,
+        point_radius_min_pixels=2,
+        get_fill_color=f"""
+        properties.GEOID !== undefined
+            ? [70, 130, 180, Math.min(160, 8 * ({selected_count}) / properties.population * 1000)]
+            : !{json.dumps(selected_categories)}.includes(properties.violation_category)
+                || !{json.dumps(selected_statuses)}.includes(properties.violation_status)
+                || !{json.dumps(selected_inspections)}.includes(properties.inspection_category)
+                || {outside_months}
+                ? [0, 0, 0, 0]
+                : properties.violation_status === 'OPEN'
+                    ? [255, 0, 0, 180]
+                    : properties.violation_status === 'COMPLIED'
+                        ? [0, 200, 0, 180]
+                        : [150, 150, 150, 140]
+    """,
+        get_line_color=[80, 80, 80, 120],
+        line_width_min_pixels=1,
+        pickable=True,
+    )
+    tooltip_html = "<b>Category:</b> {violation_category}<br/><b>Date:</b> {violation_date}<br/><b>Status:</b> {violation_status}"
+elif map_zoom >= map_layers.POINT_ZOOM:
+    bounds = map_layers.viewport(center_lon, center_lat, map_zoom)
+    points, truncated = map_layers.points_in_view(map_data, bounds)
+    if truncated:
+        st.caption(
+            "Showing the first {:,} violations in view; zoom in further to see all of them."
+            .format(map_layers.MAX_POINTS)
+        )
+
+    layer = pdk.Layer(
+        "ScatterplotLayer",
+        data=dashboard_data.for_display(points),
+        get_position='[LONGITUDE, LATITUDE]',
+        get_radius=50,   
+        get_fill_color="""
+        violation_status === 'OPEN'
+            ? [255, 0, 0, 180]
+            : violation_status === 'COMPLIED'
+                ? [0, 200, 0, 180]
+                : [150, 150, 150, 140]
+    """,
+        pickable=True,
+    )
+    tooltip_html = "<b>Category:</b> {violation_category}<br/><b>Date:</b> {violation_date}<br/><b>Description:</b> {violation_description}"
+else:
+    bins = map_layers.grid_bins(map_data, map_zoom, center_lat)
+    st.caption("Violations grouped into grid cells; zoom to {} or more to see individual violations.".format(map_layers.POINT_ZOOM))
+
+    # colour mixes red (OPEN), green (COMPLIED) and grey (other) by share
+    layer = pdk.Layer(
+        "ScatterplotLayer",
+        data=bins,
+        get_position='[lon, lat]',
+        get_radius="radius",
+        get_fill_color="""[
+            255 * open_share + 150 * (1 - open_share - complied_share),
+            200 * complied_share + 150 * (1 - open_share - complied_share),
+            150 * (1 - open_share - complied_share),
+            180
+        ]""",
+        pickable=True,
+    )
+    tooltip_html = "<b>Violations:</b> {count}<br/><b>OPEN:</b> {open}<br/><b>COMPLIED:</b> {complied}<br/><b>Other:</b> {other}"
 
 view_state = pdk.ViewState(
-    latitude=41.8781,
-    longitude=-87.6298,
-      zoom=10,
+    latitude=center_lat,
+    longitude=center_lon,
+      zoom=map_zoom,
 )
 
 deck = pdk.Deck(
     layers=[layer],
     initial_view_state=view_state,
     tooltip={
-    "html": "<b>Category:</b> {violation_category}<br/><b>Date:</b> {violation_date}<br/><b>Description:</b> {violation_description}",
+    "html": tooltip_html,
     "style": {"backgroundColor": "steelblue", "color": "white"},
     },   
 )
 
 st.pydeck_chart(deck)
+
+# Time to first render (title shown) and to the full page, logged once per
+# server process, i.e. for the cold start, so it can be tracked across deploys
+log = render_log()
+if not log["reported"]:
+    log["reported"] = True
+    print(
+        "[render] cold start: first render {:.2f}s, full page {:.2f}s"
+        .format(first_render, time.perf_counter() - run_started),
+        flush=True
+    )
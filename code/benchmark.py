@@ -0,0 +1,447 @@
+# Pipeline benchmarks on deterministic synthetic data.
+#
+# The raw exports are not shipped with the repo, so generate() writes a
+# stand-in for them at any size: building violation and ordinance hearing
+# CSVs with the city's column names and formats, plus a tract shapefile and an
+# ACS income table in the layout of data/raw-data. Everything is drawn from
+# seeded generators (one per chunk of rows, so 10M rows are written in bounded
+# memory), so the same rows and seed always give byte-identical files.
+#
+# The data is realistic where the pipeline's cost depends on it:
+#   - every address has one fixed location, and about a fifth as many
+#     addresses as violations exist, so keys repeat like in the feed;
+#   - descriptions come from a repetitive vocabulary that hits every
+#     category rule, some in messy case and whitespace;
+#   - ordinance hearings reuse violation keys (several hearings per key) with
+#     the ordinance feed's code-prefixed descriptions;
+#   - a grid of ~900 Chicago tracts plus tracts elsewhere that the join
+#     prunes, with some zero populations and incomes;
+#   - some rows have no coordinates, date, or description.
+#
+# run() times the preprocessing.py / plots.py stages on that data: typed
+# ingest, reprojection, the tract join, classification, the ordinance dedup
+# and merge (and the pandas merge it replaced), the tract-month aggregation and the income quintile summaries,
+# and reports the memory of the dashboard's compact frame next to the same
+# rows as object strings.
+# Each size runs in a fresh process, so its peak memory is its own, and the
+# results are written as JSON (with the commit and library versions) to
+# data/benchmark/results, so runs can be compared over time (--baseline).
+
+import argparse
+import datetime
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import dashboard_data
+import dashboard_sessions
+import derived_data
+import ingest
+
+BENCHMARK_DIR = derived_data.DERIVED_DIR.parent / "benchmark"
+RESULTS_DIR = BENCHMARK_DIR / "results"
+SIZES = [100_000, 1_000_000, 10_000_000]
+CHUNK_ROWS = 1_000_000
+GENERATOR_VERSION = 1
+
+CHICAGO_BOUNDS = (-87.94, 41.64, -87.52, 42.02)
+TRACT_GRID = 30
+OUTSIDE_TRACTS = 100
+FIRST_DAY = pd.Timestamp("2024-01-01")
+DAYS = 821
+
+STREETS = ["MADISON", "HALSTED", "ASHLAND", "WESTERN", "KEDZIE", "PULASKI", "CICERO", "DAMEN",
+           "CERMAK", "ROOSEVELT", "DIVISION", "FULLERTON", "BELMONT", "IRVING PARK", "LAWRENCE", "DEVON"]
+STREET_TYPES = ["ST", "AVE", "BLVD", "RD"]
+DIRECTIONS = ["N", "S", "E", "W"]
+STATUSES = (["OPEN", "COMPLIED", "NO ENTRY"], [0.45, 0.45, 0.10])
+INSPECTION_CATEGORIES = (["COMPLAINT", "PERIODIC", "PERMIT", "REGISTRATION"], [0.55, 0.25, 0.15, 0.05])
+DISPOSITIONS = ["Liable", "Not Liable", "Default", "Continuance", "Non-Suit"]
+# at least one description per category rule, and some that match none
+SAMPLE_DESCRIPTIONS = [
+    "ARRANGE PREMISE INSPECTION", "REPAIR PORCH SYSTEM", "SMOKE AND CARBON MONOXIDE DETECTORS",
+    "REPAIR OR REPLACE DEFECTIVE WINDOWS", "REPAIR EXTERIOR WALL", "POST OWNER/MANAGER NAME",
+    "MAINTAIN OR REPAIR ELECTRICAL SYSTEM", "RODENT INFESTATION - RATS", "PROVIDE ADEQUATE HEAT",
+    "REPAIR PLUMBING FIXTURES", "REGISTER BUILDING", "STOP WORK WITHOUT PERMIT",
+    "DEFECTIVE EXIT SIGN OR EGRESS LIGHTING", "REPAIR ROOF", "INSTALL HANDRAIL",
+    "ELIMINATE ROACHES", "REPAIR FLOOR", "OBTAIN CERTIFICATE OF OCCUPANCY",
+]
+COMMENTS = [
+    "OBSERVED AT TIME OF INSPECTION.", "REPAIR ALL AFFECTED AREAS.", "REAR PORCH, 2ND FLOOR.",
+    "BASEMENT AND COMMON AREAS.", "UNIT 1, KITCHEN AND BATH.", "ENTIRE PREMISES.", "",
+]
+
+
+def raw_paths(directory):
+    # the data/raw-data layout preprocessing.py reads
+    raw = Path(directory) / "raw-data"
+    return {
+        "violations": raw / "Building_Violations_2024-2026.csv",
+        "ordinance": raw / "Ordinance_Violations_(Buildings)_2024-2026.csv",
+        "tracts": raw / "shapefiles" / "US_tract_2024.shp",
+        "income": raw / "income_tract.csv",
+    }
+
+
+def data_dir(rows, seed=0):
+    return BENCHMARK_DIR / f"rows-{rows}-seed-{seed}"
+
+
+def descriptions():
+    # every sample description plus numbered variants of some of them, so
+    # there are a few thousand distinct values as in the feed
+    texts = SAMPLE_DESCRIPTIONS + [
+        f"{text} - UNIT {i}" for i in range(1, 200) for text in SAMPLE_DESCRIPTIONS[::3]
+    ]
+    codes = [f"CN{190000 + i}" for i in range(len(texts))]
+    return np.array(texts, dtype=object), np.array(codes, dtype=object)
+
+
+def addresses(rows, seed):
+    # one fixed location per address, inside the Chicago tract grid
+    count = max(rows // 5, 1)
+    rng = np.random.default_rng([seed, 0])
+    index = np.arange(count)
+    street = pd.Series(np.array(STREETS, dtype=object)[index % len(STREETS)])
+    text = (
+        pd.Series(100 + 2 * (index // len(STREETS))).astype(str)
+        + " " + pd.Series(np.array(DIRECTIONS, dtype=object)[rng.integers(0, len(DIRECTIONS), count)])
+        + " " + street
+        + " " + pd.Series(np.array(STREET_TYPES, dtype=object)[index % len(STREET_TYPES)])
+    )
+    minx, miny, maxx, maxy = CHICAGO_BOUNDS
+    return pd.DataFrame({
+        "ADDRESS": text.to_numpy(dtype=object),
+        "LONGITUDE": np.round(minx + rng.random(count) * (maxx - minx), 6),
+        "LATITUDE": np.round(miny + rng.random(count) * (maxy - miny), 6),
+    })
+
+
+def date_strings(days):
+    # MM/DD/YYYY for day offsets from FIRST_DAY (None for missing, -1)
+    strings = (FIRST_DAY + pd.to_timedelta(np.arange(DAYS + 120), unit="D")).strftime("%m/%d/%Y")
+    values = strings.to_numpy(dtype=object)[np.maximum(days, 0)]
+    values[days < 0] = None
+    return values
+
+
+def violation_chunk(rng, first_id, rows, address_table, texts, codes):
+    address = rng.integers(0, len(address_table), rows)
+    text = rng.integers(0, len(texts), rows)
+    day = rng.integers(0, DAYS, rows)
+    day[rng.random(rows) < 0.002] = -1
+
+    description = texts[text].copy()
+    messy = rng.random(rows) < 0.05
+    description[messy] = [value.lower() + " " for value in description[messy]]
+    description[rng.random(rows) < 0.005] = None
+
+    longitude = address_table["LONGITUDE"].to_numpy()[address]
+    latitude = address_table["LATITUDE"].to_numpy()[address]
+    no_location = rng.random(rows) < 0.002
+    longitude[no_location] = np.nan
+    latitude[no_location] = np.nan
+
+    violations = pd.DataFrame({
+        "ID": (first_id + np.arange(rows)).astype(str),
+        "VIOLATION LAST MODIFIED DATE": date_strings(np.where(day < 0, -1, day + rng.integers(0, 90, rows))),
+        "VIOLATION DATE": date_strings(day),
+        "VIOLATION CODE": codes[text],
+        "VIOLATION STATUS": rng.choice(STATUSES[0], rows, p=STATUSES[1]),
+        "VIOLATION DESCRIPTION": description,
+        "VIOLATION INSPECTOR COMMENTS": np.array(COMMENTS, dtype=object)[rng.integers(0, len(COMMENTS), rows)],
+        "INSPECTION CATEGORY": rng.choice(INSPECTION_CATEGORIES[0], rows, p=INSPECTION_CATEGORIES[1]),
+        "ADDRESS": address_table["ADDRESS"].to_numpy()[address],
+        "LATITUDE": latitude,
+        "LONGITUDE": longitude,
+    })
+    return violations, address, text, day
+
+
+def ordinance_chunk(rng, first_id, address_table, texts, codes, address, text, day):
+    # hearings on a third as many violation keys, several per key
+    hearings = max(len(address) // 3, 1)
+    source = rng.integers(0, len(address), hearings)
+    hearing_day = np.where(day[source] < 0, rng.integers(0, DAYS, hearings), day[source]) + rng.integers(14, 120, hearings)
+    return pd.DataFrame({
+        "ID": [f"O{i}" for i in range(first_id, first_id + hearings)],
+        "ADDRESS": address_table["ADDRESS"].to_numpy()[address[source]],
+        "VIOLATION DATE": date_strings(day[source]),
+        "VIOLATION CODE": codes[text[source]],
+        "VIOLATION DESCRIPTION": codes[text[source]] + " " + texts[text[source]] + ".",
+        "HEARING DATE": date_strings(hearing_day),
+        "CASE DISPOSITION": rng.choice(DISPOSITIONS, hearings),
+        "IMPOSED FINE": rng.integers(0, 50, hearings) * 100,
+        "RESPONDENTS": "PROPERTY OWNER",
+        "LATITUDE": address_table["LATITUDE"].to_numpy()[address[source]],
+        "LONGITUDE": address_table["LONGITUDE"].to_numpy()[address[source]],
+    })
+
+
+def write_tracts(paths, seed):
+    # a TRACT_GRID x TRACT_GRID grid over Chicago plus tracts in another
+    # state, in the projected CRS of the national shapefile
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    minx, miny, maxx, maxy = CHICAGO_BOUNDS
+    xs = np.linspace(minx, maxx, TRACT_GRID + 1)
+    ys = np.linspace(miny, maxy, TRACT_GRID + 1)
+    polygons = [box(xs[i], ys[j], xs[i + 1], ys[j + 1]) for i in range(TRACT_GRID) for j in range(TRACT_GRID)]
+    geoids = [f"17031{i:06d}" for i in range(len(polygons))]
+    polygons += [box(-120 + 0.2 * i, 35, -119.85 + 0.2 * i, 35.15) for i in range(OUTSIDE_TRACTS)]
+    geoids += [f"06019{i:06d}" for i in range(OUTSIDE_TRACTS)]
+    gisjoin = [f"G{g[:2]}0{g[2:5]}0{g[5:]}" for g in geoids]
+
+    paths["tracts"].parent.mkdir(parents=True, exist_ok=True)
+    gpd.GeoDataFrame(
+        {"GISJOIN": gisjoin, "GEOID": geoids, "STATEFP": [g[:2] for g in geoids], "COUNTYFP": [g[2:5] for g in geoids]},
+        geometry=polygons,
+        crs="EPSG:4269"
+    ).to_crs(ingest.PROJECTED_CRS).to_file(paths["tracts"])
+
+    rng = np.random.default_rng([seed, 1])
+    population = rng.integers(200, 8000, len(geoids))
+    population[rng.random(len(geoids)) < 0.02] = 0
+    income = np.round(rng.lognormal(np.log(35_000), 0.6, len(geoids))).astype(np.int64)
+    income[rng.random(len(geoids)) < 0.02] = 0
+    pd.DataFrame({"GISJOIN": gisjoin, "AUO6E001": population, "AUSYE001": income}).to_csv(paths["income"], index=False)
+
+
+def generate(rows, directory=None, seed=0):
+    # writes the synthetic raw data for `rows` violations (skipped when the
+    # same rows / seed / generator were already written there)
+    directory = Path(directory or data_dir(rows, seed))
+    paths = raw_paths(directory)
+    stamp = directory / "generator.json"
+    spec = {"rows": rows, "seed": seed, "version": GENERATOR_VERSION}
+    if stamp.exists() and json.loads(stamp.read_text()) == spec:
+        return paths
+
+    write_tracts(paths, seed)
+    address_table = addresses(rows, seed)
+    texts, codes = descriptions()
+    ordinance_rows = 0
+    for chunk, first in enumerate(range(0, rows, CHUNK_ROWS)):
+        rng = np.random.default_rng([seed, 2, chunk])
+        violations, address, text, day = violation_chunk(
+            rng, first, min(CHUNK_ROWS, rows - first), address_table, texts, codes
+        )
+        ordinance = ordinance_chunk(rng, ordinance_rows, address_table, texts, codes, address, text, day)
+        ordinance_rows += len(ordinance)
+        violations.to_csv(paths["violations"], mode="w" if chunk == 0 else "a", header=chunk == 0, index=False)
+        ordinance.to_csv(paths["ordinance"], mode="w" if chunk == 0 else "a", header=chunk == 0, index=False)
+
+    stamp.write_text(json.dumps(spec))
+    return paths
+
+
+# the sort + drop_duplicates + string-key merge ordinance_join.merge_ordinance
+# replaced, timed next to it; tests/test_ordinance_join.py checks both agree
+def merge_ordinance_pandas(violations_merged_gdf, ordinance_merged_gdf):
+    violations_merged_gdf = violations_merged_gdf.copy()
+    ordinance_merged_gdf = ordinance_merged_gdf.copy()
+
+    for df in [violations_merged_gdf, ordinance_merged_gdf]:
+        df["ADDRESS"] = df["ADDRESS"].str.strip().str.upper()
+        df["VIOLATION DESCRIPTION"] = df["VIOLATION DESCRIPTION"].str.strip().str.upper()
+
+    ordinance_merged_gdf["HEARING DATE"] = pd.to_datetime(ordinance_merged_gdf["HEARING DATE"])
+
+
+    violations_merged_gdf["VIOLATION DATE"] = pd.to_datetime(
+        violations_merged_gdf["VIOLATION DATE"],
+        errors="coerce"
+    )
+
+    ordinance_merged_gdf["VIOLATION DATE"] = pd.to_datetime(
+        ordinance_merged_gdf["VIOLATION DATE"],
+        errors="coerce"
+    )
+
+    violations_merged_gdf["VIOLATION DATE"] = violations_merged_gdf["VIOLATION DATE"].dt.date
+    ordinance_merged_gdf["VIOLATION DATE"] = ordinance_merged_gdf["VIOLATION DATE"].dt.date
+
+    ordinance_dedup = (
+        ordinance_merged_gdf
+        .sort_values("HEARING DATE")
+        .drop_duplicates(
+            subset=["ADDRESS", "VIOLATION DATE", "VIOLATION DESCRIPTION"],
+            keep="last"
+        )
+    )
+
+    ordinance_dedup["VIOLATION DESCRIPTION"] = (
+        ordinance_dedup["VIOLATION DESCRIPTION"]
+            .str.replace(r"^\S+\s+", "", regex=True)
+            .str.replace(r"\.$", "", regex=True)
+            .str.strip()
+            .str.upper()
+    )
+
+    violations_ordinance_merged = violations_merged_gdf.merge(
+        ordinance_dedup[
+            ["ADDRESS",
+             "VIOLATION DATE",
+             "VIOLATION DESCRIPTION",
+             "CASE DISPOSITION",
+             "IMPOSED FINE"]
+        ],
+        on=["ADDRESS", "VIOLATION DATE", "VIOLATION DESCRIPTION"],
+        how="left",
+        validate="m:1"
+    )
+    return violations_ordinance_merged
+
+
+def frame_mb(df):
+    return round(int(df.memory_usage(deep=True).sum()) / 2 ** 20, 2)
+
+
+def plain_dashboard_frame(source):
+    # the dashboard rows as the frame the compact one replaced held them:
+    # object strings and string dates
+    plain = source.rename(columns=dashboard_data.RENAMES)
+    plain["violation_date"] = pd.to_datetime(plain["violation_date"], errors="coerce").dt.strftime("%Y-%m-%d")
+    return plain.astype({col: object for col in dashboard_data.CATEGORICAL_COLUMNS + ["GEOID"]})
+
+
+def measure(rows, seed=0, jobs=None):
+    # times every stage on the synthetic data for `rows`, in pipeline order
+    import geopandas as gpd
+
+    import plots
+    import preprocessing
+
+    paths = generate(rows, seed=seed)
+    seconds = {}
+
+    def timed(name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        seconds[name] = round(time.perf_counter() - start, 3)
+        return result
+
+    def read(path, columns):
+        return ingest.concat_chunks(list(ingest.read_csv_chunks(path, columns)))
+
+    def load_tracts():
+        tracts = gpd.read_file(paths["tracts"])
+        acs = tracts.merge(pd.read_csv(paths["income"]), on="GISJOIN", how="inner")
+        acs = acs.rename(columns={"AUO6E001": "population", "AUSYE001": "per_cap_inc"})
+        return acs[["population", "per_cap_inc", "geometry", "GEOID"]]
+
+    violations = timed("ingest_violations", read, paths["violations"], ingest.VIOLATION_COLUMNS)
+    ordinance = timed("ingest_ordinance", read, paths["ordinance"], ingest.ORDINANCE_COLUMNS)
+    violations = timed("reproject_violations", ingest.to_projected_points, violations)
+    ordinance = timed("reproject_ordinance", ingest.to_projected_points, ordinance)
+    acs_subset = timed("load_tracts", load_tracts)
+    violations = timed("join_violations", preprocessing.join_acs, violations, acs_subset, jobs)
+    ordinance = timed("join_ordinance", preprocessing.join_acs, ordinance, acs_subset, jobs)
+    violations = timed("classify", preprocessing.classify_violations, violations)
+    merged = timed("merge_ordinance", preprocessing.merge_ordinance, violations, ordinance)
+    timed("merge_ordinance_pandas", merge_ordinance_pandas, violations, ordinance)
+    tract_month = timed("tract_month", preprocessing.aggregate_tract_month, violations)
+
+    dashboard_source = derived_data.apply_filters(violations[dashboard_data.SOURCE_COLUMNS], dashboard_data.FILTERS)
+    compact_frame = timed("dashboard_compact", dashboard_data.compact, dashboard_source)
+
+    summary_input = violations[["GEOID", "INSPECTION CATEGORY", "violation_category", "population", "per_cap_inc"]]
+    timed("quintile_categories", plots.income_bar_chart, summary_input)
+    timed("quintile_heatmap", plots.income_heatmap, summary_input)
+
+    return {
+        "rows": rows,
+        "ordinance_rows": len(ordinance),
+        "matched_hearings": int(merged["CASE DISPOSITION"].notna().sum()),
+        "tract_months": len(tract_month),
+        "dashboard_mb": frame_mb(compact_frame),
+        "dashboard_plain_mb": frame_mb(plain_dashboard_frame(dashboard_source)),
+        "seconds": seconds,
+        "total_seconds": round(sum(seconds.values()), 3),
+        "peak_rss_mb": round(dashboard_sessions.peak_rss_mb(), 1),
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    import geopandas as gpd
+    import pyarrow as pa
+    import shapely
+
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "versions": {
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "geopandas": gpd.__version__,
+            "shapely": shapely.__version__,
+            "pyarrow": pa.__version__,
+        },
+    }
+
+
+def run(sizes, seed=0, jobs=None):
+    results = []
+    for rows in sizes:
+        command = [sys.executable, __file__, "--measure", str(rows), "--seed", str(seed)]
+        if jobs:
+            command += ["--jobs", str(jobs)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+        print(results[-1])
+    return {**environment(), "seed": seed, "jobs": jobs, "runs": results}
+
+
+def compare(results, baseline):
+    # stage time ratios (this run / baseline) for the sizes both runs cover
+    previous = {run["rows"]: run["seconds"] for run in baseline["runs"]}
+    return {
+        run["rows"]: {
+            stage: round(seconds / previous[run["rows"]][stage], 2)
+            for stage, seconds in run["seconds"].items()
+            if previous[run["rows"]].get(stage)
+        }
+        for run in results["runs"]
+        if run["rows"] in previous
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data")
+    parser.add_argument("--rows", type=int, nargs="+", default=SIZES, help="violation rows per run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, help="worker processes for the spatial joins (default: all cores)")
+    parser.add_argument("--output", type=Path, help="results file (default: a new file in data/benchmark/results)")
+    parser.add_argument("--baseline", type=Path, help="earlier results file to compare the stage times with")
+    parser.add_argument("--generate-only", action="store_true", help="only write the synthetic data")
+    parser.add_argument("--measure", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.seed, args.jobs)))
+    elif args.generate_only:
+        for rows in args.rows:
+            print(generate(rows, seed=args.seed))
+    else:
+        results = run(args.rows, args.seed, args.jobs)
+        output = args.output or RESULTS_DIR / f"benchmark-{results['created'].replace(':', '')}.json"
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(results, indent=2))
+        print(f"[benchmark] {output}")
+        if args.baseline:
+            print(compare(results, json.loads(args.baseline.read_text())))
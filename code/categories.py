@@ -0,0 +1,96 @@
+# Violation description -> violation_category classifier.
+#
+# The rules are applied in order and the first category with a matching
+# keyword wins, exactly like the np.select version they replace. Descriptions
+# repeat heavily, so each distinct description is classified once and the
+# result is broadcast back to the rows through an integer code array.
+
+import re
+
+import numpy as np
+import pandas as pd
+
+CATEGORY_RULES = [
+    ("Fire & Life Safety",
+     ["FIRE", "SMOKE", "CARB", "EGRESS", "EXIT", "PANIC", "SPRINKLER", "CORRIDOR"]),
+
+    ("Electrical",
+     ["WIRING", "OUTLET", "BREAKER", "CONDUIT", "CIRCUIT", "GROUND", "ELECTR", "FEEDER"]),
+
+    ("Plumbing & Water",
+     ["PLUMB", "WATER", "SEWER", "DRAIN", "PIPE", "TRAP", "WASTE", "FLUSH", "BACKWATER", "FAUCET"]),
+
+    ("Heating / HVAC / Boilers",
+     ["HEAT", "BOILER", "FURNACE", "VENT", "BREECHING", "RELIEF VALVE", "HWH"]),
+
+    ("Structural / Building Envelope",
+     ["ROOF", "FOUNDATION", "WALL", "CHIMNEY", "PORCH", "BALCONY", "PARAPET", "LINTEL", "STRUCTURAL"]),
+
+    ("Sanitation / Pests / Waste",
+     ["RAT", "ROACH", "MICE", "INSECT", "UNSANITARY", "GARBAGE", "DEBRIS", "NUISANCE", "PIGEON"]),
+
+    ("Windows / Doors / Interior",
+     ["WINDOW", "DOOR", "FLOOR", "PAINT", "SILL", "SCREEN", "LOCK", "GLASS", "CEILING"]),
+
+    ("Permits / Administrative",
+     ["PERMIT", "PLANS", "REGISTER", "CERTIFICATE", "LICENSE", "POST", "APPROVAL", "REGISTRATION",
+      "CONTRACTOR", "C OF O"]),
+]
+
+DEFAULT_CATEGORY = "Other / Misc"
+
+
+class ViolationClassifier:
+
+    def __init__(self, rules=CATEGORY_RULES, default=DEFAULT_CATEGORY):
+        labels = [label for label, _ in rules] + [default]
+        self.default_code = len(rules)
+
+        # categories are kept in sorted order (as an object column would group
+        # and pivot); this maps rule priority -> position in that order
+        self.categories = sorted(labels)
+        self._priority_to_category = np.array(
+            [self.categories.index(label) for label in labels], dtype=np.int8
+        )
+
+        # one capture group per category inside a zero-width lookahead, so a
+        # single finditer visits every position and reports which category
+        # (lowest group index first) matches there
+        groups = "|".join(f"({'|'.join(keywords)})" for _, keywords in rules)
+        self._pattern = re.compile(f"(?=(?:{groups}))")
+
+    def classify_one(self, text):
+        best = self.default_code
+        for match in self._pattern.finditer(text):
+            code = match.lastindex - 1
+            if code < best:
+                best = code
+                if best == 0:
+                    break
+        return best
+
+    def codes(self, descriptions):
+        # factorize -> classify the uniques -> gather back to rows
+        row_codes, uniques = pd.factorize(descriptions)
+        unique_codes = np.fromiter(
+            (self.classify_one(str(text).upper()) for text in uniques),
+            dtype=np.int8,
+            count=len(uniques)
+        )
+        # missing descriptions are factorized to -1, which lands on the default
+        lookup = self._priority_to_category[np.append(unique_codes, np.int8(self.default_code))]
+        return lookup[row_codes]
+
+    def classify(self, descriptions):
+        return pd.Series(
+            pd.Categorical.from_codes(self.codes(descriptions), categories=self.categories),
+            index=descriptions.index,
+            name="violation_category"
+        )
+
+
+default_classifier = ViolationClassifier()
+
+
+def classify(descriptions):
+    return default_classifier.classify(descriptions)
@@ -0,0 +1,89 @@
+# Chart data computed on the server for the Altair charts in app.py and
+# plots.py.
+#
+# Vega-Lite transforms (transform_regression, aggregates) run in the browser
+# over every row embedded in the spec. Instead, the charts are handed only
+# the rows they draw: the columns the encodings use, aggregates computed with
+# pandas / NumPy, and regression lines as their two end points.
+#
+# How the rows reach the renderer:
+#   - st.altair_chart already sends chart data to the browser as Arrow
+#     datasets next to the spec, without Altair's 5,000-row limit;
+#   - specs written to .html / .json by save() inline up to
+#     MAX_INLINE_ROWS rows and write larger datasets to JSON files under
+#     CHART_DATA_DIR (named by content hash, so unchanged data is written
+#     once), referenced from the spec by URL;
+#   - images (.png / .svg / .pdf) are rendered on this machine by
+#     vl-convert, which does not read local files, so chart.save inlines
+#     their data (it lifts the row limit for that).
+
+import hashlib
+import json
+from pathlib import Path
+
+import altair as alt
+import numpy as np
+import pandas as pd
+
+import derived_data
+
+MAX_INLINE_ROWS = 5_000
+CHART_DATA_DIR = derived_data.DERIVED_DIR / "chart-data"
+IMAGE_FORMATS = {".png", ".svg", ".pdf"}
+
+
+def columns(df, *names):
+    # just the columns a chart encodes, with float32 widened so the values
+    # serialize exactly
+    df = df[list(dict.fromkeys(names))]
+    widen = {col: np.float64 for col in df.columns if df[col].dtype == np.float32}
+    return df.astype(widen) if widen else df
+
+
+def regression_line(df, x, y):
+    # the two end points of the least-squares line of y on x over the range
+    # of x, which is what transform_regression(x, y) draws (rows missing
+    # either value are skipped, as there)
+    xs = df[x].to_numpy(dtype=np.float64)
+    ys = df[y].to_numpy(dtype=np.float64)
+    present = np.isfinite(xs) & np.isfinite(ys)
+    xs, ys = xs[present], ys[present]
+    if len(xs) < 2 or xs.min() == xs.max():
+        return pd.DataFrame({x: np.array([], dtype=np.float64), y: np.array([], dtype=np.float64)})
+
+    slope, intercept = np.polyfit(xs, ys, 1)
+    ends = np.array([xs.min(), xs.max()])
+    return pd.DataFrame({x: ends, y: intercept + slope * ends})
+
+
+def external(data, directory=CHART_DATA_DIR, urlpath=None, max_inline_rows=MAX_INLINE_ROWS):
+    # Altair data transformer: small datasets inline, large ones as files
+    values = alt.to_values(data)
+    if len(values.get("values", [])) <= max_inline_rows:
+        return values
+
+    text = json.dumps(values["values"], separators=(",", ":"))
+    name = f"data-{hashlib.sha256(text.encode()).hexdigest()[:16]}.json"
+    directory.mkdir(parents=True, exist_ok=True)
+    if not (directory / name).exists():
+        (directory / name).write_text(text)
+    url = f"{urlpath}/{name}" if urlpath else str(directory / name)
+    return {"url": url, "format": {"type": "json"}}
+
+
+alt.data_transformers.register("external", external)
+
+
+def save(chart, path, **kwargs):
+    # chart.save with the data placement described above; the file format
+    # follows the suffix of `path`. (chart.save itself always inlines every
+    # row, so specs are written through to_html / to_json instead.)
+    path = Path(path)
+    if path.suffix in IMAGE_FORMATS:
+        chart.save(path, **kwargs)
+        return
+
+    # the data files are referenced relative to the saved spec
+    directory = path.parent / CHART_DATA_DIR.name
+    with alt.data_transformers.enable("external", directory=directory, urlpath=CHART_DATA_DIR.name):
+        path.write_text(chart.to_html(**kwargs) if path.suffix == ".html" else chart.to_json(**kwargs))
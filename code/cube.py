@@ -0,0 +1,69 @@
+# Pre-aggregated violation counts for the dashboard charts.
+#
+# The cube holds one row per GEOID x violation_category x INSPECTION CATEGORY
+# x year_month with the number of violations in it, and the tract dimension
+# holds the per-tract attributes (population, income, citywide income
+# quintile). Every chart in app.py is a group-by over a slice of the cube, so
+# its cost depends on the number of tracts, not the number of violations.
+
+import pandas as pd
+
+CUBE_KEYS = ["GEOID", "violation_category", "INSPECTION CATEGORY", "year_month"]
+
+QUINTILE_LABELS = ["Q1 (Lowest)", "Q2", "Q3", "Q4", "Q5 (Highest)"]
+
+
+def build_cube(violations):
+    # missing GEOID / INSPECTION CATEGORY are kept as their own cells so totals
+    # still match len(violations); slicing with a normal groupby drops them
+    return (
+        violations
+        .groupby(CUBE_KEYS, dropna=False, observed=True)
+        .size()
+        .astype("int32")
+        .reset_index(name="count")
+    )
+
+
+def build_tract_dimension(cube, acs_subset):
+    tracts = (
+        acs_subset[["GEOID", "population", "per_cap_inc"]]
+        .drop_duplicates("GEOID")
+    )
+    dimension = tracts[tracts["GEOID"].isin(cube["GEOID"])].reset_index(drop=True)
+    dimension["income_quintile"] = pd.qcut(dimension["per_cap_inc"], 5, labels=QUINTILE_LABELS)
+    return dimension
+
+
+def replace_months(cube, month_cube, months):
+    # incremental update: the listed months are recomputed wholesale
+    kept = cube[~cube["year_month"].isin(months)]
+    return (
+        pd.concat([kept, month_cube], ignore_index=True)
+        .sort_values(CUBE_KEYS)
+        .reset_index(drop=True)
+    )
+
+
+def tract_summary(cube, dimension, categories):
+    # the dashboard's category_counts and tract_level tables for the given
+    # violation categories, straight from the cube
+    cube_slice = cube[cube["violation_category"].isin(categories)]
+
+    category_counts = (
+        cube_slice
+        .groupby(["GEOID", "INSPECTION CATEGORY"], observed=True)["count"]
+        .sum()
+        .reset_index(name="category_count")
+    )
+
+    tract_level = (
+        cube_slice
+        .groupby("GEOID")["count"]
+        .sum()
+        .reset_index(name="violations")
+        .merge(dimension[["GEOID", "per_cap_inc", "population"]], on="GEOID", how="left")
+        [["GEOID", "per_cap_inc", "population", "violations"]]
+    )
+
+    return category_counts, tract_level, int(cube_slice["count"].sum())
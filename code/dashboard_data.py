@@ -0,0 +1,338 @@
+# Compact in-memory model of the violations shown by the dashboard.
+#
+# The dashboard only filters, counts and plots the violations, so the frame it
+# keeps per server process holds no geometry, and every column is stored in
+# the narrowest type that still serves those operations:
+#   - low-cardinality text (category, status, inspection category,
+#     description) as pandas categoricals;
+#   - GEOID as an int64 tract code (MISSING_GEOID when the point is in no
+#     tract);
+#   - dates as int32 days since 1970-01-01 (MISSING_DAY when unknown);
+#   - coordinates as float32 (~1 m at Chicago's latitude).
+# Values are turned back into display strings only for the handful of rows
+# that reach a tooltip or a widget.
+#
+# DashboardData wraps that frame once per server process (app.py keeps it in
+# st.cache_resource, so every session and rerun sees the same object). Its
+# rows are sorted by category, which makes every category a contiguous row
+# range: selecting one is an iloc slice, a view under pandas copy-on-write,
+# instead of a boolean-mask copy of the rows.
+#
+# For any other selection, DashboardData also holds one packed bitmask per
+# value of the category, status and inspection category columns. Several
+# values of one column are combined with bitwise OR, the columns with bitwise
+# AND, so resolving a selection costs a few operations on len(frame) / 8
+# bytes instead of a string comparison per row and value.
+#
+# Preprocessing writes the sorted frame as an uncompressed Arrow IPC file
+# (dashboard_violations.arrow), which load() memory-maps: a new dashboard
+# process then skips parsing, renaming, date conversion and sorting, and the
+# operating system pages the data in and shares it between processes.
+#
+# Within a category the rows are sorted by date, and the row offset at which
+# every month starts is stored per category, so a month range of a category
+# is again one contiguous slice, found without scanning any dates.
+#
+# The partitioned build never holds the whole violations table, so it writes
+# the snapshot with write_snapshot_months: one month at a time is compacted
+# and split by category into scratch Arrow streams, which are then copied
+# into the snapshot in category order, with the categoricals re-coded against
+# the dictionaries of all months.
+
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import derived_data
+
+# columns the dashboard reads from the violations dataset
+SOURCE_COLUMNS = [
+    "VIOLATION DATE",
+    "VIOLATION DESCRIPTION",
+    "VIOLATION STATUS",
+    "INSPECTION CATEGORY",
+    "violation_category",
+    "GEOID",
+    "LONGITUDE",
+    "LATITUDE",
+]
+RENAMES = {
+    "VIOLATION DATE": "violation_date",
+    "VIOLATION DESCRIPTION": "violation_description",
+    "VIOLATION STATUS": "violation_status",
+}
+HIDDEN_CATEGORIES = ["Permits / Administrative", "Other / Misc"]
+FILTERS = [("violation_category", "not in", HIDDEN_CATEGORIES)]
+
+# columns with a bitmask per value
+MASK_COLUMNS = ["violation_category", "violation_status", "INSPECTION CATEGORY"]
+
+CATEGORICAL_COLUMNS = [
+    "violation_category",
+    "violation_status",
+    "INSPECTION CATEGORY",
+    "violation_description",
+]
+COORDINATE_COLUMNS = ["LONGITUDE", "LATITUDE"]
+
+GEOID_WIDTH = 11
+MISSING_GEOID = -1
+MISSING_DAY = np.iinfo(np.int32).min
+
+
+def geoid_codes(values):
+    codes = pd.to_numeric(pd.Series(values), errors="coerce")
+    return codes.fillna(MISSING_GEOID).to_numpy(dtype=np.int64)
+
+
+def geoid_strings(codes):
+    # tract codes back to zero-padded GEOIDs (None for MISSING_GEOID)
+    codes = np.asarray(codes, dtype=np.int64)
+    strings = np.char.zfill(codes.astype(str), GEOID_WIDTH).astype(object)
+    strings[codes == MISSING_GEOID] = None
+    return strings
+
+
+def day_numbers(values):
+    dates = pd.to_datetime(pd.Series(values), errors="coerce").to_numpy(dtype="datetime64[D]")
+    days = dates.astype(np.int64)
+    days[np.isnat(dates)] = MISSING_DAY
+    return days.astype(np.int32)
+
+
+def day_strings(days):
+    # day numbers back to "YYYY-MM-DD" (None for MISSING_DAY)
+    days = np.asarray(days, dtype=np.int32)
+    strings = np.datetime_as_string(days.astype("datetime64[D]")).astype(object)
+    strings[days == MISSING_DAY] = None
+    return strings
+
+
+def compact(df):
+    # renamed dashboard columns in their compact types
+    df = df.rename(columns=RENAMES)
+    compacted = pd.DataFrame({
+        **{col: df[col].astype("category").cat.remove_unused_categories() for col in CATEGORICAL_COLUMNS},
+        "GEOID": geoid_codes(df["GEOID"]),
+        "violation_date": day_numbers(df["violation_date"]),
+        **{col: df[col].to_numpy(dtype=np.float32) for col in COORDINATE_COLUMNS},
+    })
+    return compacted.reset_index(drop=True)
+
+
+def for_display(df):
+    # the given (few) rows with GEOIDs and dates as strings and plain
+    # float64 coordinates, ready to be serialized into a map layer
+    df = df.copy()
+    if "GEOID" in df:
+        df["GEOID"] = geoid_strings(df["GEOID"])
+    if "violation_date" in df:
+        df["violation_date"] = day_strings(df["violation_date"])
+    for col in COORDINATE_COLUMNS:
+        if col in df:
+            df[col] = df[col].astype(np.float64)
+    return df
+
+
+def sort_key(frame):
+    # one int64 per row ordering by category code, then day number
+    codes = frame["violation_category"].cat.codes.to_numpy().astype(np.int64)
+    days = frame["violation_date"].to_numpy().astype(np.int64)
+    return (codes + 1) << 32 | (days - MISSING_DAY)
+
+
+def sort_rows(frame):
+    # category then date order; a frame already in that order (a snapshot)
+    # is returned as it is after one linear check
+    key = sort_key(frame)
+    if (key[1:] >= key[:-1]).all():
+        return frame.reset_index(drop=True)
+    return frame.take(np.argsort(key, kind="stable")).reset_index(drop=True)
+
+
+class DashboardData:
+    # shared by every session: treat as read-only; views taken from it are
+    # copied by pandas only if someone writes to them
+
+    def __init__(self, frame):
+        self.frame = sort_rows(frame)
+
+        # rows without a category sort first and belong to none
+        self.category_slices = {
+            category: rows for category, rows in category_slices(self.frame).items() if category is not None
+        }
+
+        # month index: months[i] starts at row month_bounds[category][i] of
+        # the category and ends where month i + 1 starts; rows with no date
+        # sort before the first month and fall in no month range
+        days = self.frame["violation_date"].to_numpy()
+        months = np.unique(days[days != MISSING_DAY].astype("datetime64[D]").astype("datetime64[M]"))
+        self.months = [str(month) for month in months]
+        month_starts = np.append(months, months[-1:] + 1).astype("datetime64[D]").astype(np.int64)
+        self.month_bounds = {
+            category: rows.start + np.searchsorted(days[rows], month_starts)
+            for category, rows in self.category_slices.items()
+        }
+
+        self.masks = {
+            col: {
+                value: np.packbits(self.frame[col].cat.codes.to_numpy() == i)
+                for i, value in enumerate(self.frame[col].cat.categories)
+            }
+            for col in MASK_COLUMNS
+        }
+
+    @property
+    def categories(self):
+        return sorted(self.category_slices)
+
+    def values(self, column):
+        return sorted(self.masks[column])
+
+    def mask(self, column, values):
+        # packed rows holding any of `values` in `column`
+        mask = np.zeros((len(self.frame) + 7) // 8, dtype=np.uint8)
+        for value in values:
+            mask |= self.masks[column].get(value, 0)
+        return mask
+
+    def selection_mask(self, selection):
+        # packed rows matching every {column: values} of `selection`
+        mask = np.full((len(self.frame) + 7) // 8, 0xFF, dtype=np.uint8)
+        for column, values in selection.items():
+            mask &= self.mask(column, values)
+        return mask
+
+    def rows(self, selection):
+        # sorted row positions matching `selection`
+        return np.flatnonzero(np.unpackbits(self.selection_mask(selection), count=len(self.frame)))
+
+    def month_slice(self, category, first, last):
+        # the category's rows dated from month `first` through `last`
+        # ("YYYY-MM"), as a slice of the frame
+        bounds = self.month_bounds[category]
+        return slice(int(bounds[self.months.index(first)]), int(bounds[self.months.index(last) + 1]))
+
+    def select(self, categories=None, statuses=None, inspection_categories=None, months=None):
+        # the rows matching the given values (None = any value) and, when
+        # `months` is a (first, last) pair, dated within that month range. A
+        # single category is served as a view, several through the bitmasks
+        # (or the month offsets), status and inspection category through the
+        # bitmasks
+        selection = {
+            column: values
+            for column, values in zip(MASK_COLUMNS, [categories, statuses, inspection_categories])
+            if values is not None
+        }
+        if months is not None:
+            return self.select_months(selection, months)
+        if not selection:
+            return self.frame
+        single = list(selection) == ["violation_category"] and len(categories) == 1
+        if single and categories[0] in self.category_slices:
+            return self.category(categories[0])
+        return self.frame.take(self.rows(selection))
+
+    def select_months(self, selection, months):
+        categories = selection.pop("violation_category", self.category_slices)
+        ranges = sorted(
+            (self.month_slice(category, *months) for category in categories if category in self.category_slices),
+            key=lambda rows: rows.start
+        )
+        if len(ranges) == 1 and not selection:
+            return self.frame.iloc[ranges[0]]
+
+        rows = np.concatenate([np.arange(r.start, r.stop) for r in ranges] or [np.array([], dtype=np.int64)])
+        if selection:
+            matches = np.unpackbits(self.selection_mask(selection), count=len(self.frame)).view(bool)
+            rows = rows[matches[rows]]
+        return self.frame.take(rows)
+
+    def category(self, category):
+        # the category's rows, as a view
+        return self.frame.iloc[self.category_slices[category]]
+
+
+def snapshot_path():
+    return derived_data.DERIVED_DIR / f"{derived_data.DASHBOARD}.arrow"
+
+
+def write_snapshot(violations, path=None):
+    # the dashboard frame for a violations table with the derived-data
+    # column names, as an uncompressed (memory-mappable) Arrow IPC file
+    frame = sort_rows(compact(derived_data.apply_filters(violations[SOURCE_COLUMNS], FILTERS)))
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    with pa.OSFile(str(path or snapshot_path()), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def category_slices(frame):
+    # contiguous row ranges of a sorted frame per category, uncategorized
+    # rows (code -1) first under None
+    categories = frame["violation_category"].cat.categories
+    bounds = np.searchsorted(frame["violation_category"].cat.codes.to_numpy(), np.arange(-1, len(categories) + 1))
+    names = [None, *categories]
+    return {names[i]: slice(int(bounds[i]), int(bounds[i + 1])) for i in range(len(names)) if bounds[i + 1] > bounds[i]}
+
+
+def write_snapshot_months(months, scratch, path=None):
+    # the snapshot of violations tables yielded one month at a time, in date
+    # order with the undated rows first, so every category comes out in date
+    # order; `scratch` holds the per-category streams until they are copied
+    shutil.rmtree(scratch, ignore_errors=True)
+    scratch.mkdir(parents=True)
+    streams = {}
+    values = {col: set() for col in CATEGORICAL_COLUMNS}
+    try:
+        for violations in months:
+            frame = sort_rows(compact(derived_data.apply_filters(violations[SOURCE_COLUMNS], FILTERS)))
+            for col in CATEGORICAL_COLUMNS:
+                values[col].update(frame[col].cat.categories)
+            # plain strings in the scratch streams: each month has its own
+            # dictionaries, an Arrow file allows only one per column
+            plain = frame.astype({col: object for col in CATEGORICAL_COLUMNS})
+            schema = pa.schema([
+                (col, pa.string()) if col in CATEGORICAL_COLUMNS else (col, pa.from_numpy_dtype(dtype))
+                for col, dtype in plain.dtypes.items()
+            ])
+            for category, rows in category_slices(frame).items():
+                if category not in streams:
+                    stream_path = scratch / f"{len(streams)}.arrow"
+                    sink = pa.OSFile(str(stream_path), "wb")
+                    streams[category] = (stream_path, sink, pa.ipc.new_stream(sink, schema))
+                streams[category][2].write_table(pa.Table.from_pandas(plain.iloc[rows], schema=schema, preserve_index=False))
+    finally:
+        for _, sink, writer in streams.values():
+            writer.close()
+            sink.close()
+
+    dtypes = {col: pd.CategoricalDtype(sorted(values[col])) for col in CATEGORICAL_COLUMNS}
+    empty = pd.DataFrame({col: pd.Series([], dtype=object) for col in SOURCE_COLUMNS})
+    schema = pa.Schema.from_pandas(compact(empty).astype(dtypes), preserve_index=False)
+    with pa.OSFile(str(path or snapshot_path()), "wb") as sink:
+        with pa.ipc.new_file(sink, schema) as writer:
+            # uncategorized rows first, then the categories in code order
+            for category in [None, *dtypes["violation_category"].categories]:
+                if category not in streams:
+                    continue
+                for batch in pa.ipc.open_stream(pa.memory_map(str(streams[category][0]))):
+                    part = batch.to_pandas().astype(dtypes)
+                    writer.write_table(pa.Table.from_pandas(part, schema=schema, preserve_index=False))
+    shutil.rmtree(scratch)
+
+
+def read_snapshot(path=None):
+    # numeric columns stay backed by the mapped file; categoricals get their
+    # codes copied out of the dictionary arrays
+    table = pa.ipc.open_file(pa.memory_map(str(path or snapshot_path()))).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def load():
+    # the snapshot when preprocessing wrote one, else built from the dataset
+    if snapshot_path().exists():
+        return read_snapshot()
+    return compact(derived_data.read_violations(columns=SOURCE_COLUMNS, filters=FILTERS))
@@ -0,0 +1,95 @@
+# Memory and rerun latency of app.py with many simultaneous sessions.
+#
+# Each session is a Streamlit AppTest of app.py running inside one process,
+# the way a Streamlit server hosts its sessions, so they share
+# st.cache_resource / st.cache_data like real sessions do. For every session
+# count, a fresh process opens that many sessions (first render) and keeps
+# them all alive, then has each of them switch category (rerun), and reports
+# its peak resident memory and the render latencies. AppTest runs are not
+# thread-safe, so the sessions render one at a time; under the GIL a server's
+# concurrent reruns of this CPU-bound script are largely serialized too. A
+# fresh process per count keeps the peak memory of one count from leaking
+# into the next.
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+APP = Path(__file__).resolve().parent / "app.py"
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def summary(seconds):
+    seconds = sorted(seconds)
+    return {
+        "mean_ms": round(1000 * sum(seconds) / len(seconds), 1),
+        "max_ms": round(1000 * seconds[-1], 1),
+    }
+
+
+def measure(sessions):
+    from streamlit.testing.v1 import AppTest
+
+    apps = [AppTest.from_file(str(APP), default_timeout=600) for _ in range(sessions)]
+    first = [timed(app.run) for app in apps]
+
+    # every session picks the next category and reruns
+    reruns = []
+    for i, app in enumerate(apps):
+        categories = app.sidebar.multiselect[0]
+        categories.set_value([categories.options[(i + 1) % len(categories.options)]])
+        reruns.append(timed(app.run))
+
+    errors = [error.message for app in apps for error in app.exception]
+    if errors:
+        raise RuntimeError(errors[0])
+    return {
+        "sessions": sessions,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "first_render": summary(first),
+        "rerun": summary(reruns),
+    }
+
+
+def run(session_counts):
+    results = []
+    for sessions in session_counts:
+        output = subprocess.run(
+            [sys.executable, __file__, "--measure", str(sessions)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+        print(results[-1])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure app.py memory and rerun latency with simultaneous sessions")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--output", type=Path, help="also write the results to this JSON file")
+    parser.add_argument("--measure", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure)))
+    else:
+        results = run(args.sessions)
+        if args.output:
+            args.output.write_text(json.dumps(results, indent=2))
@@ -0,0 +1,139 @@
+# Readers (and the parquet writer) for the derived datasets written by
+# preprocessing.py.
+#
+# Preprocessing writes columnar GeoParquet next to every GeoPackage / CSV, so
+# callers can ask for just the columns (and, through `filters`, just the row
+# groups) they need. When only the GeoPackage / CSV exists the same request is
+# served from it instead.
+
+import shutil
+from pathlib import Path
+
+import pandas as pd
+
+DERIVED_DIR = Path(__file__).resolve().parents[1] / "data" / "derived-data"
+
+VIOLATIONS = "Building_Violations_w_ACS"
+ORDINANCE = "Ordinance_Violations_w_ACS"
+TRACT_MONTH = "tract_month_level_violations"
+CUBE = "violation_cube"
+TRACT_DIMENSION = "tract_dimension"
+TILES = "violation_tiles"
+TRACT_GEOMETRY = "tract_geometry"
+DASHBOARD = "dashboard_violations"
+
+PARQUET_ROW_GROUP = 100_000
+PARQUET_PART_ROWS = 1_000_000
+
+_OPERATORS = {
+    "==": lambda col, value: col == value,
+    "!=": lambda col, value: col != value,
+    ">": lambda col, value: col > value,
+    ">=": lambda col, value: col >= value,
+    "<": lambda col, value: col < value,
+    "<=": lambda col, value: col <= value,
+    "in": lambda col, value: col.isin(value),
+    "not in": lambda col, value: ~col.isin(value),
+}
+
+
+def write_parquet(df, path, sort_by=None):
+    # sorting first lets readers that filter on `sort_by` skip whole row groups
+    if sort_by:
+        df = df.sort_values(sort_by, kind="stable")
+    df.to_parquet(path, index=False, row_group_size=PARQUET_ROW_GROUP)
+
+
+def write_parquet_parts(df, path, sort_by=None):
+    # the point datasets: a directory of parquet parts of PARQUET_PART_ROWS
+    # rows, read as one table, so incremental runs can add a part for each
+    # delta and rewrite only the parts whose rows it replaces
+    if sort_by:
+        df = df.sort_values(sort_by, kind="stable")
+    remove(path)
+    path.mkdir(parents=True)
+    for i, start in enumerate(range(0, max(len(df), 1), PARQUET_PART_ROWS)):
+        write_parquet(df.iloc[start:start + PARQUET_PART_ROWS], path / f"part-{i:05d}.parquet")
+
+
+def remove(path):
+    # a parquet file or dataset directory, if there is one
+    if path.is_dir():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def apply_filters(df, filters):
+    # the pyarrow [(column, op, value), ...] conjunction, for non-parquet sources
+    for column, op, value in filters or []:
+        df = df[_OPERATORS[op](df[column], value)]
+    return df
+
+
+def month_partitioning():
+    # year_month read from the directory names as plain strings, as the full
+    # build stores it; the default dictionary column cannot hold the missing
+    # month of the undated rows
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    return ds.partitioning(pa.schema([("year_month", pa.string())]), flavor="hive")
+
+
+def read_points(name, columns=None, filters=None, geometry=False):
+    # the parquet parts (a single file from older builds), or the
+    # year_month=... directories written by the partitioned (out-of-core)
+    # build; geopandas is only imported when geometry or the GeoPackage is
+    # needed, so the dashboard never loads it
+    parquet = DERIVED_DIR / f"{name}.parquet"
+    options = {}
+    if not parquet.exists() and (DERIVED_DIR / name).is_dir():
+        parquet = DERIVED_DIR / name
+        options["partitioning"] = month_partitioning()
+    if parquet.exists():
+        if geometry:
+            import geopandas as gpd
+            columns = None if columns is None else [*columns, "geometry"]
+            return gpd.read_parquet(parquet, columns=columns, filters=filters, **options)
+        return pd.read_parquet(parquet, columns=columns, filters=filters, **options)
+
+    import geopandas as gpd
+    df = gpd.read_file(DERIVED_DIR / f"{name}.gpkg", columns=columns, ignore_geometry=not geometry)
+    return apply_filters(df, filters)
+
+
+def read_violations(columns=None, filters=None, geometry=False):
+    return read_points(VIOLATIONS, columns, filters, geometry)
+
+
+def read_ordinance(columns=None, filters=None, geometry=False):
+    return read_points(ORDINANCE, columns, filters, geometry)
+
+
+def read_tract_month(columns=None, filters=None):
+    parquet = DERIVED_DIR / f"{TRACT_MONTH}.parquet"
+    if parquet.exists():
+        return pd.read_parquet(parquet, columns=columns, filters=filters)
+
+    df = pd.read_csv(DERIVED_DIR / f"{TRACT_MONTH}.csv", usecols=columns, dtype={"GEOID": str})
+    return apply_filters(df, filters)
+
+
+def read_cube(columns=None, filters=None):
+    return pd.read_parquet(DERIVED_DIR / f"{CUBE}.parquet", columns=columns, filters=filters)
+
+
+def read_tract_dimension(columns=None):
+    return pd.read_parquet(DERIVED_DIR / f"{TRACT_DIMENSION}.parquet", columns=columns)
+
+
+def read_tract_geometry(columns=None):
+    import geopandas as gpd
+    return gpd.read_parquet(DERIVED_DIR / f"{TRACT_GEOMETRY}.parquet", columns=columns)
+
+
+def read_tract_month_geo(columns=None, filters=None):
+    # the tract-month rows (optionally filtered) with their tract polygon,
+    # joined on read instead of stored once per month
+    tract_month = read_tract_month(columns=None if columns is None else ["GEOID", *columns], filters=filters)
+    return read_tract_geometry().merge(tract_month, on="GEOID", how="inner")
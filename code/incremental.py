@@ -0,0 +1,170 @@
+# Watermark bookkeeping for incremental (delta) preprocessing runs.
+#
+# The watermark records the latest timestamp already processed for a feed
+# (VIOLATION LAST MODIFIED DATE for building violations, HEARING DATE for the
+# ordinance feed, which has no last-modified column) plus the IDs stamped
+# exactly at that timestamp, so rows that arrive later for the same day are
+# still picked up. A timestamp alone misses rows: hearings added for old
+# violations, and rows with no stamp at all. So every row whose ID is not in
+# the derived points yet counts as new too, whatever its stamp.
+
+import json
+import sqlite3
+
+import geopandas as gpd
+import pandas as pd
+import pyarrow.parquet as pq
+
+import aggregation
+import derived_data
+import ingest
+
+WATERMARK_COLUMNS = ["VIOLATION LAST MODIFIED DATE", "HEARING DATE", "VIOLATION DATE"]
+
+
+def read_watermark(path):
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_watermark(path, watermark):
+    with open(path, "w") as f:
+        json.dump(watermark, f, indent=2)
+
+
+def compute_mark(df):
+    column = next(col for col in WATERMARK_COLUMNS if col in df.columns)
+    latest = df[column].max()
+    if pd.isna(latest):
+        return None
+    ids = df.loc[df[column] == latest, "ID"].astype(str).tolist()
+    return {"column": column, "value": latest.isoformat(), "ids": ids}
+
+
+def is_new(df, mark, seen=None):
+    # rows past the watermark, unseen IDs stamped exactly at it, and any row
+    # whose ID is not in `seen` (the IDs already processed, when known)
+    if mark is None:
+        return pd.Series(True, index=df.index)
+    ids = df["ID"].astype(str)
+    value = pd.Timestamp(mark["value"])
+    stamp = df[mark["column"]]
+    new = (stamp > value) | ((stamp == value) & ~ids.isin(mark["ids"]))
+    if seen is not None:
+        new |= ~ids.isin(seen)
+    return new
+
+
+def seen_ids(gpkg_path):
+    # the IDs of every row already in a derived GeoPackage layer (None when
+    # there is no layer yet)
+    if not gpkg_path.exists():
+        return None
+    con = sqlite3.connect(gpkg_path)
+    with con:
+        ids = [row[0] for row in con.execute(f'SELECT CAST("ID" AS TEXT) FROM "{gpkg_path.stem}"')]
+    con.close()
+    return pd.Index(ids)
+
+
+def read_new_rows(path, columns, mark, chunksize=100_000, seen=None):
+    # streams the raw CSV and keeps only the delta, so memory follows the
+    # size of the delta (plus the seen IDs) rather than the size of the export
+    kept = [chunk[is_new(chunk, mark, seen)] for chunk in ingest.read_csv_chunks(path, columns, chunksize)]
+    return ingest.concat_chunks(kept)
+
+
+def advance_mark(mark, new_rows):
+    # the later of the stored mark and the new rows' mark: rows with unseen
+    # IDs can be stamped before the stored mark, which must not move back
+    new_mark = compute_mark(new_rows) if not new_rows.empty else None
+    if new_mark is None or mark is None:
+        return new_mark or mark
+    stored, latest = pd.Timestamp(mark["value"]), pd.Timestamp(new_mark["value"])
+    if latest < stored:
+        return mark
+    if latest == stored:
+        new_mark["ids"] = list(dict.fromkeys(mark["ids"] + new_mark["ids"]))
+    return new_mark
+
+
+def delete_ids(gpkg_path, ids, key_columns=()):
+    # drops rows that changed upstream so the refreshed versions can be
+    # appended; returns the deleted rows' key columns
+    layer = gpkg_path.stem
+    keys = pd.DataFrame(columns=list(key_columns))
+
+    con = sqlite3.connect(gpkg_path)
+    with con:
+        con.execute("CREATE TEMP TABLE delta_ids (id TEXT PRIMARY KEY)")
+        con.executemany(
+            "INSERT OR IGNORE INTO delta_ids VALUES (?)",
+            ((str(i),) for i in ids)
+        )
+        where = 'CAST("ID" AS TEXT) IN (SELECT id FROM delta_ids)'
+        if key_columns:
+            select = ", ".join(f'"{col}"' for col in key_columns)
+            keys = pd.read_sql_query(f'SELECT {select} FROM "{layer}" WHERE {where}', con)
+        con.execute(f'DELETE FROM "{layer}" WHERE {where}')
+    con.close()
+
+    return keys
+
+
+def append_rows(gpkg_path, gdf, key_columns=()):
+    # replace-or-append `gdf` into an existing GeoPackage layer, keyed by ID
+    old_keys = delete_ids(gpkg_path, gdf["ID"], key_columns)
+    gdf.to_file(gpkg_path, driver="GPKG", mode="a")
+    return old_keys
+
+
+def replace_rows_parquet(parquet_path, gdf, sort_by=None):
+    # drop the replaced IDs from the parts that hold them and add the delta
+    # as a new part; only the ID column of the untouched parts is read, so
+    # the cost follows the delta rather than the whole history
+    if parquet_path.is_file():
+        # a single-file dataset from an older build becomes the first part
+        single = parquet_path.with_name(f"{parquet_path.name}.tmp")
+        parquet_path.rename(single)
+        parquet_path.mkdir()
+        single.rename(parquet_path / "part-00000.parquet")
+    parts = sorted(parquet_path.glob("part-*.parquet"))
+    if not parts:
+        raise FileNotFoundError(f"{parquet_path} is missing; run a full rebuild")
+
+    ids = pd.Index(gdf["ID"].astype(str))
+    columns = pq.read_schema(parts[0]).names
+    for part in parts:
+        replaced = pd.read_parquet(part, columns=["ID"])["ID"].astype(str).isin(ids).to_numpy()
+        if not replaced.any():
+            continue
+        kept = gpd.read_parquet(part)[~replaced]
+        if len(kept):
+            derived_data.write_parquet(kept, part.with_suffix(".tmp"))
+            part.with_suffix(".tmp").replace(part)
+        else:
+            part.unlink()
+
+    number = int(parts[-1].stem.split("-")[1]) + 1
+    derived_data.write_parquet(
+        gdf.reset_index(drop=True)[columns], parquet_path / f"part-{number:05d}.parquet", sort_by
+    )
+
+
+def update_tract_month(csv_path, recomputed, affected, key=("GEOID", "year_month")):
+    # swap the affected (GEOID, year_month) rows of the tract-month table for
+    # their recomputed versions and leave every other row untouched
+    key = list(key)
+    existing = pd.read_csv(csv_path, dtype={"GEOID": str})
+
+    hit = existing[key].merge(affected.assign(_hit=True), on=key, how="left")["_hit"]
+    fresh = recomputed.merge(affected, on=key, how="inner")
+
+    # a category seen on only one side is filled in and its rates recomputed
+    # as a full build computes them, in full-build column order
+    updated = aggregation.align_categories(pd.concat([existing[hit.isna().values], fresh], ignore_index=True))
+    updated = updated.sort_values(key).reset_index(drop=True)
+    updated.to_csv(csv_path, index=False)
+    return updated
@@ -0,0 +1,114 @@
+# Typed, column-pruned streaming readers for the raw violation CSVs.
+#
+# The city exports carry ~25 columns of free text we never use, and a plain
+# pd.read_csv infers every one of them as object. These helpers read only the
+# columns the pipeline touches, with explicit dtypes, and build + reproject the
+# points one chunk at a time. Parsing never holds more than one chunk of raw
+# text, but stream_projected still returns the whole feed as one (compact)
+# GeoDataFrame: memory follows the typed size of the feed, not the chunk size.
+# preprocessing.py --partitioned is the mode whose memory the chunk bounds.
+
+from functools import lru_cache
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from pyproj import Transformer
+
+PROJECTED_CRS = "ESRI:102003"
+# projected coordinates, persisted next to LONGITUDE / LATITUDE
+PROJECTED_COLUMNS = ["PROJECTED_X", "PROJECTED_Y"]
+
+# columns used by preprocessing.py, app.py and plots.py -> dtype
+VIOLATION_COLUMNS = {
+    "ID": str,
+    "VIOLATION LAST MODIFIED DATE": str,
+    "VIOLATION DATE": str,
+    "VIOLATION DESCRIPTION": str,
+    "VIOLATION STATUS": "category",
+    "INSPECTION CATEGORY": "category",
+    "ADDRESS": str,
+    "LATITUDE": "float32",
+    "LONGITUDE": "float32",
+}
+
+ORDINANCE_COLUMNS = {
+    "ID": str,
+    "ADDRESS": str,
+    "VIOLATION DATE": str,
+    "VIOLATION DESCRIPTION": str,
+    "HEARING DATE": str,
+    "CASE DISPOSITION": "category",
+    "IMPOSED FINE": "float32",
+    "LATITUDE": "float32",
+    "LONGITUDE": "float32",
+}
+
+DATE_COLUMNS = ["VIOLATION LAST MODIFIED DATE", "VIOLATION DATE", "HEARING DATE"]
+
+
+def read_csv_chunks(path, columns, chunksize=100_000):
+    # yields typed DataFrame chunks holding only the requested columns
+    reader = pd.read_csv(
+        path,
+        usecols=lambda col: col in columns,
+        dtype=columns,
+        chunksize=chunksize,
+    )
+    for chunk in reader:
+        for col in DATE_COLUMNS:
+            if col in chunk.columns:
+                chunk[col] = pd.to_datetime(chunk[col], errors="coerce")
+        yield chunk
+
+
+@lru_cache(maxsize=None)
+def transformer(crs, source="EPSG:4326"):
+    # building a Transformer costs more than transforming a chunk, so keep one
+    # per CRS pair and process
+    return Transformer.from_crs(source, crs, always_xy=True)
+
+
+def to_projected_points(df, crs=PROJECTED_CRS):
+    # one vectorized lon/lat -> `crs` transform; the result is kept both as
+    # the geometry and as plain float columns, so readers that only need
+    # coordinates in either CRS never decode geometry or reproject
+    x, y = transformer(crs).transform(
+        df["LONGITUDE"].to_numpy(dtype=np.float64),
+        df["LATITUDE"].to_numpy(dtype=np.float64)
+    )
+    return gpd.GeoDataFrame(
+        df.assign(**dict(zip(PROJECTED_COLUMNS, [x, y]))),
+        geometry=gpd.points_from_xy(x, y),
+        crs=crs
+    )
+
+
+def concat_chunks(chunks):
+    # every chunk infers its own categories, so union them instead of letting
+    # pd.concat fall back to object dtype
+    combined = pd.concat(chunks, ignore_index=True)
+    for col in chunks[0].columns:
+        if isinstance(chunks[0][col].dtype, pd.CategoricalDtype):
+            combined[col] = union_categoricals(
+                [chunk[col] for chunk in chunks], ignore_order=True
+            )
+    return combined
+
+
+def stream_projected(path, columns, output=None, chunksize=100_000, crs=PROJECTED_CRS):
+    # read -> points -> to_crs one chunk at a time, appending each chunk to
+    # `output` as it goes; returns the compact, typed GeoDataFrame of the
+    # whole feed
+    chunks = []
+    for i, chunk in enumerate(read_csv_chunks(path, columns, chunksize)):
+        projected = to_projected_points(chunk, crs)
+        if output is not None:
+            projected.to_file(output, mode="w" if i == 0 else "a")
+        chunks.append(projected)
+
+    if not chunks:
+        raise ValueError(f"No rows read from {path}")
+
+    return gpd.GeoDataFrame(concat_chunks(chunks), geometry="geometry", crs=crs)
@@ -0,0 +1,95 @@
+# Server-side level of detail for the dashboard map.
+#
+# Streamlit's pydeck chart does not report its viewport back to the script,
+# so the zoom level and map centre come from sidebar controls. Below
+# POINT_ZOOM the filtered violations are binned on the server into square
+# grid cells sized to the zoom level (counts plus OPEN / COMPLIED / other
+# breakdown); from POINT_ZOOM in, the individual points inside the viewport
+# are sent, capped at MAX_POINTS. Either way the payload is bounded by the
+# screen, not by the number of matching violations.
+
+import numpy as np
+import pandas as pd
+
+POINT_ZOOM = 14
+MAX_POINTS = 20_000
+
+# pixel size of a grid cell and of the assumed map viewport
+CELL_PIXELS = 32
+VIEW_WIDTH = 1400
+VIEW_HEIGHT = 500
+
+METERS_PER_DEGREE = 111_320
+POINT_COLUMNS = [
+    "LONGITUDE",
+    "LATITUDE",
+    "violation_status",
+    "violation_category",
+    "violation_date",
+    "violation_description",
+]
+
+
+def meters_per_pixel(zoom, latitude):
+    # web-mercator ground resolution
+    return 156_543.03 * np.cos(np.radians(latitude)) / 2 ** zoom
+
+
+def viewport(center_lon, center_lat, zoom, width=VIEW_WIDTH, height=VIEW_HEIGHT):
+    degrees_per_pixel = 360 / (256 * 2 ** zoom)
+    half_width = width / 2 * degrees_per_pixel
+    half_height = height / 2 * degrees_per_pixel * np.cos(np.radians(center_lat))
+    return (
+        center_lon - half_width,
+        center_lat - half_height,
+        center_lon + half_width,
+        center_lat + half_height,
+    )
+
+
+def points_in_view(df, bounds, limit=MAX_POINTS):
+    # the rows (only the columns the layer and tooltip use) inside `bounds`
+    minlon, minlat, maxlon, maxlat = bounds
+    inside = (
+        df["LONGITUDE"].between(minlon, maxlon) &
+        df["LATITUDE"].between(minlat, maxlat)
+    ).to_numpy()
+    points = df.loc[inside, POINT_COLUMNS]
+    truncated = len(points) > limit
+    return points.iloc[:limit], truncated
+
+
+def grid_bins(df, zoom, center_lat):
+    # count violations per grid cell, with OPEN / COMPLIED / other breakdown
+    cell_m = CELL_PIXELS * meters_per_pixel(zoom, center_lat)
+    cell_lat = cell_m / METERS_PER_DEGREE
+    cell_lon = cell_m / (METERS_PER_DEGREE * np.cos(np.radians(center_lat)))
+
+    lon = df["LONGITUDE"].to_numpy(dtype=np.float64)
+    lat = df["LATITUDE"].to_numpy(dtype=np.float64)
+    present = ~(np.isnan(lon) | np.isnan(lat))
+    lon, lat = lon[present], lat[present]
+    status = df["violation_status"].to_numpy()[present]
+
+    ix = np.floor(lon / cell_lon).astype(np.int64)
+    iy = np.floor(lat / cell_lat).astype(np.int64)
+    cells, cell_codes = np.unique(np.column_stack([ix, iy]), axis=0, return_inverse=True)
+    cell_codes = cell_codes.ravel()
+
+    count = np.bincount(cell_codes, minlength=len(cells))
+    open_count = np.bincount(cell_codes, weights=status == "OPEN", minlength=len(cells))
+    complied = np.bincount(cell_codes, weights=status == "COMPLIED", minlength=len(cells))
+
+    bins = pd.DataFrame({
+        "lon": (cells[:, 0] + 0.5) * cell_lon,
+        "lat": (cells[:, 1] + 0.5) * cell_lat,
+        "count": count,
+        "open": open_count.astype(np.int64),
+        "complied": complied.astype(np.int64),
+    })
+    bins["other"] = bins["count"] - bins["open"] - bins["complied"]
+    bins["open_share"] = bins["open"] / bins["count"]
+    bins["complied_share"] = bins["complied"] / bins["count"]
+    # circle area proportional to count, largest circle fills its cell
+    bins["radius"] = cell_m / 2 * np.sqrt(bins["count"] / bins["count"].max())
+    return bins
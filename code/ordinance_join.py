@@ -0,0 +1,144 @@
+# Building violation <-> ordinance hearing join.
+#
+# The pandas version sorts the whole ordinance frame by HEARING DATE to
+# drop_duplicates(keep="last") on three string columns, then merges on the
+# same free-text columns again. Here every key column is normalized on its
+# distinct values only and factorized once into integer codes shared by both
+# tables; the three codes are combined into one integer key per row. The
+# latest hearing per key is a group-wise argmax over the hearing dates, and
+# the merge is an integer index lookup.
+#
+# Semantics follow the pandas version (benchmark.merge_ordinance_pandas,
+# timed against this one and checked in tests/test_ordinance_join.py):
+# missing keys match each other, a missing HEARING DATE sorts after every
+# date (so it wins, as with sort_values), and a key that is still duplicated
+# after the description is cleaned raises MergeError like validate="m:1".
+# Ties on HEARING DATE go to the last row in file order, as with a stable
+# sort; the pandas version's default (unstable) sort picks any of the tied
+# rows.
+
+import numpy as np
+import pandas as pd
+
+KEY_COLUMNS = ["ADDRESS", "VIOLATION DATE", "VIOLATION DESCRIPTION"]
+ORDINANCE_COLUMNS = ["CASE DISPOSITION", "IMPOSED FINE"]
+
+
+def normalize_text(values):
+    return values.str.strip().str.upper()
+
+
+def clean_description(values):
+    # ordinance descriptions carry a code prefix and a trailing period
+    return (
+        values
+        .str.replace(r"^\S+\s+", "", regex=True)
+        .str.replace(r"\.$", "", regex=True)
+        .str.strip()
+        .str.upper()
+    )
+
+
+def distinct(series, transform):
+    # transform the distinct values of `series` only; returns the row codes
+    # into the transformed uniques
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    return codes, transform(pd.Series(uniques))
+
+
+def shared_codes(left, right):
+    # integer codes for the values of two arrays, equal values sharing a code
+    # across both (missing values get a code of their own)
+    codes, _ = pd.factorize(np.concatenate([left, right]), use_na_sentinel=False)
+    return codes[:len(left)], codes[len(left):]
+
+
+def combine(*codes):
+    # one dense integer per distinct combination of the code columns
+    key = codes[0]
+    for column in codes[1:]:
+        key, _ = pd.factorize(key * (int(column.max(initial=0)) + 1) + column)
+    return key
+
+
+def text_key(violation_values, ordinance_values, clean=None):
+    # shared codes for a text key column, plus the normalized row values
+    violation_codes, violation_uniques = distinct(violation_values, normalize_text)
+    ordinance_codes, ordinance_uniques = distinct(ordinance_values, normalize_text)
+    right_uniques = ordinance_uniques if clean is None else clean(ordinance_uniques)
+    left, right = shared_codes(violation_uniques.to_numpy(dtype=object), right_uniques.to_numpy(dtype=object))
+    return (
+        left[violation_codes],
+        right[ordinance_codes],
+        violation_uniques.take(violation_codes).array,
+    )
+
+
+def date_key(violation_values, ordinance_values):
+    violation_codes, violation_dates = distinct(violation_values, lambda v: pd.to_datetime(v, errors="coerce"))
+    ordinance_codes, ordinance_dates = distinct(ordinance_values, lambda v: pd.to_datetime(v, errors="coerce"))
+    left, right = shared_codes(
+        violation_dates.dt.normalize().to_numpy(),
+        ordinance_dates.dt.normalize().to_numpy()
+    )
+    return (
+        left[violation_codes],
+        right[ordinance_codes],
+        violation_dates.dt.date.to_numpy()[violation_codes],
+    )
+
+
+def latest_per_key(key, hearing):
+    # row position of the latest hearing for every key, without sorting:
+    # a group-wise max of the dates, then the last row that attains it
+    hearing = pd.to_datetime(hearing).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    hearing = np.where(hearing == np.iinfo(np.int64).min, np.iinfo(np.int64).max, hearing)
+
+    n_keys = int(key.max(initial=-1)) + 1
+    latest = np.full(n_keys, np.iinfo(np.int64).min)
+    np.maximum.at(latest, key, hearing)
+
+    candidates = np.flatnonzero(hearing == latest[key])
+    winner = np.full(n_keys, -1)
+    np.maximum.at(winner, key[candidates], candidates)
+    return winner
+
+
+def merge_ordinance(violations, ordinance):
+    violations = violations.copy()
+
+    address_left, address_right, violations_address = text_key(violations["ADDRESS"], ordinance["ADDRESS"])
+    date_left, date_right, violations_date = date_key(violations["VIOLATION DATE"], ordinance["VIOLATION DATE"])
+    description_left, description_right, violations_description = text_key(
+        violations["VIOLATION DESCRIPTION"], ordinance["VIOLATION DESCRIPTION"], clean=clean_description
+    )
+    # the dedup key uses the description before the prefix is cleaned off
+    raw_codes, normalized = distinct(ordinance["VIOLATION DESCRIPTION"], normalize_text)
+    normalized_codes, _ = pd.factorize(normalized, use_na_sentinel=False)
+    description_dedup = normalized_codes[raw_codes]
+
+    latest = latest_per_key(
+        combine(address_right, date_right, description_dedup),
+        ordinance["HEARING DATE"]
+    )
+
+    n_violations = len(violations)
+    merge_key = combine(
+        np.concatenate([address_left, address_right[latest]]),
+        np.concatenate([date_left, date_right[latest]]),
+        np.concatenate([description_left, description_right[latest]]),
+    )
+    violation_key, ordinance_key = merge_key[:n_violations], merge_key[n_violations:]
+
+    ordinance_index = pd.Index(ordinance_key)
+    if not ordinance_index.is_unique:
+        raise pd.errors.MergeError("Merge keys are not unique in right dataset; not a many-to-one merge")
+    match = ordinance_index.get_indexer(violation_key)
+
+    violations["ADDRESS"] = violations_address
+    violations["VIOLATION DATE"] = violations_date
+    violations["VIOLATION DESCRIPTION"] = violations_description
+    for column in ORDINANCE_COLUMNS:
+        values = ordinance[column].array.take(latest)
+        violations[column] = pd.api.extensions.take(values, match, allow_fill=True)
+    return violations.reset_index(drop=True)
@@ -0,0 +1,83 @@
+# Year-month partitioned storage for the out-of-core preprocessing mode.
+#
+# The raw CSVs are streamed once in typed chunks and every chunk's rows are
+# appended, as one parquet part per chunk, to the directory of their
+# VIOLATION DATE month (year_month=YYYY-MM, hive style, so pyarrow readers
+# can prune by month). Each month is then processed on its own, so memory is
+# bounded by the chunk size while splitting and by the largest month after.
+
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import derived_data
+import ingest
+
+PARTITION_COLUMN = "year_month"
+# directory of the rows without a (parseable) VIOLATION DATE; pyarrow reads
+# this hive value back as a missing year_month, as the full build stores it
+MISSING_MONTH = "__HIVE_DEFAULT_PARTITION__"
+
+
+def year_month(dates):
+    # same values as preprocessing.add_year_month (missing for missing dates)
+    return pd.to_datetime(dates, errors="coerce").dt.to_period("M").astype(str)
+
+
+def partition_name(month):
+    return MISSING_MONTH if pd.isna(month) else month
+
+
+def partition_dir(root, month):
+    return root / f"{PARTITION_COLUMN}={partition_name(month)}"
+
+
+def months(root):
+    return sorted(path.name.split("=", 1)[1] for path in root.glob(f"{PARTITION_COLUMN}=*"))
+
+
+def in_date_order(months):
+    # the undated rows' month first, as date sorts put missing dates
+    return sorted(months, key=lambda month: month != MISSING_MONTH)
+
+
+def clear(root):
+    shutil.rmtree(root, ignore_errors=True)
+
+
+def split_csv(path, columns, root, chunksize):
+    # partition the raw CSV by month; returns the lon/lat bounds of its points
+    clear(root)
+    bounds = np.array([np.inf, np.inf, -np.inf, -np.inf])
+    for i, chunk in enumerate(ingest.read_csv_chunks(path, columns, chunksize)):
+        lon, lat = chunk["LONGITUDE"].to_numpy(), chunk["LATITUDE"].to_numpy()
+        if np.isfinite(lon).any() and np.isfinite(lat).any():
+            bounds = np.r_[
+                np.minimum(bounds[:2], [np.nanmin(lon), np.nanmin(lat)]),
+                np.maximum(bounds[2:], [np.nanmax(lon), np.nanmax(lat)]),
+            ]
+
+        # dropna=False keeps the undated rows, which go to MISSING_MONTH
+        for month, rows in chunk.groupby(year_month(chunk["VIOLATION DATE"]).to_numpy(), sort=False, dropna=False):
+            partition_dir(root, month).mkdir(parents=True, exist_ok=True)
+            rows.to_parquet(partition_dir(root, month) / f"part-{i:05d}.parquet", index=False)
+    return tuple(float(value) for value in bounds)
+
+
+def read_partition(root, month, columns=None):
+    # the month's rows, or None when the feed has none that month
+    parts = sorted(partition_dir(root, month).glob("*.parquet"))
+    if not parts:
+        return None
+    return ingest.concat_chunks([pd.read_parquet(part, columns=columns) for part in parts])
+
+
+def write_partition(df, root, month, sort_by=None):
+    # the month is in the directory name, so it is not repeated in the file
+    partition_dir(root, month).mkdir(parents=True, exist_ok=True)
+    derived_data.write_parquet(
+        df.drop(columns=PARTITION_COLUMN, errors="ignore"),
+        partition_dir(root, month) / "part-0.parquet",
+        sort_by
+    )
@@ -1,331 +1,479 @@
 # load in data and packages
-from turtle import title
+#
+# Run as `python plots.py` to save the two Altair figures next to the script
+# and show the matplotlib ones in windows, one after the other. With
+# `--batch` every figure is instead rendered headless (Agg backend, Altair
+# PNG export through vl-convert) in a process pool, written to
+# derived-data/figures and optionally collected into one multi-page PDF.
+# Batch mode keeps a manifest of a key per figure (hash of its input data,
+# its parameters and its code) and skips figures whose key has not changed.
+
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 
-import geopandas as gpd
 import pandas as pd
-from pathlib import Path
-from shapely import wkt
-import os
 import numpy as np
 import matplotlib.pyplot as plt
 import altair as alt
 
+import aggregation
+import chart_data
+import derived_data
+import task_graph
+
 current_wd = os.getcwd()
 print(f"Working directory is now: {current_wd}")
 script_dir = Path(current_wd)
 
-violations_gdf = gpd.read_file(script_dir / '../data/derived-data/Building_Violations_w_ACS.gpkg')
-violations_gdf = violations_gdf.to_crs(epsg=4326)
-tract_month_level = pd.read_csv(script_dir / '../data/derived-data/tract_month_level_violations.csv')
+figures_dir = derived_data.DERIVED_DIR / "figures"
+ALTAIR_SCALE = 3
+MATPLOTLIB_DPI = 200
+
+# set in each worker by its initializer (inherited, not pickled, when the
+# pool forks)
+_inputs = None
+
+
+def init_worker(inputs):
+    global _inputs
+    plt.switch_backend("Agg")
+    _inputs = inputs
 
-ordinance_gdf = gpd.read_file(script_dir / '../data/derived-data/Ordinance_Violations_w_ACS.gpkg')
 
-violation_type_cols = [
-    col for col in tract_month_level.columns
-    if col not in ["GEOID", "year_month", "violations_count",
-                   "population", "per_cap_inc",
-                   "violations_per_1000"]
-]
+def load_inputs():
+    # only the columns the figures use; none of them need geometry
+    violations_gdf = derived_data.read_violations(
+        columns=["GEOID", "INSPECTION CATEGORY", "violation_category", "population", "per_cap_inc"]
+    )
+    tract_month_level = derived_data.read_tract_month()
+    return {"violations": violations_gdf, "tract_month": tract_month_level}
+
+
+def violation_type_columns(tract_month_level):
+    return [
+        col for col in tract_month_level.columns
+        if col not in ["GEOID", "year_month", "violations_count",
+                       "population", "per_cap_inc",
+                       "violations_per_1000"]
+    ]
+
 
 ##### not category split chart -> FIGURE 1
-filtered = violations_gdf
-
-# Count violations by tract AND inspection category
-category_counts = (
-    filtered
-    .groupby(["GEOID", "INSPECTION CATEGORY"])
-    .size()
-    .reset_index(name="category_count")
-)
-
-# Get total violations per tract
-total_counts = (
-    filtered
-    .groupby("GEOID")
-    .size()
-    .reset_index(name="total_violations")
-)
-
-# Merge totals
-category_counts = category_counts.merge(
-    total_counts,
-    on="GEOID",
-    how="left"
-)
-
-# Calculate share within tract
-category_counts["category_share"] = (
-    category_counts["category_count"] /
-    category_counts["total_violations"]
-)
-
-# Aggregate to tract level
-tract_level = (
-    filtered
-    .groupby("GEOID")
-    .agg(
-        per_cap_inc=("per_cap_inc", "first"),
-        population=("population", "first"),
-        violations=("GEOID", "size")  
+def income_bar_chart(violations_gdf):
+    filtered = violations_gdf
+
+    # Count violations by tract AND inspection category
+    category_counts = (
+        filtered
+        .groupby(["GEOID", "INSPECTION CATEGORY"], observed=True)
+        .size()
+        .reset_index(name="category_count")
+    )
+
+    # Get total violations per tract
+    total_counts = (
+        filtered
+        .groupby("GEOID")
+        .size()
+        .reset_index(name="total_violations")
+    )
+
+    # Merge totals
+    category_counts = category_counts.merge(
+        total_counts,
+        on="GEOID",
+        how="left"
     )
-    .reset_index()
-)
-
-# Calculate violations per 1,000 residents
-tract_level["violations_per_1000"] = (
-    tract_level["violations"] /
-    tract_level["population"]
-) * 1000
-
-tract_categories = category_counts.merge(
-    tract_level,
-    on="GEOID",
-    how="left"
-)
-
-tract_level["income_quintile"] = pd.qcut(
-    tract_level["per_cap_inc"],
-    5,
-    labels=["Q1 (Lowest)", "Q2", "Q3", "Q4", "Q5 (Highest)"]
-)
-
-tract_categories = tract_categories.merge(
-    tract_level[["GEOID", "income_quintile"]],
-    on="GEOID",
-    how="left"
-)
-
-# calculate population weighted mean
-quintile_totals = (
-    tract_level
-    .groupby("income_quintile")
-    .apply(lambda x: pd.Series({
-        "weighted_avg_violations_per_1000":
-            (x["violations_per_1000"] * x["population"]).sum() /
-            x["population"].sum()
-    }))
-    .reset_index()
-)
-
-quintile_category_shares = (
-    tract_categories
-    .groupby(["income_quintile", "INSPECTION CATEGORY"])
-    .apply(lambda x: pd.Series({
-        "weighted_share":
-            (x["category_share"] * x["population"]).sum() /
-            x["population"].sum()
-    }))
-    .reset_index()
-)
-
-quintile_category_summary = quintile_category_shares.merge(
-    quintile_totals,
-    on="income_quintile",
-    how="left"
-)
-
-quintile_category_summary["category_violations_per_1000"] = (
-    quintile_category_summary["weighted_share"] *
-    quintile_category_summary["weighted_avg_violations_per_1000"]
-)
-
-label_map = {
-    "PERIODIC": "Periodic",
-    "COMPLAINT": "Complaint",
-    "PERMIT": "License Inspection"
-}
-
-quintile_category_summary["INSPECTION CATEGORY"] = (
-    quintile_category_summary["INSPECTION CATEGORY"]
-    .replace(label_map)
-)
-
-bar_chart = alt.Chart(quintile_category_summary).mark_bar().encode(
-    x=alt.X(
-        "income_quintile:N",
-        title="Income Quintile",
-        axis=alt.Axis(labelAngle=0)
-    ),
-    y=alt.Y(
-        "category_violations_per_1000:Q",
-        title="Violations per 1,000 Residents"
-    ),
-    color=alt.Color(
-        "INSPECTION CATEGORY:N",
-        title="Inspection Category"
+
+    # Calculate share within tract
+    category_counts["category_share"] = (
+        category_counts["category_count"] /
+        category_counts["total_violations"]
+    )
+
+    # Aggregate to tract level
+    tract_level = (
+        filtered
+        .groupby("GEOID")
+        .agg(
+            per_cap_inc=("per_cap_inc", "first"),
+            population=("population", "first"),
+            violations=("GEOID", "size")
+        )
+        .reset_index()
+    )
+
+    # Calculate violations per 1,000 residents
+    tract_level["violations_per_1000"] = aggregation.per_1000(
+        tract_level["violations"],
+        tract_level["population"]
+    )
+
+    tract_categories = category_counts.merge(
+        tract_level,
+        on="GEOID",
+        how="left"
+    )
+
+    tract_level["income_quintile"] = pd.qcut(
+        tract_level["per_cap_inc"],
+        5,
+        labels=["Q1 (Lowest)", "Q2", "Q3", "Q4", "Q5 (Highest)"]
+    )
+
+    tract_categories = tract_categories.merge(
+        tract_level[["GEOID", "income_quintile"]],
+        on="GEOID",
+        how="left"
+    )
+
+    # calculate population weighted mean
+    quintile_totals = aggregation.weighted_mean(
+        tract_level,
+        "income_quintile",
+        value="violations_per_1000",
+        weight="population",
+        name="weighted_avg_violations_per_1000"
+    )
+
+    quintile_category_shares = aggregation.weighted_mean(
+        tract_categories,
+        ["income_quintile", "INSPECTION CATEGORY"],
+        value="category_share",
+        weight="population",
+        name="weighted_share"
     )
-).properties(
-    width=400,
-    height=500,
-    title="Violations per 1,000 Residents by Income Quintile"
-)
-bar_chart
-bar_chart.save("Violations_by_Income.png", scale_factor=3)
+
+    quintile_category_summary = quintile_category_shares.merge(
+        quintile_totals,
+        on="income_quintile",
+        how="left"
+    )
+
+    quintile_category_summary["category_violations_per_1000"] = (
+        quintile_category_summary["weighted_share"] *
+        quintile_category_summary["weighted_avg_violations_per_1000"]
+    )
+
+    label_map = {
+        "PERIODIC": "Periodic",
+        "COMPLAINT": "Complaint",
+        "PERMIT": "License Inspection"
+    }
+
+    quintile_category_summary["INSPECTION CATEGORY"] = (
+        quintile_category_summary["INSPECTION CATEGORY"]
+        .astype(str)
+        .replace(label_map)
+    )
+
+    bar_chart = alt.Chart(chart_data.columns(
+        quintile_category_summary, "income_quintile", "INSPECTION CATEGORY", "category_violations_per_1000"
+    )).mark_bar().encode(
+        x=alt.X(
+            "income_quintile:N",
+            title="Income Quintile",
+            axis=alt.Axis(labelAngle=0)
+        ),
+        y=alt.Y(
+            "category_violations_per_1000:Q",
+            title="Violations per 1,000 Residents"
+        ),
+        color=alt.Color(
+            "INSPECTION CATEGORY:N",
+            title="Inspection Category"
+        )
+    ).properties(
+        width=400,
+        height=500,
+        title="Violations per 1,000 Residents by Income Quintile"
+    )
+    return bar_chart
+
 
 ##### Heatmap --> FIGURE 2
-filtered = violations_gdf[
-    ~violations_gdf["violation_category"].isin(
-        ["Permits / Administrative", "Other / Misc"]
+def income_heatmap(violations_gdf):
+    filtered = violations_gdf[
+        ~violations_gdf["violation_category"].isin(
+            ["Permits / Administrative", "Other / Misc"]
+        )
+    ].copy()
+
+    # Aggregate total violations per tract
+    tract_level = (
+        filtered
+        .groupby("GEOID")
+        .agg(
+            per_cap_inc=("per_cap_inc", "first"),
+            population=("population", "first"),
+            total_violations=("GEOID", "size")
+        )
+        .reset_index()
+    )
+
+    # Income quintiles
+    tract_level["income_quintile"] = pd.qcut(
+        tract_level["per_cap_inc"],
+        5,
+        labels=["Q1 (Lowest)", "Q2", "Q3", "Q4", "Q5 (Highest)"]
     )
-].copy()
-
-# Aggregate total violations per tract
-tract_level = (
-    filtered
-    .groupby("GEOID")
-    .agg(
-        per_cap_inc=("per_cap_inc", "first"),
-        population=("population", "first"),
-        total_violations=("GEOID", "size")
+
+    tract_category = (
+        filtered
+        .groupby(["GEOID", "violation_category"], observed=True)
+        .size()
+        .reset_index(name="category_count")
+    )
+
+    tract_category = tract_category.merge(
+        tract_level[["GEOID", "population", "income_quintile"]],
+        on="GEOID",
+        how="left"
     )
-    .reset_index()
-)
-
-# Income quintiles
-tract_level["income_quintile"] = pd.qcut(
-    tract_level["per_cap_inc"],
-    5,
-    labels=["Q1 (Lowest)", "Q2", "Q3", "Q4", "Q5 (Highest)"]
-)
-
-tract_category = (
-    filtered
-    .groupby(["GEOID", "violation_category"])
-    .size()
-    .reset_index(name="category_count")
-)
-
-tract_category = tract_category.merge(
-    tract_level[["GEOID", "population", "income_quintile"]],
-    on="GEOID",
-    how="left"
-)
-
-tract_category["category_violations_per_1000"] = (
-    tract_category["category_count"] /
-    tract_category["population"]
-) * 1000
-
-heatmap_data = (
-    tract_category
-    .groupby(["income_quintile", "violation_category"])
-    .apply(lambda x: pd.Series({
-        "weighted_violations_per_1000":
-            (x["category_violations_per_1000"] * x["population"]).sum()
-            / x["population"].sum()
-    }))
-    .reset_index()
-)
-
-quintile_order = ["Q1 (Lowest)", "Q2", "Q3", "Q4", "Q5 (Highest)"]
-
-heatmap = alt.Chart(heatmap_data).mark_rect().encode(
-    x=alt.X(
-        "income_quintile:N",
-        sort=quintile_order,
-        title="Income Quintile",
-        axis=alt.Axis(labelAngle=0)
-    ),
-    y=alt.Y(
-        "violation_category:N",
-        title="Violation Category"
-    ),
-    color=alt.Color(
-        "weighted_violations_per_1000:Q",
-        title="Violations per 1,000",
-        scale=alt.Scale(scheme="blues")
+
+    tract_category["category_violations_per_1000"] = aggregation.per_1000(
+        tract_category["category_count"],
+        tract_category["population"]
     )
-).properties(
-    width=500,
-    height=350,
-    title="Violations per 1,000 by Income Quintile and Category"
-)
 
-heatmap
-heatmap.save("Heatmap_by_Income.png", scale_factor=3)
+    heatmap_data = aggregation.weighted_mean(
+        tract_category,
+        ["income_quintile", "violation_category"],
+        value="category_violations_per_1000",
+        weight="population",
+        name="weighted_violations_per_1000"
+    )
 
-#### exploratory plots 
-tract_level = (
-    tract_month_level
-    .groupby("GEOID")
-    .agg({
-        "violations_per_1000": "sum",
-        "per_cap_inc": "first"
-    })
-    .reset_index()
-)
+    quintile_order = ["Q1 (Lowest)", "Q2", "Q3", "Q4", "Q5 (Highest)"]
+
+    heatmap = alt.Chart(chart_data.columns(
+        heatmap_data, "income_quintile", "violation_category", "weighted_violations_per_1000"
+    )).mark_rect().encode(
+        x=alt.X(
+            "income_quintile:N",
+            sort=quintile_order,
+            title="Income Quintile",
+            axis=alt.Axis(labelAngle=0)
+        ),
+        y=alt.Y(
+            "violation_category:N",
+            title="Violation Category"
+        ),
+        color=alt.Color(
+            "weighted_violations_per_1000:Q",
+            title="Violations per 1,000",
+            scale=alt.Scale(scheme="blues")
+        )
+    ).properties(
+        width=500,
+        height=350,
+        title="Violations per 1,000 by Income Quintile and Category"
+    )
+    return heatmap
+
+
+#### exploratory plots
+def income_scatter(tract_month_level):
+    tract_level = (
+        tract_month_level
+        .groupby("GEOID")
+        .agg({
+            "violations_per_1000": "sum",
+            "per_cap_inc": "first"
+        })
+        .reset_index()
+    )
 
-plt.figure()
+    fig = plt.figure()
 
-plt.scatter(
-    tract_level["per_cap_inc"],
-    tract_level["violations_per_1000"],
-    alpha=0.4
-)
+    plt.scatter(
+        tract_level["per_cap_inc"],
+        tract_level["violations_per_1000"],
+        alpha=0.4
+    )
 
-plt.xlabel("Per Capita Income")
-plt.ylabel("Avg Violations per 1,000")
+    plt.xlabel("Per Capita Income")
+    plt.ylabel("Avg Violations per 1,000")
 
-plt.title("Average Violations vs Income (Tract Level)")
+    plt.title("Average Violations vs Income (Tract Level)")
+    return fig
 
-plt.show()
 
 # income vs violations by type (aggregated to tract level)
-tract_totals = (
-    tract_month_level
-    .groupby("GEOID")
-    .agg({
-        "violations_count": "sum",
-        **{col: "sum" for col in violation_type_cols},
-        "population": "first",
-        "per_cap_inc": "first"
-    })
-    .reset_index()
-)
-
-median_income = tract_totals["per_cap_inc"].median()
-
-for col in violation_type_cols:
-    
-    y_col = col
-    
-    plt.figure()
+def category_scatter(tract_month_level, col):
+    tract_totals = (
+        tract_month_level
+        .groupby("GEOID")
+        .agg({
+            "violations_count": "sum",
+            **{col: "sum" for col in violation_type_columns(tract_month_level)},
+            "population": "first",
+            "per_cap_inc": "first"
+        })
+        .reset_index()
+    )
+
+    median_income = tract_totals["per_cap_inc"].median()
+
+    fig = plt.figure()
     plt.scatter(
         tract_totals["per_cap_inc"],
-        tract_totals[y_col]
+        tract_totals[col]
     )
 
     plt.axvline(median_income)
-    
+
     plt.xlabel("Per Capita Income")
     plt.ylabel(col)
     plt.title(f"{col} vs Income (2024–2026 Total)")
-    
-    plt.show()
+    return fig
 
-# potential seasonal trends
-monthly_avg = (
-    tract_month_level
-    .groupby("year_month")["Heating / HVAC / Boilers_per_1000"]
-    .mean()
-    .reset_index(name="avg_violations")
-)
 
-plt.figure()
+# potential seasonal trends
+def monthly_heating(tract_month_level):
+    monthly_avg = (
+        tract_month_level
+        .groupby("year_month")["Heating / HVAC / Boilers_per_1000"]
+        .mean()
+        .reset_index(name="avg_violations")
+    )
 
-plt.bar(
-    monthly_avg["year_month"],
-    monthly_avg["avg_violations"]
-)
+    fig = plt.figure()
 
-plt.xlabel("Month")
-plt.ylabel("Average Heat Related Violations Across Tracts")
-plt.title("Average Monthly Violations per Tract (2024–2026)")
+    plt.bar(
+        monthly_avg["year_month"],
+        monthly_avg["avg_violations"]
+    )
 
-plt.xticks(rotation=45)
+    plt.xlabel("Month")
+    plt.ylabel("Average Heat Related Violations Across Tracts")
+    plt.title("Average Monthly Violations per Tract (2024–2026)")
 
-plt.show()
+    plt.xticks(rotation=45)
+    return fig
 
 # distribution of violation types
 # reason for violation (complaint vs regular)
-# fine amount / case outcome
\ No newline at end of file
+# fine amount / case outcome
+
+
+def figure_specs(tract_month_level):
+    # (file name, function, input, parameters) of every figure, in order
+    return [
+        ("Violations_by_Income", income_bar_chart, "violations", {}),
+        ("Heatmap_by_Income", income_heatmap, "violations", {}),
+        ("Income_Scatter", income_scatter, "tract_month", {}),
+        *[
+            ("Scatter_" + re.sub(r"[^0-9A-Za-z]+", "_", col).strip("_"), category_scatter, "tract_month", {"col": col})
+            for col in violation_type_columns(tract_month_level)
+        ],
+        ("Monthly_Heating", monthly_heating, "tract_month", {}),
+    ]
+
+
+def data_hash(df):
+    digest = hashlib.sha256(json.dumps(list(map(str, df.columns))).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def figure_key(name, func, data_key, params):
+    # changes with the input data, the parameters, the figure code and the
+    # output resolution
+    digest = hashlib.sha256(name.encode())
+    digest.update(inspect.getsource(func).encode())
+    digest.update(data_key.encode())
+    digest.update(json.dumps({**params, "scale": ALTAIR_SCALE, "dpi": MATPLOTLIB_DPI}, sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+def save_figure(figure, path):
+    if isinstance(figure, alt.TopLevelMixin):
+        chart_data.save(figure, path, scale_factor=ALTAIR_SCALE)
+    else:
+        figure.savefig(path, dpi=MATPLOTLIB_DPI, bbox_inches="tight")
+        plt.close(figure)
+
+
+def render(spec, path):
+    name, func, source, params = spec
+    save_figure(func(_inputs[source], **params), path)
+    return name
+
+
+def write_pdf(paths, pdf_path):
+    # one page per rendered figure, in figure order
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    with PdfPages(pdf_path) as pdf:
+        for path in paths:
+            image = plt.imread(path)
+            height, width = image.shape[:2]
+            fig = plt.figure(figsize=(width / MATPLOTLIB_DPI, height / MATPLOTLIB_DPI))
+            fig.figimage(image, resize=True)
+            pdf.savefig(fig, dpi=MATPLOTLIB_DPI)
+            plt.close(fig)
+
+
+def run_batch(output_dir, jobs=None, pdf_path=None, force=False):
+    plt.switch_backend("Agg")
+    inputs = load_inputs()
+    data_keys = {source: data_hash(df) for source, df in inputs.items()}
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / "manifest.json"
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+
+    specs = figure_specs(inputs["tract_month"])
+    keys = {name: figure_key(name, func, data_keys[source], params) for name, func, source, params in specs}
+    paths = {name: output_dir / f"{name}.png" for name, _, _, _ in specs}
+    stale = [
+        spec for spec in specs
+        if force or manifest.get(spec[0]) != keys[spec[0]] or not paths[spec[0]].exists()
+    ]
+    print(f"[figures] {len(specs) - len(stale)} unchanged, rendering {len(stale)}")
+
+    if stale:
+        with ProcessPoolExecutor(
+            jobs or os.cpu_count(), mp_context=task_graph.pool_context(), initializer=init_worker, initargs=(inputs,)
+        ) as pool:
+            for name in pool.map(render, stale, [paths[spec[0]] for spec in stale]):
+                print(f"[figures] {paths[name]}")
+    manifest_path.write_text(json.dumps(keys, indent=2))
+
+    if pdf_path and (stale or not pdf_path.exists()):
+        write_pdf([paths[name] for name, _, _, _ in specs], pdf_path)
+        print(f"[figures] {pdf_path}")
+
+
+def run_interactive():
+    inputs = load_inputs()
+    for name, func, source, params in figure_specs(inputs["tract_month"]):
+        figure = func(inputs[source], **params)
+        if isinstance(figure, alt.TopLevelMixin):
+            chart_data.save(figure, f"{name}.png", scale_factor=ALTAIR_SCALE)
+        else:
+            plt.show()
+
+
+parser = argparse.ArgumentParser(description="Render the project figures")
+parser.add_argument("--batch", action="store_true",
+                    help="render every figure headless, in parallel, skipping unchanged ones")
+parser.add_argument("--output", type=Path, default=figures_dir, help="batch output directory")
+parser.add_argument("--pdf", type=Path, help="also collect the batch figures into this multi-page PDF")
+parser.add_argument("--jobs", type=int, help="worker processes for --batch (default: all cores)")
+parser.add_argument("--force", action="store_true", help="re-render figures even if unchanged")
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.batch:
+        run_batch(args.output, args.jobs, args.pdf, args.force)
+    else:
+        run_interactive()
@@ -2,243 +2,775 @@ import geopandas as gpd
 import pandas as pd
 from pathlib import Path
 from shapely import wkt
+from shapely.geometry import box
 import os
+import argparse
 import numpy as np
+import shapely
+from concurrent.futures import ProcessPoolExecutor
+
+import aggregation
+import categories
+import cube
+import dashboard_data
+import derived_data
+import ingest
+import incremental
+import ordinance_join
+import partitions
+import spatial_join
+import stage_cache
+import task_graph
+import tract_lookup
+
+parser = argparse.ArgumentParser(description="Build the derived violation datasets")
+parser.add_argument(
+    "--chunksize",
+    type=int,
+    default=None,
+    help="read the raw CSVs in typed, column-pruned chunks of this many rows (the parsed feeds are "
+         "still held whole; use --partitioned to bound memory)"
+)
+parser.add_argument(
+    "--incremental",
+    action="store_true",
+    help="only process rows newer than the stored watermark and patch the derived files"
+)
+parser.add_argument(
+    "--partitioned",
+    action="store_true",
+    help="out-of-core run: split the raw data by year_month and process the months in parallel workers"
+)
+parser.add_argument(
+    "--tract-bbox",
+    type=float,
+    nargs=4,
+    metavar=("MINLON", "MINLAT", "MAXLON", "MAXLAT"),
+    default=None,
+    help="only read tracts intersecting this lon/lat box (default: the extent of the violation points)"
+)
+parser.add_argument(
+    "--jobs",
+    type=int,
+    default=None,
+    help="worker processes for independent stages and the spatial joins (default: all cores)"
+)
+parser.add_argument(
+    "--no-cache",
+    action="store_true",
+    help="recompute every stage instead of loading unchanged results from the stage cache"
+)
+parser.add_argument(
+    "--topojson",
+    action="store_true",
+    help="also export the tract geometry layer as TopoJSON (needs the topojson package)"
+)
+parser.add_argument(
+    "--no-tiles",
+    action="store_true",
+    help="skip building the vector tile pyramid for the dashboard map"
+)
 
 current_wd = os.getcwd()
-print(f"Working directory is now: {current_wd}")
 script_dir = Path(current_wd)
 
-# Process building violations 
 raw_violations = script_dir / '../data/raw-data/Building_Violations_2024-2026.csv'
+raw_ordinance = script_dir / '../data/raw-data/Ordinance_Violations_(Buildings)_2024-2026.csv'
+raw_tracts = script_dir / '../data/raw-data/shapefiles/US_tract_2024.shp'
+raw_income = script_dir / '../data/raw-data/income_tract.csv'
+
 output_violations = script_dir / '../data/derived-data/Building_Violations_2024-2026.gpkg'
+output_ordinance = script_dir / '../data/derived-data/Ordinance_Violations_2024-2026.gpkg'
+output_income_tract = script_dir / '../data/derived-data/income_tract.gpkg'
+output_violations_acs = script_dir / '../data/derived-data/Building_Violations_w_ACS.gpkg'
+output_ordinance_acs = script_dir / '../data/derived-data/Ordinance_Violations_w_ACS.gpkg'
+output_tract_month = script_dir / '../data/derived-data/tract_month_level_violations.csv'
+output_violations_parquet = output_violations_acs.with_suffix(".parquet")
+output_ordinance_parquet = output_ordinance_acs.with_suffix(".parquet")
+output_tract_month_parquet = output_tract_month.with_suffix(".parquet")
+output_cube = script_dir / '../data/derived-data/violation_cube.parquet'
+output_tract_dimension = script_dir / '../data/derived-data/tract_dimension.parquet'
+output_tract_geometry = script_dir / '../data/derived-data/tract_geometry.parquet'
+output_tract_geometry_json = output_tract_geometry.with_suffix(".geojson")
+output_tract_geometry_topojson = output_tract_geometry.with_suffix(".topojson")
+watermark_path = script_dir / '../data/derived-data/watermark.json'
+cache_dir = script_dir / '../data/derived-data/.stage_cache'
+tract_lookup_path = script_dir / '../data/derived-data/tract_lookup.npz'
+output_tiles = script_dir / '../data/derived-data/violation_tiles.mbtiles'
+output_dashboard = script_dir / '../data/derived-data/dashboard_violations.arrow'
+partition_dir = script_dir / '../data/derived-data/partitions'
+output_violations_partitioned = output_violations_acs.with_suffix("")
+output_ordinance_partitioned = output_ordinance_acs.with_suffix("")
+
+
+def read_points(raw_path, columns, output, chunksize=None):
+    if chunksize:
+        return ingest.stream_projected(raw_path, columns, output, chunksize)
+
+    df = pd.read_csv(raw_path)
+    gdf = ingest.to_projected_points(df)
+    gdf.to_file(output)
+    return gdf
 
-violations_df = pd.read_csv(raw_violations)
-violations_gdf = gpd.GeoDataFrame(
-    violations_df,
-    geometry=gpd.points_from_xy(
-        violations_df['LONGITUDE'],
-        violations_df['LATITUDE']
-    ),
-    crs="EPSG:4326"   
-)
 
-violations_gdf = violations_gdf.to_crs("ESRI:102003")
-violations_gdf.to_file(output_violations)
+# Process ACS income data taken from https://data2.nhgis.org/main to get tract level population and per capita income
+# only tracts intersecting `bbox` (given in `bbox_crs`) are read from the national file
+def load_acs_tracts(bbox=None, bbox_crs=None):
+    if bbox is not None:
+        bbox = gpd.GeoSeries([box(*bbox)], crs=bbox_crs)
+    tracts = gpd.read_file(raw_tracts, bbox=bbox)
+    acs_data = pd.read_csv(raw_income)
+
+    acs_gdf = tracts.merge(acs_data, on="GISJOIN", how="inner")
+    acs_gdf = acs_gdf.rename(columns={"AUO6E001": "population", "AUSYE001": "per_cap_inc"})
+    acs_subset = acs_gdf[["population", "per_cap_inc", "geometry", "GEOID"]]
+
+    acs_subset.to_file(output_income_tract)
+    return tracts, acs_subset
+
+
+def points_bbox(*gdfs, snap=10_000):
+    # extent of the points, snapped outward to a `snap` metre grid so small
+    # changes in the feed keep the same box (and the same cached tract subset)
+    bounds = np.array([gdf.geometry.total_bounds for gdf in gdfs])
+    minx, miny = np.nanmin(bounds[:, :2], axis=0)
+    maxx, maxy = np.nanmax(bounds[:, 2:], axis=0)
+    return (
+        float(np.floor(minx / snap) * snap),
+        float(np.floor(miny / snap) * snap),
+        float(np.ceil(maxx / snap) * snap),
+        float(np.ceil(maxy / snap) * snap),
+    )
 
-# Process ordinance violations:
-raw_ordinance = script_dir / '../data/raw-data/Ordinance_Violations_(Buildings)_2024-2026.csv'
-output_ordinance = script_dir / '../data/derived-data/Ordinance_Violations_2024-2026.gpkg'
 
-ordinance_df = pd.read_csv(raw_ordinance)
-ordinance_gdf = gpd.GeoDataFrame(
-    ordinance_df,
-    geometry=gpd.points_from_xy(
-        ordinance_df['LONGITUDE'],
-        ordinance_df['LATITUDE']
-    ),
-    crs="EPSG:4326"   
-)
+def tract_shapefile_parts():
+    return [
+        raw_tracts.with_suffix(suffix)
+        for suffix in [".shp", ".shx", ".dbf", ".prj", ".cpg"]
+        if raw_tracts.with_suffix(suffix).exists()
+    ]
 
-ordinance_gdf = ordinance_gdf.to_crs("ESRI:102003")
-ordinance_gdf.to_file(output_ordinance)
 
-# Process ACS income data taken from https://data2.nhgis.org/main to get tract level population and per capita income
-tracts = gpd.read_file(script_dir / "../data/raw-data/shapefiles/US_tract_2024.shp")
-acs_data = pd.read_csv(script_dir / '../data/raw-data/income_tract.csv')
+# same result as gpd.sjoin(points, acs_subset, how="left", predicate="within"),
+# against only the tracts around the points and spread over `jobs` processes;
+# with a lookup, locations joined on earlier runs skip the join entirely
+def join_acs(points_gdf, acs_subset, jobs=None, lookup=None):
+    join = lookup.sjoin_within if lookup is not None else spatial_join.sjoin_within
+    return join(
+        points_gdf,
+        acs_subset,
+        workers=jobs
+    )
 
-acs_gdf = tracts.merge(acs_data, on="GISJOIN", how="inner")
-acs_gdf = acs_gdf.rename(columns={"AUO6E001": "population", "AUSYE001": "per_cap_inc"})
-acs_subset = acs_gdf[["population", "per_cap_inc", "geometry", "GEOID"]]
 
-acs_subset.to_file(script_dir / '../data/derived-data/income_tract.gpkg')
+# create categories for violation description
+def categorize(violations_gdf):
+    violations_gdf["violation_category"] = categories.classify(violations_gdf["VIOLATION DESCRIPTION"])
+    return violations_gdf
 
-# Merge building and ordinance violation data with ACS income data
-violations_merged_gdf = gpd.sjoin(
-    violations_gdf,
-    acs_subset,
-    how="left",
-    predicate="within"
-)
 
-ordinance_merged_gdf = gpd.sjoin(
-    ordinance_gdf,
-    acs_subset,
-    how="left",
-    predicate="within"
-)
+def add_year_month(violations_gdf):
+    violation_date = pd.to_datetime(violations_gdf["VIOLATION DATE"], errors="coerce")
+    violations_gdf["year_month"] = violation_date.dt.to_period("M").astype(str)
+    return violations_gdf
 
-# create categories for violation description
-desc = violations_gdf["VIOLATION DESCRIPTION"].str.upper()
-
-conditions = [
-    desc.str.contains("FIRE|SMOKE|CARB|EGRESS|EXIT|PANIC|SPRINKLER|CORRIDOR", na=False),
-    
-    desc.str.contains("WIRING|OUTLET|BREAKER|CONDUIT|CIRCUIT|GROUND|ELECTR|FEEDER", na=False),
-    
-    desc.str.contains("PLUMB|WATER|SEWER|DRAIN|PIPE|TRAP|WASTE|FLUSH|BACKWATER|FAUCET", na=False),
-    
-    desc.str.contains("HEAT|BOILER|FURNACE|VENT|BREECHING|RELIEF VALVE|HWH", na=False),
-    
-    desc.str.contains("ROOF|FOUNDATION|WALL|CHIMNEY|PORCH|BALCONY|PARAPET|LINTEL|STRUCTURAL", na=False),
-    
-    desc.str.contains("RAT|ROACH|MICE|INSECT|UNSANITARY|GARBAGE|DEBRIS|NUISANCE|PIGEON", na=False),
-    
-    desc.str.contains("WINDOW|DOOR|FLOOR|PAINT|SILL|SCREEN|LOCK|GLASS|CEILING", na=False),
-    
-    desc.str.contains("PERMIT|PLANS|REGISTER|CERTIFICATE|LICENSE|POST|APPROVAL|REGISTRATION|CONTRACTOR|C OF O", na=False)
-]
 
-choices = [
-    "Fire & Life Safety",
-    "Electrical",
-    "Plumbing & Water",
-    "Heating / HVAC / Boilers",
-    "Structural / Building Envelope",
-    "Sanitation / Pests / Waste",
-    "Windows / Doors / Interior",
-    "Permits / Administrative"
-]
+def classify_violations(violations_merged_gdf):
+    return add_year_month(categorize(violations_merged_gdf.copy()))
 
-violations_merged_gdf["violation_category"] = np.select(conditions, choices, default="Other / Misc")
 
-violations_merged_gdf.to_file(
-    script_dir / '../data/derived-data/Building_Violations_w_ACS.gpkg',
-    driver="GPKG"
-)
+# merge violations and ordinance: latest hearing per (address, date,
+# description), joined on factorized integer keys
+def merge_ordinance(violations_merged_gdf, ordinance_merged_gdf):
+    return ordinance_join.merge_ordinance(violations_merged_gdf, ordinance_merged_gdf)
 
-ordinance_merged_gdf.to_file(
-    script_dir / '../data/derived-data/Ordinance_Violations_w_ACS.gpkg',
-    driver="GPKG"
-)
 
-# merge violations and ordinance
-for df in [violations_merged_gdf, ordinance_merged_gdf]:
-    df["ADDRESS"] = df["ADDRESS"].str.strip().str.upper()
-    df["VIOLATION DESCRIPTION"] = df["VIOLATION DESCRIPTION"].str.strip().str.upper()
+# aggregate to tract - month level for number of violations per capita since 2024
+def aggregate_tract_month(violations_merged_gdf):
+    violations_by_type = (
+        violations_merged_gdf
+        .groupby(["GEOID", "year_month", "violation_category"], observed=True)
+        .size()
+        .reset_index(name="count")
+    )
 
-ordinance_merged_gdf["HEARING DATE"] = pd.to_datetime(ordinance_merged_gdf["HEARING DATE"])
+    violations_by_type_wide = (
+        violations_by_type
+        .pivot(index=["GEOID", "year_month"],
+               columns="violation_category",
+               values="count")
+        .fillna(0)
+        .reset_index()
+    )
+    violations_by_type_wide.columns.name = None
 
+    total_violations = (
+        violations_merged_gdf
+        .groupby(["GEOID", "year_month"])
+        .size()
+        .reset_index(name="violations_count")
+    )
 
-violations_merged_gdf["VIOLATION DATE"] = pd.to_datetime(
-    violations_merged_gdf["VIOLATION DATE"],
-    errors="coerce"
-)
+    violations_tract_month = violations_by_type_wide.merge(
+        total_violations,
+        on=["GEOID", "year_month"],
+        how="left"
+    )
 
-ordinance_merged_gdf["VIOLATION DATE"] = pd.to_datetime(
-    ordinance_merged_gdf["VIOLATION DATE"],
-    errors="coerce"
-)
+    tract_characteristics = (
+        violations_merged_gdf[["GEOID", "population", "per_cap_inc"]]
+        .drop_duplicates()
+    )
 
-violations_merged_gdf["VIOLATION DATE"] = violations_merged_gdf["VIOLATION DATE"].dt.date
-ordinance_merged_gdf["VIOLATION DATE"] = ordinance_merged_gdf["VIOLATION DATE"].dt.date
+    tract_characteristics = tract_characteristics[
+        tract_characteristics["per_cap_inc"] > 0
+    ]
 
-ordinance_dedup = (
-    ordinance_merged_gdf
-    .sort_values("HEARING DATE")
-    .drop_duplicates(
-        subset=["ADDRESS", "VIOLATION DATE", "VIOLATION DESCRIPTION"],
-        keep="last"
+    violations_tract_month = violations_tract_month.merge(
+        tract_characteristics,
+        on="GEOID",
+        how="inner"
     )
-)
 
-ordinance_dedup["VIOLATION DESCRIPTION"] = (
-    ordinance_dedup["VIOLATION DESCRIPTION"]
-        .str.replace(r"^\S+\s+", "", regex=True)  
-        .str.replace(r"\.$", "", regex=True)      
-        .str.strip()
-        .str.upper()
-)
+    violations_tract_month["violations_per_1000"] = (
+        violations_tract_month["violations_count"] /
+        violations_tract_month["population"] * 1000
+    )
 
-violations_ordinance_merged = violations_merged_gdf.merge(
-    ordinance_dedup[
-        ["ADDRESS",
-         "VIOLATION DATE",
-         "VIOLATION DESCRIPTION",
-         "CASE DISPOSITION",
-         "IMPOSED FINE"]
-    ],
-    on=["ADDRESS", "VIOLATION DATE", "VIOLATION DESCRIPTION"],
-    how="left",
-    validate="m:1"
-)
+    category_cols = [
+        col for col in violations_tract_month.columns
+        if col not in ["GEOID", "year_month", "violations_count",
+                       "population", "per_cap_inc",
+                       "violations_per_1000"]
+    ]
 
-# aggregate to tract - month level for number of violations per capita since 2024
-violations_by_type = (
-    violations_merged_gdf
-    .groupby(["GEOID", "year_month", "violation_category"])
-    .size()
-    .reset_index(name="count")
-)
+    for col in category_cols:
+        violations_tract_month[f"{col}_per_1000"] = (
+            violations_tract_month[col] /
+            violations_tract_month["population"] * 1000
+        )
 
-violations_by_type_wide = (
-    violations_by_type
-    .pivot(index=["GEOID", "year_month"],
-           columns="violation_category",
-           values="count")
-    .fillna(0)
-    .reset_index()
-)
+    return violations_tract_month
 
-total_violations = (
-    violations_merged_gdf
-    .groupby(["GEOID", "year_month"])
-    .size()
-    .reset_index(name="violations_count")
-)
 
-violations_tract_month = violations_by_type_wide.merge(
-    total_violations,
-    on=["GEOID", "year_month"],
-    how="left"
-)
+TRACT_SIMPLIFY_METERS = 10
 
-tract_characteristics = (
-    violations_merged_gdf[["GEOID", "population", "per_cap_inc"]]
-    .drop_duplicates()
-)
 
-tract_characteristics = tract_characteristics[
-    tract_characteristics["per_cap_inc"] > 0
-]
+# one simplified polygon per tract, stored once; the tract-month attributes
+# are the tract_month parquet / CSV, joined on GEOID by the reader.
+# Simplifying the tracts as a coverage keeps shared edges shared, so no gaps
+# or overlaps open up between neighbours.
+def write_tract_geometry(acs_subset, topojson=False, simplify_meters=TRACT_SIMPLIFY_METERS):
+    tract_geometry = acs_subset[["GEOID", "geometry"]].drop_duplicates("GEOID").reset_index(drop=True)
+    tract_geometry["geometry"] = shapely.coverage_simplify(
+        tract_geometry.geometry.to_numpy(),
+        simplify_meters
+    )
+    tract_geometry = tract_geometry.to_crs("EPSG:4326")
 
-violations_tract_month = violations_tract_month.merge(
-    tract_characteristics,
-    on="GEOID",
-    how="inner"
-)
+    derived_data.write_parquet(tract_geometry, output_tract_geometry)
+    tract_geometry.to_file(output_tract_geometry_json, driver="GeoJSON", COORDINATE_PRECISION=6)
 
-violations_tract_month["violations_per_1000"] = (
-    violations_tract_month["violations_count"] /
-    violations_tract_month["population"] * 1000
-)
+    if topojson:
+        import topojson as tp
+        tp.Topology(tract_geometry, prequantize=1_000_000).to_json(output_tract_geometry_topojson)
+
+
+def write_file(gdf, path, driver=None):
+    gdf.to_file(path, driver=driver)
+
+
+VIOLATIONS_SORT = ["violation_category", "VIOLATION DATE"]
 
-category_cols = [
-    col for col in violations_tract_month.columns
-    if col not in ["GEOID", "year_month", "violations_count",
-                   "population", "per_cap_inc",
-                   "violations_per_1000"]
+
+def write_cube(violations_merged_gdf, acs_subset):
+    violation_cube = cube.build_cube(violations_merged_gdf)
+    derived_data.write_parquet(violation_cube, output_cube)
+    derived_data.write_parquet(cube.build_tract_dimension(violation_cube, acs_subset), output_tract_dimension)
+
+
+TILE_POINT_COLUMNS = [
+    "LONGITUDE",
+    "LATITUDE",
+    "violation_category",
+    "VIOLATION STATUS",
+    "INSPECTION CATEGORY",
+    "VIOLATION DATE",
 ]
 
-for col in category_cols:
-    violations_tract_month[f"{col}_per_1000"] = (
-        violations_tract_month[col] /
-        violations_tract_month["population"] * 1000
+
+# the dashboard's memory-mapped snapshot; without a table it is rebuilt from
+# the violations parquet (incremental builds)
+def write_dashboard_snapshot(violations_merged_gdf=None):
+    if violations_merged_gdf is None:
+        violations_merged_gdf = pd.read_parquet(output_violations_parquet, columns=dashboard_data.SOURCE_COLUMNS)
+    dashboard_data.write_snapshot(violations_merged_gdf, output_dashboard)
+
+
+# vector tile layers for the dashboard map: the points, and the tracts with
+# their violation counts per category
+def tile_layers(violations_merged_gdf, acs_subset, point_columns=TILE_POINT_COLUMNS):
+    points = violations_merged_gdf[point_columns].copy()
+    points["VIOLATION DATE"] = pd.to_datetime(points["VIOLATION DATE"], errors="coerce").dt.strftime("%Y-%m-%d")
+    points = points.rename(columns={
+        "VIOLATION STATUS": "violation_status",
+        "INSPECTION CATEGORY": "inspection_category",
+        "VIOLATION DATE": "violation_date",
+    })
+
+    counts = (
+        violations_merged_gdf
+        .groupby(["GEOID", "violation_category"], observed=True)
+        .size()
+        .unstack(fill_value=0)
     )
+    counts.columns = counts.columns.astype(str)
+    counts["violations"] = counts.sum(axis=1)
 
-violations_tract_month.to_csv(
-    script_dir / '../data/derived-data/tract_month_level_violations.csv',
-    index=False
-)
+    tracts = acs_subset[["GEOID", "population", "per_cap_inc", "geometry"]].merge(
+        counts.reset_index(),
+        on="GEOID",
+        how="inner"
+    )
+    return points, tracts
+
+
+# tiles is imported here, so builds without tiles do not need
+# mapbox_vector_tile
+def write_tiles(violations_merged_gdf, acs_subset, point_columns=TILE_POINT_COLUMNS):
+    import tiles
+    count = tiles.build_tiles(*tile_layers(violations_merged_gdf, acs_subset, point_columns), output_tiles)
+    print(f"Wrote {count} tiles to {output_tiles}")
+
+
+# incremental runs re-encode only the tiles holding the delta's points (at
+# their new and previous locations) and the tiles of the tracts whose counts
+# changed
+def update_tiles(acs_subset, locations, geoids):
+    import tiles
+    violations = pd.read_parquet(output_violations_parquet, columns=[*TILE_POINT_COLUMNS, "GEOID"])
+    if not output_tiles.exists():
+        write_tiles(violations, acs_subset)
+        return
+
+    points, tracts = tile_layers(violations, acs_subset)
+    touched = (
+        tiles.point_tile_keys(locations)
+        | tiles.polygon_tile_keys(acs_subset[acs_subset["GEOID"].isin(geoids)])
+    )
+    count = tiles.update_tiles(points, tracts, output_tiles, touched)
+    print(f"Rewrote {count} of the tiles in {output_tiles}")
 
-# Save spatial file version
-violations_tract_month_gdf = tracts.merge(
-    violations_tract_month,
-    on="GEOID",
-    how="left"
-)
 
-violations_tract_month_gdf.to_file(
-    script_dir / '../data/derived-data/tract_month_level_violations.geojson',
-    driver="GeoJSON"
-)
\ No newline at end of file
+def tract_bbox(tract_bbox_arg, violations_gdf, ordinance_gdf):
+    if tract_bbox_arg:
+        return tuple(tract_bbox_arg), "EPSG:4326"
+    return points_bbox(violations_gdf, ordinance_gdf), str(violations_gdf.crs)
+
+
+# join stage: also hands back the coordinates the lookup learned, since the
+# stage may run in a worker process whose copy of the lookup is thrown away
+def join_points(points_gdf, acs_subset, jobs=None, lookup=None):
+    known = len(lookup.table)
+    joined = join_acs(points_gdf, acs_subset, jobs, lookup)
+    return joined, lookup.table.iloc[known:]
+
+
+def write_tract_month(violations_tract_month):
+    violations_tract_month.to_csv(
+        output_tract_month,
+        index=False
+    )
+    derived_data.write_parquet(violations_tract_month, output_tract_month_parquet)
+
+
+def run_full(args):
+    # typed ingest is required for incremental runs so appended rows match the
+    # schema of the files they are appended to
+    chunksize = args.chunksize or (100_000 if args.incremental else None)
+    cache = stage_cache.StageCache(cache_dir, enabled=not args.no_cache)
+
+    # the building and ordinance branches run side by side, so each spatial
+    # join gets half of the --jobs processes
+    jobs = args.jobs or os.cpu_count()
+    join_jobs = max(1, jobs // 2)
+    graph = task_graph.TaskGraph(cache, jobs)
+    for output in [output_violations_partitioned, output_ordinance_partitioned]:
+        partitions.clear(output)
+
+    # Process building violations
+    graph.stage(
+        "read_violations", read_points,
+        args=(raw_violations, ingest.VIOLATION_COLUMNS, output_violations),
+        files=[raw_violations],
+        params={"chunksize": chunksize},
+        outputs=[output_violations],
+        code=[ingest]
+    )
+
+    # Process ordinance violations:
+    graph.stage(
+        "read_ordinance", read_points,
+        args=(raw_ordinance, ingest.ORDINANCE_COLUMNS, output_ordinance),
+        files=[raw_ordinance],
+        params={"chunksize": chunksize},
+        outputs=[output_ordinance],
+        code=[ingest]
+    )
+
+    graph.step(
+        "tract_bbox", tract_bbox,
+        args=(args.tract_bbox, task_graph.Ref("read_violations"), task_graph.Ref("read_ordinance"))
+    )
+
+    graph.stage(
+        "acs_tracts", load_acs_tracts,
+        files=[*tract_shapefile_parts(), raw_income],
+        params={"bbox": task_graph.Ref("tract_bbox", 0), "bbox_crs": task_graph.Ref("tract_bbox", 1)},
+        outputs=[output_income_tract]
+    )
+
+    # tract positions in the lookup refer to income_tract.gpkg, so its
+    # content hash is the lookup's invalidation key
+    graph.step(
+        "tract_lookup",
+        lambda: tract_lookup.TractLookup(
+            tract_lookup_path, cache.file_hash(output_income_tract), enabled=not args.no_cache
+        ),
+        after=["acs_tracts"]
+    )
+
+    # Merge building and ordinance violation data with ACS income data
+    for name, points in [("join_violations", "read_violations"), ("join_ordinance", "read_ordinance")]:
+        graph.stage(
+            name, join_points,
+            args=(task_graph.Ref(points), task_graph.Ref("acs_tracts", 1), join_jobs, task_graph.Ref("tract_lookup")),
+            code=[join_acs, spatial_join, tract_lookup]
+        )
+
+    def save_lookup(lookup, learned_violations, learned_ordinance):
+        lookup.absorb(learned_violations)
+        lookup.absorb(learned_ordinance)
+        lookup.save()
+
+    graph.step(
+        "save_lookup", save_lookup,
+        args=(
+            task_graph.Ref("tract_lookup"),
+            task_graph.Ref("join_violations", 1),
+            task_graph.Ref("join_ordinance", 1),
+        )
+    )
+
+    violations_merged_gdf = task_graph.Ref("categorize")
+    ordinance_merged_gdf = task_graph.Ref("join_ordinance", 0)
+    acs_subset = task_graph.Ref("acs_tracts", 1)
+
+    graph.stage(
+        "categorize", classify_violations,
+        args=(task_graph.Ref("join_violations", 0),),
+        code=[categorize, add_year_month, categories]
+    )
+
+    graph.stage(
+        "write_violations_acs", write_file,
+        args=(violations_merged_gdf, output_violations_acs),
+        params={"driver": "GPKG"},
+        outputs=[output_violations_acs],
+        writer=True
+    )
+
+    graph.stage(
+        "write_ordinance_acs", write_file,
+        args=(ordinance_merged_gdf, output_ordinance_acs),
+        params={"driver": "GPKG"},
+        outputs=[output_ordinance_acs],
+        writer=True
+    )
+
+    graph.stage(
+        "write_violations_parquet", derived_data.write_parquet_parts,
+        args=(violations_merged_gdf, output_violations_parquet),
+        params={"sort_by": VIOLATIONS_SORT},
+        code=[derived_data],
+        outputs=[output_violations_parquet],
+        writer=True
+    )
+
+    graph.stage(
+        "write_ordinance_parquet", derived_data.write_parquet_parts,
+        args=(ordinance_merged_gdf, output_ordinance_parquet),
+        code=[derived_data],
+        outputs=[output_ordinance_parquet],
+        writer=True
+    )
+
+    graph.stage(
+        "write_cube", write_cube,
+        args=(violations_merged_gdf, acs_subset),
+        code=[cube, derived_data],
+        outputs=[output_cube, output_tract_dimension],
+        writer=True
+    )
+
+    graph.stage(
+        "write_dashboard_snapshot", write_dashboard_snapshot,
+        args=(violations_merged_gdf,),
+        code=[dashboard_data, derived_data],
+        outputs=[output_dashboard],
+        writer=True
+    )
+
+    if not args.no_tiles:
+        import tiles
+        graph.stage(
+            "write_tiles", write_tiles,
+            args=(violations_merged_gdf, acs_subset),
+            params={"point_columns": TILE_POINT_COLUMNS},
+            code=[tile_layers, tiles],
+            outputs=[output_tiles]
+        )
+
+    if chunksize:
+        graph.step(
+            "write_watermark",
+            lambda violations_gdf, ordinance_gdf: incremental.write_watermark(watermark_path, {
+                "violations": incremental.compute_mark(violations_gdf),
+                "ordinance": incremental.compute_mark(ordinance_gdf),
+            }),
+            args=(task_graph.Ref("read_violations"), task_graph.Ref("read_ordinance"))
+        )
+
+    graph.stage(
+        "merge_ordinance", merge_ordinance,
+        args=(violations_merged_gdf, ordinance_merged_gdf),
+        code=[ordinance_join]
+    )
+
+    graph.stage(
+        "tract_month", aggregate_tract_month,
+        args=(violations_merged_gdf,)
+    )
+
+    graph.stage(
+        "write_tract_month", write_tract_month,
+        args=(task_graph.Ref("tract_month"),),
+        code=[derived_data],
+        outputs=[output_tract_month, output_tract_month_parquet],
+        writer=True
+    )
+
+    # Save spatial file version
+    graph.stage(
+        "write_tract_geometry", write_tract_geometry,
+        args=(acs_subset,),
+        params={"topojson": args.topojson, "simplify_meters": TRACT_SIMPLIFY_METERS},
+        code=[derived_data],
+        outputs=[output_tract_geometry, output_tract_geometry_json]
+        + ([output_tract_geometry_topojson] if args.topojson else []),
+        writer=True
+    )
+
+    graph.run()
+    print("[stages] " + ", ".join(f"{name} {seconds:.1f}s" for name, seconds in graph.seconds.items()))
+
+
+# set in each partition worker by its initializer (inherited, not pickled,
+# when the pool forks)
+_partition_tracts = None
+
+
+def set_partition_tracts(tracts):
+    global _partition_tracts
+    _partition_tracts = tracts
+
+
+def process_partition(month):
+    # projection, tract assignment and classification for one month of both
+    # feeds; returns the month's tract-month rows and cube cells
+    violations = partitions.read_partition(partition_dir / "violations", month)
+    ordinance = partitions.read_partition(partition_dir / "ordinance", month)
+
+    if ordinance is not None:
+        ordinance_merged_gdf = join_acs(ingest.to_projected_points(ordinance), _partition_tracts, jobs=1)
+        partitions.write_partition(ordinance_merged_gdf, output_ordinance_partitioned, month)
+
+    if violations is None:
+        return None
+    violations_merged_gdf = classify_violations(
+        join_acs(ingest.to_projected_points(violations), _partition_tracts, jobs=1)
+    )
+    partitions.write_partition(violations_merged_gdf, output_violations_partitioned, month, VIOLATIONS_SORT)
+    return aggregate_tract_month(violations_merged_gdf), cube.build_cube(violations_merged_gdf)
+
+
+def merge_tract_month(parts):
+    # months are disjoint, so the partial tables only need their category
+    # columns lined up
+    merged = aggregation.align_categories(pd.concat(parts, ignore_index=True))
+    return merged.sort_values(["GEOID", "year_month"]).reset_index(drop=True)
+
+
+def merge_cubes(parts):
+    merged = ingest.concat_chunks(parts)
+    for col in ["violation_category", "INSPECTION CATEGORY"]:
+        if isinstance(merged[col].dtype, pd.CategoricalDtype):
+            merged[col] = merged[col].cat.set_categories(sorted(merged[col].cat.categories))
+    return merged.sort_values(cube.CUBE_KEYS).reset_index(drop=True)
+
+
+def run_partitioned(args):
+    # out-of-core full build: peak memory follows the chunk size and the
+    # largest month, not the size of the feeds
+    chunksize = args.chunksize or 1_000_000
+
+    bounds = [
+        partitions.split_csv(raw_violations, ingest.VIOLATION_COLUMNS, partition_dir / "violations", chunksize),
+        partitions.split_csv(raw_ordinance, ingest.ORDINANCE_COLUMNS, partition_dir / "ordinance", chunksize),
+    ]
+    if args.tract_bbox:
+        bbox = tuple(args.tract_bbox)
+    else:
+        bounds = np.array(bounds)
+        bbox = (*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0))
+    _, tracts = load_acs_tracts(bbox, "EPSG:4326")
+
+    months = sorted(set(partitions.months(partition_dir / "violations")) | set(partitions.months(partition_dir / "ordinance")))
+    print(f"Processing {len(months)} monthly partitions")
+    for output in [output_violations_partitioned, output_ordinance_partitioned]:
+        partitions.clear(output)
+        derived_data.remove(output.with_suffix(".parquet"))
+    # outputs of the full build this one does not write (the projected and
+    # the joined point GeoPackages, the tiles, the watermark): left in place
+    # they would describe older data, and --incremental would patch them
+    # against a watermark the partitions have moved past (without the
+    # watermark it does a full build instead)
+    for stale in [
+        output_violations, output_ordinance, output_violations_acs, output_ordinance_acs,
+        output_tiles, watermark_path,
+    ]:
+        stale.unlink(missing_ok=True)
+
+    jobs = args.jobs or os.cpu_count()
+    with ProcessPoolExecutor(
+        jobs, mp_context=task_graph.pool_context(), initializer=set_partition_tracts, initargs=(tracts,)
+    ) as pool:
+        results = [result for result in pool.map(process_partition, months) if result is not None]
+
+    violations_tract_month = merge_tract_month([tract_month for tract_month, _ in results])
+    write_tract_month(violations_tract_month)
+    violation_cube = merge_cubes([month_cube for _, month_cube in results])
+    derived_data.write_parquet(violation_cube, output_cube)
+    derived_data.write_parquet(cube.build_tract_dimension(violation_cube, tracts), output_tract_dimension)
+    write_tract_geometry(tracts, args.topojson)
+
+    # the snapshot is streamed from the month partitions, so the full
+    # violations table is never loaded
+    month_tables = (
+        partitions.read_partition(output_violations_partitioned, month, dashboard_data.SOURCE_COLUMNS)
+        for month in partitions.in_date_order(months)
+    )
+    dashboard_data.write_snapshot_months(
+        (table for table in month_tables if table is not None), partition_dir / "dashboard", output_dashboard
+    )
+
+
+def run_incremental(args, watermark):
+    # only rows past the watermark are projected, joined, categorized and
+    # appended; the tract-month table is patched for the keys they touch
+    chunksize = args.chunksize or 100_000
+    acs_subset = gpd.read_file(output_income_tract)
+    lookup = tract_lookup.TractLookup(
+        tract_lookup_path, stage_cache.StageCache(cache_dir).file_hash(output_income_tract)
+    )
+
+    new_violations = incremental.read_new_rows(
+        raw_violations, ingest.VIOLATION_COLUMNS, watermark["violations"], chunksize,
+        seen=incremental.seen_ids(output_violations)
+    )
+    new_ordinance = incremental.read_new_rows(
+        raw_ordinance, ingest.ORDINANCE_COLUMNS, watermark["ordinance"], chunksize,
+        seen=incremental.seen_ids(output_ordinance)
+    )
+    print(f"Delta: {len(new_violations)} building and {len(new_ordinance)} ordinance rows")
+
+    # income_tract.gpkg only holds the tracts around the last full run's points
+    minlon, minlat, maxlon, maxlat = (
+        gpd.GeoSeries([box(*acs_subset.total_bounds)], crs=acs_subset.crs).to_crs("EPSG:4326").total_bounds
+    )
+    for new_rows in [new_violations, new_ordinance]:
+        outside = ~new_rows["LONGITUDE"].between(minlon, maxlon) | ~new_rows["LATITUDE"].between(minlat, maxlat)
+        if (outside & new_rows["LONGITUDE"].notna() & new_rows["LATITUDE"].notna()).any():
+            print("Warning: new points fall outside the cached tract subset; run a full rebuild")
+
+    if len(new_ordinance):
+        ordinance_gdf = ingest.to_projected_points(new_ordinance)
+        incremental.append_rows(output_ordinance, ordinance_gdf)
+        ordinance_merged_gdf = join_acs(ordinance_gdf, acs_subset, args.jobs, lookup)
+        incremental.append_rows(output_ordinance_acs, ordinance_merged_gdf)
+        incremental.replace_rows_parquet(output_ordinance_parquet, ordinance_merged_gdf)
+
+    if len(new_violations):
+        violations_gdf = ingest.to_projected_points(new_violations)
+        violations_merged_gdf = join_acs(violations_gdf, acs_subset, args.jobs, lookup)
+        violations_merged_gdf = categorize(violations_merged_gdf)
+        violations_merged_gdf = add_year_month(violations_merged_gdf)
+
+        incremental.append_rows(output_violations, violations_gdf)
+        old_keys = incremental.append_rows(
+            output_violations_acs, violations_merged_gdf,
+            key_columns=("GEOID", "year_month", "LONGITUDE", "LATITUDE")
+        )
+        incremental.replace_rows_parquet(output_violations_parquet, violations_merged_gdf, VIOLATIONS_SORT)
+
+        affected = (
+            pd.concat([old_keys[["GEOID", "year_month"]], violations_merged_gdf[["GEOID", "year_month"]]])
+            .dropna()
+            .drop_duplicates()
+        )
+        months = ", ".join(f"'{month}'" for month in affected["year_month"].unique())
+        month_rows = gpd.read_file(
+            output_violations_acs,
+            columns=["GEOID", "year_month", "violation_category", "INSPECTION CATEGORY", "population", "per_cap_inc"],
+            where=f"year_month IN ({months})",
+            ignore_geometry=True
+        )
+        updated = incremental.update_tract_month(output_tract_month, aggregate_tract_month(month_rows), affected)
+        derived_data.write_parquet(updated, output_tract_month_parquet)
+
+        violation_cube = cube.replace_months(
+            pd.read_parquet(output_cube), cube.build_cube(month_rows), affected["year_month"].unique()
+        )
+        derived_data.write_parquet(violation_cube, output_cube)
+        derived_data.write_parquet(cube.build_tract_dimension(violation_cube, acs_subset), output_tract_dimension)
+        write_dashboard_snapshot()
+
+        if not args.no_tiles:
+            locations = pd.concat([
+                old_keys[["LONGITUDE", "LATITUDE"]],
+                violations_merged_gdf[["LONGITUDE", "LATITUDE"]],
+            ])
+            update_tiles(acs_subset, locations, affected["GEOID"].unique())
+
+    lookup.save()
+    incremental.write_watermark(watermark_path, {
+        "violations": incremental.advance_mark(watermark["violations"], new_violations),
+        "ordinance": incremental.advance_mark(watermark["ordinance"], new_ordinance),
+    })
+
+
+def main():
+    args = parser.parse_args()
+    print(f"Working directory is now: {current_wd}")
+
+    watermark = incremental.read_watermark(watermark_path) if args.incremental else None
+    if args.partitioned:
+        run_partitioned(args)
+    elif watermark is not None:
+        run_incremental(args, watermark)
+    else:
+        run_full(args)
+
+
+if __name__ == "__main__":
+    main()
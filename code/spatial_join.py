@@ -0,0 +1,128 @@
+# Parallel point-in-polygon join of violation points against tracts.
+#
+# Equivalent to gpd.sjoin(points, polygons, how="left", predicate="within"):
+# every point is kept, points inside several polygons are repeated, and points
+# outside every polygon get missing right-hand columns. The polygon layer is
+# first pruned to the bounding box of the points, one STRtree is built over
+# what is left, and point chunks are queried against it in a process pool.
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+import ingest
+import task_graph
+
+# set in the parent before the pool forks, so workers share the tree
+_tree = None
+
+
+def _init_worker(geometries):
+    # only used where fork is unavailable or unsafe: each worker rebuilds the
+    # tree once
+    global _tree
+    shapely.prepare(geometries)
+    _tree = shapely.STRtree(geometries)
+
+
+def _query_chunk(xy, offset):
+    # bounding-box candidates from the tree, then an exact test against the
+    # prepared polygons (point within polygon == polygon contains point)
+    point_idx, polygon_idx = _tree.query(shapely.points(xy))
+    inside = shapely.contains_xy(
+        _tree.geometries[polygon_idx], xy[point_idx, 0], xy[point_idx, 1]
+    )
+    return point_idx[inside] + offset, polygon_idx[inside]
+
+
+def point_xy(points_gdf):
+    # the persisted projected coordinates when they match the layer's CRS,
+    # otherwise decoded from the geometry
+    if set(ingest.PROJECTED_COLUMNS) <= set(points_gdf.columns) and points_gdf.crs == ingest.PROJECTED_CRS:
+        return points_gdf[ingest.PROJECTED_COLUMNS].to_numpy(dtype=np.float64)
+
+    geometries = points_gdf.geometry.to_numpy()
+    # missing / empty points (no coordinates in the feed) stay NaN and match nothing
+    present = ~(shapely.is_missing(geometries) | shapely.is_empty(geometries))
+    xy = np.full((len(geometries), 2), np.nan)
+    xy[present] = shapely.get_coordinates(geometries[present])
+    return xy
+
+
+def prune_to_bounds(polygons_gdf, xy):
+    # positions of the polygons that can contain any of the points
+    if np.isnan(xy).all():
+        return np.array([], dtype=np.intp)
+    minx, miny = np.nanmin(xy, axis=0)
+    maxx, maxy = np.nanmax(xy, axis=0)
+    bounds = polygons_gdf.geometry.bounds
+    keep = (
+        (bounds["minx"] <= maxx) & (bounds["maxx"] >= minx) &
+        (bounds["miny"] <= maxy) & (bounds["maxy"] >= miny)
+    )
+    return np.flatnonzero(keep.to_numpy())
+
+
+def query_pairs(xy, polygons, workers=None, chunksize=250_000):
+    # (point position, polygon position) pairs for every point within a polygon
+    global _tree
+    geometries = polygons.geometry.to_numpy()
+    shapely.prepare(geometries)
+    _tree = shapely.STRtree(geometries)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(xy) <= chunksize:
+        return _query_chunk(xy, 0)
+
+    fork = task_graph.fork_context()
+    if fork is not None:
+        pool = ProcessPoolExecutor(workers, mp_context=fork)
+    else:
+        pool = ProcessPoolExecutor(workers, mp_context=task_graph.pool_context(), initializer=_init_worker, initargs=(geometries,))
+
+    offsets = range(0, len(xy), chunksize)
+    with pool:
+        parts = list(pool.map(_query_chunk, (xy[i:i + chunksize] for i in offsets), offsets))
+
+    return (
+        np.concatenate([point_idx for point_idx, _ in parts]),
+        np.concatenate([polygon_idx for _, polygon_idx in parts]),
+    )
+
+
+def match_xy(xy, polygons_gdf, workers=None, chunksize=250_000):
+    # (point position, polygon position in polygons_gdf) pairs
+    candidates = prune_to_bounds(polygons_gdf, xy)
+    point_idx, polygon_idx = query_pairs(xy, polygons_gdf.iloc[candidates], workers, chunksize)
+    return point_idx, candidates[polygon_idx]
+
+
+def left_join(points_gdf, polygons_gdf, point_idx, polygon_idx):
+    # left-join semantics: unmatched points keep a row with no polygon
+    matched = np.zeros(len(points_gdf), dtype=bool)
+    matched[point_idx] = True
+    unmatched = np.flatnonzero(~matched)
+    left = np.concatenate([point_idx, unmatched])
+    right = np.concatenate([polygon_idx, np.full(len(unmatched), -1)])
+    order = np.lexsort((right, left))
+    left, right = left[order], right[order]
+
+    attributes = polygons_gdf.drop(columns=polygons_gdf.geometry.name)
+    attributes = attributes.reset_index(names="index_right").reset_index(drop=True)
+    right_rows = attributes.reindex(right)
+    right_rows.index = points_gdf.index[left]
+
+    joined = pd.concat([points_gdf.iloc[left], right_rows], axis=1)
+    return gpd.GeoDataFrame(joined, geometry=points_gdf.geometry.name, crs=points_gdf.crs)
+
+
+def sjoin_within(points_gdf, polygons_gdf, workers=None, chunksize=250_000):
+    if points_gdf.crs != polygons_gdf.crs:
+        raise ValueError(f"CRS mismatch: {points_gdf.crs} != {polygons_gdf.crs}")
+
+    point_idx, polygon_idx = match_xy(point_xy(points_gdf), polygons_gdf, workers, chunksize)
+    return left_join(points_gdf, polygons_gdf, point_idx, polygon_idx)
@@ -0,0 +1,95 @@
+# On-disk cache for the preprocessing stages.
+#
+# Each stage is keyed by a hash of
+#   - the contents of the raw files it reads,
+#   - the keys of the upstream stages it consumes,
+#   - its parameters, and
+#   - the source code of the function that computes it (and of any helpers
+#     passed as `code`),
+# so editing the category rules re-runs categorization (and whatever depends
+# on it) but not the ACS merge or the spatial joins.
+
+import hashlib
+import inspect
+import json
+import pickle
+
+
+class StageCache:
+
+    def __init__(self, cache_dir, enabled=True):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.keys = {}
+        self.hits = []
+        self.misses = []
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._file_hashes_path = self.cache_dir / "file_hashes.json"
+        if self._file_hashes_path.exists():
+            with open(self._file_hashes_path) as f:
+                self._file_hashes = json.load(f)
+        else:
+            self._file_hashes = {}
+
+    def file_hash(self, path):
+        # content hash, memoized on (size, mtime) so big raw CSVs are only
+        # re-read when they actually change
+        stat = path.stat()
+        stamp = f"{stat.st_size}:{stat.st_mtime_ns}"
+        memo = self._file_hashes.get(str(path.resolve()))
+        if memo is not None and memo["stamp"] == stamp:
+            return memo["sha256"]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+
+        self._file_hashes[str(path.resolve())] = {"stamp": stamp, "sha256": digest.hexdigest()}
+        with open(self._file_hashes_path, "w") as f:
+            json.dump(self._file_hashes, f, indent=2)
+        return digest.hexdigest()
+
+    def key(self, name, func, files=(), after=(), params=None, code=()):
+        digest = hashlib.sha256(name.encode())
+        for source in [func, *code]:
+            digest.update(inspect.getsource(source).encode())
+        for path in files:
+            digest.update(self.file_hash(path).encode())
+        for upstream in after:
+            digest.update(self.keys[upstream].encode())
+        digest.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+        return digest.hexdigest()[:16]
+
+    def path(self, name, key):
+        return self.cache_dir / f"{name}-{key}.pkl"
+
+    def is_hit(self, name, key, outputs=()):
+        return self.enabled and self.path(name, key).exists() and all(output.exists() for output in outputs)
+
+    def load(self, name, key):
+        with open(self.path(name, key), "rb") as f:
+            return pickle.load(f)
+
+    def store(self, name, key, result):
+        for stale in self.cache_dir.glob(f"{name}-*.pkl"):
+            stale.unlink()
+        with open(self.path(name, key), "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def stage(self, name, func, args=(), files=(), after=(), params=None, outputs=(), code=()):
+        # run `func(*args, **params)` unless a result for the same key is on
+        # disk and every declared output file still exists
+        key = self.key(name, func, files, after, params, code)
+        self.keys[name] = key
+
+        if self.is_hit(name, key, outputs):
+            print(f"[cache] {name}: hit")
+            self.hits.append(name)
+            return self.load(name, key)
+
+        print(f"[cache] {name}: running")
+        self.misses.append(name)
+        result = func(*args, **(params or {}))
+        self.store(name, key, result)
+        return result
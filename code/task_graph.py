@@ -0,0 +1,183 @@
+# A small task graph for the preprocessing stages.
+#
+# Stages are declared in any order with their upstream stages; each one runs
+# as soon as everything it consumes is done, so the building-violations and
+# ordinance branches (read -> join -> ...) run side by side instead of one
+# after the other. There are three kinds of task:
+#   - compute stages run in forked worker processes, at most `jobs` at once;
+#   - writer stages (file outputs) run in one background writer process that
+#     does not count against `jobs`, so writes overlap with compute;
+#   - steps are cheap, uncached glue run in the parent.
+# Workers are forked from the parent, so they see every finished upstream
+# result without it being pickled to them; they hand their own result back
+# through the stage cache pickle, which the parent then loads. With jobs=1,
+# or where fork is not available, everything runs in the parent, in
+# declaration order.
+
+import multiprocessing
+import sys
+import time
+from multiprocessing.connection import wait
+
+
+def fork_context():
+    # the fork start method, or None where it is missing (Windows) or unsafe
+    # (macOS, where system frameworks may crash in a forked child)
+    if sys.platform == "darwin" or "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context("fork")
+
+
+def pool_context():
+    # for process pools whose workers get their inputs through an
+    # initializer: fork where it is safe, spawn elsewhere
+    return fork_context() or multiprocessing.get_context("spawn")
+
+
+class Ref:
+    # placeholder for the result (or one element of the result) of a task
+    def __init__(self, name, index=None):
+        self.name = name
+        self.index = index
+
+
+def _refs(value):
+    if isinstance(value, Ref):
+        return [value.name]
+    if isinstance(value, (list, tuple)):
+        return [name for item in value for name in _refs(item)]
+    if isinstance(value, dict):
+        return [name for item in value.values() for name in _refs(item)]
+    return []
+
+
+class Task:
+    def __init__(self, name, func, args, kind, files=(), after=(), params=None, outputs=(), code=()):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kind = kind
+        self.files = files
+        self.after = list(after)
+        self.params = params
+        self.outputs = outputs
+        self.code = code
+        self.deps = set(self.after) | set(_refs(args)) | set(_refs(params))
+        self.key = None
+
+
+class TaskGraph:
+
+    def __init__(self, cache, jobs=1):
+        self.cache = cache
+        self.context = fork_context() if jobs > 1 else None
+        if jobs > 1 and self.context is None:
+            print("[stages] fork is not available here, running the stages serially")
+        self.jobs = max(1, jobs) if self.context else 1
+        self.tasks = {}
+        self.results = {}
+        self.seconds = {}
+
+    def stage(self, name, func, args=(), files=(), after=(), params=None, outputs=(), code=(), writer=False):
+        # a cached stage, as in StageCache.stage; `args` and `params` may hold
+        # Refs, which also count as upstream stages
+        kind = "writer" if writer else "compute"
+        self.tasks[name] = Task(name, func, args, kind, files, after, params, outputs, code)
+
+    def step(self, name, func, args=(), after=()):
+        self.tasks[name] = Task(name, func, args, "step", after=after)
+
+    def resolve(self, value):
+        if isinstance(value, Ref):
+            result = self.results[value.name]
+            return result if value.index is None else result[value.index]
+        if isinstance(value, list):
+            return [self.resolve(item) for item in value]
+        if isinstance(value, tuple):
+            return tuple(self.resolve(item) for item in value)
+        if isinstance(value, dict):
+            return {key: self.resolve(item) for key, item in value.items()}
+        return value
+
+    def call(self, task):
+        return task.func(*self.resolve(task.args), **self.resolve(task.params or {}))
+
+    def start(self, task):
+        # returns True when the task finished in the parent (hit, step, or
+        # jobs=1), otherwise the worker process it was handed to
+        if task.kind == "step":
+            self.results[task.name] = self.call(task)
+            return True
+
+        params = self.resolve(task.params)
+        # upstream keys are known by now, since every upstream task has started;
+        # steps are not cached and pass their results in through `params`
+        upstream = sorted(dep for dep in task.deps if self.tasks[dep].kind != "step")
+        task.key = self.cache.key(task.name, task.func, task.files, upstream, params, task.code)
+        self.cache.keys[task.name] = task.key
+
+        if self.cache.is_hit(task.name, task.key, task.outputs):
+            print(f"[cache] {task.name}: hit")
+            self.cache.hits.append(task.name)
+            self.results[task.name] = self.cache.load(task.name, task.key)
+            return True
+
+        print(f"[cache] {task.name}: running")
+        self.cache.misses.append(task.name)
+        if self.jobs == 1:
+            self.results[task.name] = self.call(task)
+            self.cache.store(task.name, task.key, self.results[task.name])
+            return True
+
+        process = self.context.Process(target=self._work, args=(task,), name=task.name)
+        process.start()
+        return process
+
+    def _work(self, task):
+        self.cache.store(task.name, task.key, self.call(task))
+
+    def finish(self, task, process, running):
+        process.join()
+        if process.exitcode != 0:
+            for other in running:
+                other.terminate()
+            raise RuntimeError(f"stage {task.name} failed (exit code {process.exitcode})")
+        self.results[task.name] = self.cache.load(task.name, task.key)
+
+    def run(self):
+        pending = dict(self.tasks)
+        running = {}
+        started = {}
+
+        while pending or running:
+            progressed = False
+            for name, task in list(pending.items()):
+                if not task.deps <= self.results.keys():
+                    continue
+                if task.kind != "step" and self.jobs > 1:
+                    busy = sum(1 for other in running.values() if other.kind == task.kind)
+                    if busy >= (1 if task.kind == "writer" else self.jobs):
+                        continue
+
+                del pending[name]
+                started[name] = time.perf_counter()
+                process = self.start(task)
+                if process is True:
+                    self.seconds[name] = time.perf_counter() - started[name]
+                else:
+                    running[process] = task
+                progressed = True
+                break
+
+            if progressed:
+                continue
+            if not running:
+                raise RuntimeError(f"unresolvable dependencies: {sorted(pending)}")
+
+            for sentinel in wait([process.sentinel for process in running]):
+                process = next(process for process in running if process.sentinel == sentinel)
+                task = running.pop(process)
+                self.finish(task, process, running)
+                self.seconds[task.name] = time.perf_counter() - started[task.name]
+
+        return self.results
@@ -0,0 +1,111 @@
+# Serves the vector tiles written by preprocessing.py to the dashboard map.
+#
+#     python tile_server.py [--port 8765] [--host 127.0.0.1]
+#
+# It listens on the loopback interface only, for the dashboard on this
+# machine; pass --host (e.g. 0.0.0.0) to serve the tiles to other hosts.
+#
+# GET /{z}/{x}/{y}.pbf returns the gzipped tile (204 when the tile is empty)
+# and GET /metadata.json the MBTiles metadata. Only the standard library is
+# used, so it can run next to the Streamlit server without extra packages.
+# app.py only offers the vector tile map while this server answers at
+# VIOLATION_TILE_URL (default: tile_url()).
+
+import argparse
+import json
+import re
+import sqlite3
+import urllib.request
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import derived_data
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+TILE_PATH = re.compile(r"^/(\d+)/(\d+)/(\d+)\.pbf$")
+
+
+def tile_url(host="localhost", port=DEFAULT_PORT):
+    return f"http://{host}:{port}/{{z}}/{{x}}/{{y}}.pbf"
+
+
+def metadata_url(url):
+    # the metadata endpoint of a .../{z}/{x}/{y}.pbf tile URL template
+    return url.split("{z}", 1)[0] + "metadata.json"
+
+
+def is_serving(url, timeout=0.5):
+    # whether a tile server answers at the tile URL template `url`
+    try:
+        with urllib.request.urlopen(metadata_url(url), timeout=timeout) as response:
+            return response.status == 200
+    except (OSError, ValueError):
+        return False
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    def __init__(self, *args, mbtiles, **kwargs):
+        self.mbtiles = mbtiles
+        super().__init__(*args, **kwargs)
+
+    def connect(self):
+        return sqlite3.connect(f"file:{self.mbtiles}?mode=ro", uri=True)
+
+    def send(self, status, body=b"", content_type=None, gzipped=False):
+        self.send_response(status)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metadata.json":
+            con = self.connect()
+            try:
+                metadata = dict(con.execute("SELECT name, value FROM metadata"))
+            finally:
+                con.close()
+            self.send(200, json.dumps(metadata).encode(), "application/json")
+            return
+
+        match = TILE_PATH.match(path)
+        if match is None:
+            self.send(404)
+            return
+
+        z, x, y = (int(part) for part in match.groups())
+        con = self.connect()
+        try:
+            row = con.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, 2 ** z - 1 - y)
+            ).fetchone()
+        finally:
+            con.close()
+
+        if row is None:
+            self.send(204)
+        else:
+            self.send(200, row[0], "application/x-protobuf", gzipped=True)
+
+
+def serve(mbtiles, port=DEFAULT_PORT, host=DEFAULT_HOST):
+    server = ThreadingHTTPServer((host, port), partial(TileHandler, mbtiles=mbtiles))
+    print(f"Serving {mbtiles} at {tile_url(host=host, port=port)}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the violation vector tiles")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help="interface to listen on (default: loopback only; 0.0.0.0 for every interface)")
+    parser.add_argument("--mbtiles", default=derived_data.DERIVED_DIR / f"{derived_data.TILES}.mbtiles")
+    args = parser.parse_args()
+    serve(args.mbtiles, args.port, args.host)
@@ -0,0 +1,270 @@
+# Mapbox Vector Tile pyramid for the dashboard map.
+#
+# The violation points and the tract polygons are cut into web-mercator tiles
+# and stored in one MBTiles file (an SQLite database, see
+# https://github.com/mapbox/mbtiles-spec), which tile_server.py serves to the
+# pydeck MVTLayer in app.py. The map then only downloads the tiles in view.
+# Tract polygons are simplified to about one screen pixel at every zoom;
+# points are only tiled from POINT_ZOOMS[0] in, below that the tract layer
+# (which carries per-category counts) is the overview.
+
+import gzip
+import json
+import sqlite3
+from contextlib import closing
+
+import mapbox_vector_tile
+import numpy as np
+import pandas as pd
+import shapely
+
+import ingest
+
+WEB_MERCATOR = "EPSG:3857"
+ORIGIN = 20037508.342789244
+EXTENT = 4096
+# clip polygons a little outside each tile so outlines do not show seams
+BUFFER = 64
+
+POINT_ZOOMS = range(12, 15)
+TRACT_ZOOMS = range(8, 15)
+
+POINTS_LAYER = "violations"
+TRACTS_LAYER = "tracts"
+
+
+def tile_size(zoom):
+    return 2 * ORIGIN / 2 ** zoom
+
+
+def tile_bounds(zoom, x, y):
+    size = tile_size(zoom)
+    minx = -ORIGIN + x * size
+    maxy = ORIGIN - y * size
+    return (minx, maxy - size, minx + size, maxy)
+
+
+def tile_xy(x, y, zoom):
+    # tile column / row (XYZ scheme, row 0 at the top) of mercator coordinates
+    size = tile_size(zoom)
+    last = 2 ** zoom - 1
+    tx = np.clip(np.floor((x + ORIGIN) / size), 0, last).astype(np.int64)
+    ty = np.clip(np.floor((ORIGIN - y) / size), 0, last).astype(np.int64)
+    return tx, ty
+
+
+def records(df):
+    # MVT has no null value, so missing properties are left off the feature
+    return [
+        {key: value for key, value in row.items() if not pd.isna(value)}
+        for row in df.to_dict("records")
+    ]
+
+
+def tile_codes(tx, ty, zoom):
+    # one integer per tile of a zoom level
+    return tx * 2 ** zoom + ty
+
+
+def in_tiles(tx, ty, zoom, keys):
+    # which of the (tx, ty) tiles of `zoom` are among the (z, x, y) `keys`
+    wanted = [tile_codes(x, y, z) for z, x, y in keys if z == zoom]
+    return np.isin(tile_codes(tx, ty, zoom), wanted)
+
+
+def point_xy(points):
+    points = points[points["LONGITUDE"].notna() & points["LATITUDE"].notna()]
+    x, y = ingest.transformer(WEB_MERCATOR).transform(
+        points["LONGITUDE"].to_numpy(dtype=np.float64),
+        points["LATITUDE"].to_numpy(dtype=np.float64)
+    )
+    return points, x, y
+
+
+def point_tile_keys(points, zooms=POINT_ZOOMS):
+    # the (z, x, y) tiles holding the LONGITUDE / LATITUDE of `points`
+    _, x, y = point_xy(points)
+    return {
+        (zoom, int(tx), int(ty))
+        for zoom in zooms
+        for tx, ty in set(zip(*tile_xy(x, y, zoom)))
+    }
+
+
+def point_features(points, zooms=POINT_ZOOMS, only=None):
+    # {(z, x, y): [feature, ...]} for a frame with LONGITUDE / LATITUDE
+    # columns; with `only`, just those tiles (and only their points' features
+    # are built)
+    points, x, y = point_xy(points)
+    cells = {zoom: tile_xy(x, y, zoom) for zoom in zooms}
+    if only is not None:
+        wanted = np.zeros(len(points), dtype=bool)
+        for zoom, (tx, ty) in cells.items():
+            wanted |= in_tiles(tx, ty, zoom, only)
+        points, x, y = points[wanted], x[wanted], y[wanted]
+        cells = {zoom: (tx[wanted], ty[wanted]) for zoom, (tx, ty) in cells.items()}
+
+    geometries = shapely.points(x, y)
+    properties = records(points.drop(columns=["LONGITUDE", "LATITUDE"]))
+
+    tiles = {}
+    for zoom, (tx, ty) in cells.items():
+        order = np.lexsort([ty, tx])
+        keys = np.column_stack([tx[order], ty[order]])
+        starts = np.flatnonzero(np.r_[True, (np.diff(keys, axis=0) != 0).any(axis=1)])
+        for start, end in zip(starts, np.r_[starts[1:], len(order)]):
+            key = (zoom, *keys[start])
+            if only is not None and key not in only:
+                continue
+            rows = order[start:end]
+            tiles[key] = [
+                {"geometry": geometries[row], "properties": properties[row]}
+                for row in rows
+            ]
+    return tiles
+
+
+def polygon_tiles(geometries, zoom):
+    # one (polygon, tile column, tile row) triple per tile each polygon's
+    # bbox touches
+    bounds = shapely.bounds(geometries)
+    x0, y1 = tile_xy(bounds[:, 0], bounds[:, 1], zoom)
+    x1, y0 = tile_xy(bounds[:, 2], bounds[:, 3], zoom)
+    widths, heights = x1 - x0 + 1, y1 - y0 + 1
+    polygon = np.repeat(np.arange(len(geometries)), widths * heights)
+    offset = np.arange(len(polygon)) - np.repeat(np.cumsum(widths * heights) - widths * heights, widths * heights)
+    return polygon, x0[polygon] + offset % widths[polygon], y0[polygon] + offset // widths[polygon]
+
+
+def polygon_tile_keys(polygons, zooms=TRACT_ZOOMS):
+    # the (z, x, y) tiles the polygons may show up in
+    geometries = polygons.to_crs(WEB_MERCATOR).geometry.to_numpy()
+    return {
+        (zoom, int(x), int(y))
+        for zoom in zooms
+        for x, y in set(zip(*polygon_tiles(geometries, zoom)[1:]))
+    }
+
+
+def polygon_features(polygons, zooms=TRACT_ZOOMS, only=None):
+    # {(z, x, y): [feature, ...]} for a GeoDataFrame of polygons, simplified
+    # per zoom and clipped to (slightly buffered) tile bounds; with `only`,
+    # just those tiles
+    polygons = polygons.to_crs(WEB_MERCATOR)
+    properties = records(polygons.drop(columns=polygons.geometry.name))
+    geometries = polygons.geometry.to_numpy()
+
+    tiles = {}
+    for zoom in zooms:
+        size = tile_size(zoom)
+        simplified = shapely.simplify(geometries, size / 256, preserve_topology=True)
+        polygon, tx, ty = polygon_tiles(simplified, zoom)
+        if only is not None:
+            wanted = in_tiles(tx, ty, zoom, only)
+            polygon, tx, ty = polygon[wanted], tx[wanted], ty[wanted]
+
+        margin = size * BUFFER / EXTENT
+        minx = -ORIGIN + tx * size - margin
+        maxy = ORIGIN - ty * size + margin
+        clipped = shapely.intersection(
+            simplified[polygon],
+            shapely.box(minx, maxy - size - 2 * margin, minx + size + 2 * margin, maxy)
+        )
+        keep = ~shapely.is_empty(clipped)
+        for row, x, y, geometry in zip(polygon[keep], tx[keep], ty[keep], clipped[keep]):
+            tiles.setdefault((zoom, x, y), []).append(
+                {"geometry": geometry, "properties": properties[row]}
+            )
+    return tiles
+
+
+def field_types(df):
+    # the MBTiles "vector_layers" field description of a layer's properties
+    return {
+        col: "Number" if pd.api.types.is_numeric_dtype(df[col]) else "String"
+        for col in df.columns
+    }
+
+
+def encode_tile(zoom, x, y, layers):
+    return mapbox_vector_tile.encode(
+        [{"name": name, "features": features} for name, features in layers.items()],
+        default_options={"quantize_bounds": tile_bounds(zoom, x, y), "extents": EXTENT}
+    )
+
+
+def tile_rows(tiles):
+    # MBTiles rows are TMS, so the row index is flipped
+    return (
+        (int(z), int(x), int(2 ** z - 1 - y), gzip.compress(encode_tile(z, x, y, layers)))
+        for (z, x, y), layers in sorted(tiles.items())
+    )
+
+
+def write_mbtiles(path, tiles, metadata):
+    # tiles: {(z, x, y): {layer name: features}}
+    path.unlink(missing_ok=True)
+    with closing(sqlite3.connect(path)) as con:
+        con.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+        con.execute(
+            "CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)"
+        )
+        con.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
+        con.executemany("INSERT INTO metadata VALUES (?, ?)", metadata.items())
+        con.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)", tile_rows(tiles))
+        con.commit()
+
+
+def layered_tiles(points, tracts, only=None):
+    tiles = {}
+    for layer, layer_tiles in [
+        (TRACTS_LAYER, polygon_features(tracts, only=only)),
+        (POINTS_LAYER, point_features(points, only=only)),
+    ]:
+        for key, features in layer_tiles.items():
+            tiles.setdefault(key, {})[layer] = features
+    return tiles
+
+
+def tile_metadata(points, tracts, name):
+    minlon, minlat, maxlon, maxlat = tracts.to_crs("EPSG:4326").total_bounds
+    zooms = [*TRACT_ZOOMS, *POINT_ZOOMS]
+    return {
+        "name": name,
+        "format": "pbf",
+        "type": "overlay",
+        "minzoom": str(min(zooms)),
+        "maxzoom": str(max(zooms)),
+        "bounds": ",".join(str(round(value, 6)) for value in [minlon, minlat, maxlon, maxlat]),
+        "json": json.dumps({"vector_layers": [
+            {"id": TRACTS_LAYER, "fields": field_types(tracts.drop(columns=tracts.geometry.name)),
+             "minzoom": min(TRACT_ZOOMS), "maxzoom": max(TRACT_ZOOMS)},
+            {"id": POINTS_LAYER, "fields": field_types(points.drop(columns=["LONGITUDE", "LATITUDE"])),
+             "minzoom": min(POINT_ZOOMS), "maxzoom": max(POINT_ZOOMS)},
+        ]}),
+    }
+
+
+def build_tiles(points, tracts, path, name="violations"):
+    # points: frame with LONGITUDE / LATITUDE plus the properties to tile;
+    # tracts: GeoDataFrame of polygons plus their properties
+    tiles = layered_tiles(points, tracts)
+    write_mbtiles(path, tiles, tile_metadata(points, tracts, name))
+    return len(tiles)
+
+
+def update_tiles(points, tracts, path, touched, name="violations"):
+    # re-encode only the `touched` (z, x, y) tiles from the current points
+    # and tracts and leave every other tile of the MBTiles file as it is
+    # (a touched tile left with no features is dropped)
+    tiles = layered_tiles(points, tracts, only=touched)
+    with closing(sqlite3.connect(path)) as con:
+        con.executemany(
+            "DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            ((int(z), int(x), int(2 ** z - 1 - y)) for z, x, y in touched)
+        )
+        con.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)", tile_rows(tiles))
+        con.execute("DELETE FROM metadata")
+        con.executemany("INSERT INTO metadata VALUES (?, ?)", tile_metadata(points, tracts, name).items())
+        con.commit()
+    return len(tiles)
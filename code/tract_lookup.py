@@ -0,0 +1,84 @@
+# Persistent (LONGITUDE, LATITUDE) -> tract lookup in front of the spatial join.
+#
+# The same buildings appear in both feeds and on every run, so the tract
+# positions found for a coordinate pair are saved and reused; only coordinates
+# that have never been seen go through point-in-polygon testing. The saved
+# table is tied to a key of the tract layer (the content hash of
+# income_tract.gpkg) and is discarded whenever that layer changes.
+
+import numpy as np
+import pandas as pd
+
+import spatial_join
+
+KEY_COLUMNS = ["LONGITUDE", "LATITUDE"]
+
+
+class TractLookup:
+
+    def __init__(self, path, tracts_key, enabled=True):
+        self.path = path
+        self.tracts_key = tracts_key
+        self.stats = []
+        # one row per (coordinate, tract) match; tract -1 means "in no tract"
+        self.table = pd.DataFrame({
+            "LONGITUDE": np.array([], dtype=np.float64),
+            "LATITUDE": np.array([], dtype=np.float64),
+            "tract": np.array([], dtype=np.int64),
+        })
+
+        if enabled and path.exists():
+            saved = np.load(path)
+            if str(saved["tracts_key"]) == tracts_key:
+                self.table = pd.DataFrame({col: saved[col] for col in self.table.columns})
+
+    def save(self):
+        np.savez(
+            self.path,
+            tracts_key=np.array(self.tracts_key),
+            **{col: self.table[col].to_numpy() for col in self.table.columns}
+        )
+
+    def absorb(self, found):
+        # add matches learned by a copy of this lookup (e.g. in a worker process)
+        self.table = (
+            pd.concat([self.table, found], ignore_index=True)
+            .drop_duplicates()
+            .reset_index(drop=True)
+        )
+
+    def sjoin_within(self, points_gdf, polygons_gdf, workers=None, chunksize=250_000):
+        # drop-in for spatial_join.sjoin_within(points_gdf, polygons_gdf)
+        keys = pd.DataFrame({col: points_gdf[col].to_numpy(np.float64) for col in KEY_COLUMNS})
+        unique = keys.drop_duplicates()
+
+        seen = unique.merge(self.table[KEY_COLUMNS].drop_duplicates(), on=KEY_COLUMNS, how="left", indicator=True)
+        new_rows = unique.index[(seen["_merge"] == "left_only").to_numpy()]
+
+        if len(new_rows):
+            # one representative row per unseen coordinate goes through the join
+            xy = spatial_join.point_xy(points_gdf.iloc[new_rows])
+            point_idx, polygon_idx = spatial_join.match_xy(xy, polygons_gdf, workers, chunksize)
+            matched = np.zeros(len(new_rows), dtype=bool)
+            matched[point_idx] = True
+            found = pd.concat([
+                # points inside several tracts contribute one row per tract
+                keys.iloc[new_rows[point_idx]].assign(tract=polygon_idx),
+                keys.iloc[new_rows[~matched]].assign(tract=-1),
+            ], ignore_index=True)
+
+            self.table = pd.concat([self.table, found], ignore_index=True)
+
+        self.stats.append({
+            "rows": len(keys),
+            "unique_locations": len(unique),
+            "cached_locations": len(unique) - len(new_rows),
+            "hit_rate": round(1 - len(new_rows) / max(len(unique), 1), 4),
+        })
+        print(f"[tract lookup] {self.stats[-1]}")
+
+        pairs = keys.reset_index(names="point").merge(self.table, on=KEY_COLUMNS, how="inner")
+        pairs = pairs[pairs["tract"] >= 0]
+        return spatial_join.left_join(
+            points_gdf, polygons_gdf, pairs["point"].to_numpy(), pairs["tract"].to_numpy()
+        )
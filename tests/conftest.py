@@ -0,0 +1,7 @@
+# The modules under code/ are run as scripts from that directory and import
+# each other by bare name, so the tests put it on the import path the same way.
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "code"))
@@ -0,0 +1,60 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import aggregation
+
+QUINTILES = ["Q1 (Lowest)", "Q2", "Q3", "Q4", "Q5 (Highest)"]
+
+
+# the groupby.apply form weighted_mean replaced
+def weighted_mean_apply(df, by, value, weight, name):
+    return (
+        df
+        .groupby(by, observed=True)
+        .apply(lambda x: pd.Series({
+            name: (x[value] * x[weight]).sum() / x[weight].sum()
+        }))
+        .reset_index()
+    )
+
+
+def tract_shares(rows=500, seed=0):
+    # tract x inspection-category rows with missing keys, missing values and
+    # zero-population tracts whose rates are inf
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "income_quintile": pd.Categorical(rng.choice(QUINTILES, rows), categories=QUINTILES, ordered=True),
+        "INSPECTION CATEGORY": rng.choice(np.array(["COMPLAINT", "PERIODIC", "PERMIT", None], dtype=object), rows),
+        "category_share": rng.random(rows),
+        "population": rng.integers(0, 8000, rows).astype(float),
+    })
+    df.loc[df.sample(frac=0.05, random_state=seed).index, "category_share"] = np.nan
+    zero = df.sample(frac=0.02, random_state=seed + 1).index
+    df.loc[zero, "population"] = 0
+    df.loc[zero, "category_share"] = np.inf
+    return df
+
+
+def test_weighted_mean_matches_groupby_apply():
+    df = tract_shares()
+    for by in ["income_quintile", ["income_quintile", "INSPECTION CATEGORY"]]:
+        expected = weighted_mean_apply(df, by, "category_share", "population", "weighted_share")
+        result = aggregation.weighted_mean(df, by, "category_share", "population", "weighted_share")
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_categorical=False)
+
+
+def test_weighted_mean_keeps_inf_and_warns_nothing():
+    df = pd.DataFrame({
+        "key": ["a", "a", "b", "b", "c"],
+        "rate": [np.inf, 1.0, np.inf, 2.0, np.nan],
+        "population": [0.0, 10.0, 5.0, 5.0, 0.0],
+    })
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        result = aggregation.weighted_mean(df, "key", "rate", "population", "mean")
+    with np.errstate(all="ignore"):
+        expected = weighted_mean_apply(df, "key", "rate", "population", "mean")
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+    assert result["mean"].tolist()[1] == np.inf
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+import categories
+
+
+# the np.select rules the classifier replaced: one str.contains scan per rule
+def np_select_categories(descriptions):
+    desc = descriptions.str.upper()
+    conditions = [desc.str.contains("|".join(keywords), na=False) for _, keywords in categories.CATEGORY_RULES]
+    choices = [label for label, _ in categories.CATEGORY_RULES]
+    return np.select(conditions, choices, default=categories.DEFAULT_CATEGORY)
+
+
+DESCRIPTIONS = pd.Series([
+    "ARRANGE PREMISE INSPECTION",
+    "REPAIR PORCH SYSTEM",
+    "smoke and carbon monoxide detectors",
+    "REPAIR OR REPLACE DEFECTIVE WINDOWS",
+    "POST OWNER/MANAGER NAME",
+    "MAINTAIN OR REPAIR ELECTRICAL SYSTEM",
+    "RODENT INFESTATION - RATS",
+    "PROVIDE ADEQUATE HEAT",
+    "REPAIR PLUMBING FIXTURES",
+    "STOP WORK WITHOUT PERMIT",
+    # several rules match: the first rule wins
+    "FIRE DOOR WITH DEFECTIVE WIRING",
+    "WATER HEATER VENT",
+    None,
+    "REPAIR PORCH SYSTEM",
+    "",
+], index=range(100, 115))
+
+
+def test_classify_matches_np_select_rules():
+    result = categories.classify(DESCRIPTIONS)
+    assert list(result.astype(str)) == list(np_select_categories(DESCRIPTIONS))
+
+
+def test_classify_keeps_index_and_sorted_categories():
+    result = categories.classify(DESCRIPTIONS)
+    assert result.index.equals(DESCRIPTIONS.index)
+    assert result.name == "violation_category"
+    assert list(result.cat.categories) == sorted(result.cat.categories)
+
+
+def test_missing_description_gets_default_category():
+    result = categories.classify(pd.Series([None, np.nan], dtype=object))
+    assert list(result) == [categories.DEFAULT_CATEGORY] * 2
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dashboard_data
+import derived_data
+
+CATEGORIES = ["Electrical", "Heating / HVAC / Boilers", "Plumbing & Water", "Other / Misc"]
+STATUSES = ["OPEN", "COMPLIED", "NO ENTRY"]
+INSPECTIONS = ["COMPLAINT", "PERIODIC", "PERMIT"]
+
+
+def violations(rows=2000, seed=0):
+    # the violations columns the dashboard reads, in file order, with missing
+    # dates, tracts and categories
+    rng = np.random.default_rng(seed)
+    dates = pd.Series(pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 800, rows), unit="D"))
+    df = pd.DataFrame({
+        "VIOLATION DATE": dates.dt.strftime("%m/%d/%Y"),
+        "VIOLATION DESCRIPTION": rng.choice(["REPAIR PORCH", "ARRANGE PREMISES", "POST OWNER NAME"], rows),
+        "VIOLATION STATUS": rng.choice(STATUSES, rows),
+        "INSPECTION CATEGORY": rng.choice(INSPECTIONS, rows),
+        "violation_category": rng.choice(CATEGORIES, rows),
+        "GEOID": [f"17031{tract:06d}" for tract in rng.integers(100, 999999, rows)],
+        "LONGITUDE": rng.uniform(-87.9, -87.5, rows),
+        "LATITUDE": rng.uniform(41.6, 42.0, rows),
+    })
+    df.loc[rng.random(rows) < 0.02, "VIOLATION DATE"] = None
+    df.loc[rng.random(rows) < 0.02, "GEOID"] = None
+    df.loc[rng.random(rows) < 0.02, "violation_category"] = None
+    return df
+
+
+def or_none(values):
+    return [None if pd.isna(value) else value for value in values]
+
+
+@pytest.fixture(scope="module")
+def source():
+    return derived_data.apply_filters(violations(), dashboard_data.FILTERS).reset_index(drop=True)
+
+
+def test_compact_round_trips_display_values(source):
+    frame = dashboard_data.compact(source)
+    shown = dashboard_data.for_display(frame)
+
+    dates = pd.to_datetime(source["VIOLATION DATE"]).dt.strftime("%Y-%m-%d")
+    assert or_none(shown["violation_date"]) == or_none(dates)
+    assert or_none(shown["GEOID"]) == or_none(source["GEOID"])
+    for col in dashboard_data.COORDINATE_COLUMNS:
+        np.testing.assert_allclose(shown[col], source[col], atol=1e-5)
+    assert frame["violation_status"].tolist() == source["VIOLATION STATUS"].tolist()
+
+
+def test_snapshot_round_trip(source, tmp_path):
+    path = tmp_path / "dashboard.arrow"
+    dashboard_data.write_snapshot(source, path)
+    expected = dashboard_data.sort_rows(dashboard_data.compact(source))
+    pd.testing.assert_frame_equal(dashboard_data.read_snapshot(path), expected)
+
+
+@pytest.mark.parametrize("selection", [
+    {"categories": ["Electrical"]},
+    {"categories": ["Electrical", "Plumbing & Water"], "statuses": ["OPEN"]},
+    {"statuses": ["OPEN", "NO ENTRY"], "inspection_categories": ["PERIODIC"]},
+    {"categories": ["Heating / HVAC / Boilers"], "months": ("2024-03", "2024-09")},
+    {"inspection_categories": ["PERMIT"], "months": ("2025-01", "2025-01")},
+])
+def test_select_matches_boolean_masks(source, selection):
+    data = dashboard_data.DashboardData(dashboard_data.compact(source))
+    frame = data.frame
+
+    keep = np.ones(len(frame), dtype=bool)
+    for column, key in zip(dashboard_data.MASK_COLUMNS, ["categories", "statuses", "inspection_categories"]):
+        if key in selection:
+            keep &= frame[column].isin(selection[key]).to_numpy()
+    if "months" in selection:
+        # month ranges are per category, so rows without one are never in them
+        first, last = selection["months"]
+        months = pd.Series(or_none(dashboard_data.day_strings(frame["violation_date"])), dtype=object).str[:7]
+        keep &= ((months >= first) & (months <= last)).fillna(False).to_numpy()
+        keep &= frame["violation_category"].notna().to_numpy()
+
+    result = data.select(**selection)
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), frame[keep].reset_index(drop=True))
+
+
+def test_snapshot_written_by_month_matches_whole_table(tmp_path):
+    df = violations(seed=1)
+    month = pd.to_datetime(df["VIOLATION DATE"]).dt.to_period("M")
+    months = [df[month.isna()]] + [df[month == value] for value in sorted(month.dropna().unique())]
+
+    dashboard_data.write_snapshot(df, tmp_path / "whole.arrow")
+    dashboard_data.write_snapshot_months(iter(months), tmp_path / "scratch", tmp_path / "months.arrow")
+
+    pd.testing.assert_frame_equal(
+        dashboard_data.read_snapshot(tmp_path / "months.arrow"),
+        dashboard_data.read_snapshot(tmp_path / "whole.arrow"),
+    )
+    assert not (tmp_path / "scratch").exists()
@@ -0,0 +1,104 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import Point
+
+import derived_data
+import incremental
+
+
+def points(ids, values):
+    return gpd.GeoDataFrame(
+        {"ID": ids, "value": values},
+        geometry=[Point(i, i) for i in range(len(ids))],
+        crs="ESRI:102003"
+    )
+
+
+def test_replace_rows_parquet_rewrites_only_parts_with_replaced_ids(tmp_path, monkeypatch):
+    monkeypatch.setattr(derived_data, "PARQUET_PART_ROWS", 2)
+    path = tmp_path / "points.parquet"
+    derived_data.write_parquet_parts(points(["1", "2", "3", "4"], [1, 2, 3, 4]), path)
+    untouched = (path / "part-00001.parquet").stat().st_mtime_ns
+
+    incremental.replace_rows_parquet(path, points(["2", "5"], [20, 5]))
+
+    assert sorted(p.name for p in path.iterdir()) == ["part-00000.parquet", "part-00001.parquet", "part-00002.parquet"]
+    assert (path / "part-00001.parquet").stat().st_mtime_ns == untouched
+    result = gpd.read_parquet(path).sort_values("ID")
+    assert list(result["ID"]) == ["1", "2", "3", "4", "5"]
+    assert list(result["value"]) == [1, 20, 3, 4, 5]
+
+
+def test_replace_rows_parquet_converts_a_single_file(tmp_path):
+    path = tmp_path / "points.parquet"
+    points(["1", "2"], [1, 2]).to_parquet(path, index=False)
+
+    incremental.replace_rows_parquet(path, points(["1"], [10]))
+
+    result = gpd.read_parquet(path).sort_values("ID")
+    assert list(result["value"]) == [10, 2]
+
+
+def test_is_new_picks_up_unseen_ids_without_a_stamp():
+    df = pd.DataFrame({
+        "ID": ["1", "2", "3", "4"],
+        "HEARING DATE": pd.to_datetime(["2025-01-01", "2025-02-01", None, None]),
+    })
+    mark = {"column": "HEARING DATE", "value": "2025-02-01T00:00:00", "ids": ["2"]}
+
+    assert list(incremental.is_new(df, mark)) == [False, False, False, False]
+    assert list(incremental.is_new(df, mark, seen=pd.Index(["1", "2", "3"]))) == [False, False, False, True]
+
+
+def hearings(ids, dates):
+    return pd.DataFrame({"ID": ids, "HEARING DATE": pd.to_datetime(dates)})
+
+
+def test_advance_mark_keeps_the_later_mark_for_old_stamped_new_ids():
+    mark = incremental.compute_mark(hearings(["1", "2"], ["2026-07-26", "2026-07-26"]))
+    # unseen IDs count as new whatever their stamp
+    advanced = incremental.advance_mark(mark, hearings(["7", "8"], ["2025-01-15", "2025-01-15"]))
+    assert advanced == mark
+
+
+def test_advance_mark_merges_ids_stamped_at_the_mark():
+    mark = incremental.compute_mark(hearings(["1", "2"], ["2026-07-26", "2026-07-01"]))
+    advanced = incremental.advance_mark(mark, hearings(["3", "1"], ["2026-07-26", "2026-07-26"]))
+    assert advanced["value"] == mark["value"]
+    assert advanced["ids"] == ["1", "3"]
+
+    later = incremental.advance_mark(advanced, hearings(["4"], ["2026-08-01"]))
+    assert later["value"] == pd.Timestamp("2026-08-01").isoformat()
+    assert later["ids"] == ["4"]
+
+
+def tract_month(categories, population):
+    df = pd.DataFrame({"GEOID": ["17031000100", "17031000200"], "year_month": "2024-01", **categories})
+    df["violations_count"] = df[list(categories)].sum(axis=1)
+    df["population"] = population
+    df["per_cap_inc"] = 30000.0
+    df["violations_per_1000"] = df["violations_count"] / df["population"] * 1000
+    for col in categories:
+        df[f"{col}_per_1000"] = df[col] / df["population"] * 1000
+    return df
+
+
+def test_update_tract_month_recomputes_rates_of_filled_categories(tmp_path):
+    path = tmp_path / "tract_month.csv"
+    tract_month({"Plumbing & Water": [1.0, 0.0]}, [1000.0, 0.0]).to_csv(path, index=False)
+    recomputed = tract_month({"Electrical": [2.0, 1.0]}, [1000.0, 0.0])
+    affected = recomputed.loc[[1], ["GEOID", "year_month"]]
+
+    updated = incremental.update_tract_month(path, recomputed, affected)
+
+    assert list(updated.columns) == [
+        "GEOID", "year_month", "Electrical", "Plumbing & Water", "violations_count", "population",
+        "per_cap_inc", "violations_per_1000", "Electrical_per_1000", "Plumbing & Water_per_1000",
+    ]
+    pd.testing.assert_frame_equal(pd.read_csv(path, dtype={"GEOID": str}), updated, check_dtype=False)
+    kept, replaced = updated.iloc[0], updated.iloc[1]
+    assert kept["Electrical"] == 0 and kept["Electrical_per_1000"] == 0
+    # zero population: 0/0 stays NaN, 1/0 is inf, as in a full build
+    assert np.isnan(replaced["Plumbing & Water_per_1000"])
+    assert np.isinf(replaced["Electrical_per_1000"])
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import ordinance_join
+import benchmark
+
+
+def synthetic_tables(rows, seed=0):
+    # `rows` building violations and a third as many ordinance hearings on a
+    # subset of their keys, several hearings per key, with messy whitespace,
+    # mixed case and some missing values
+    rng = np.random.default_rng(seed)
+    texts = np.array([f"ARRANGE PREMISES {i}" for i in range(2000)] + ["REPAIR PORCH", "POST OWNER NAME"], dtype=object)
+    codes = np.array([f"CN{190000 + i}" for i in range(len(texts))], dtype=object)
+    addresses = np.array([f"{i} W MADISON ST" for i in range(max(rows // 5, 1))], dtype=object)
+    dates = pd.date_range("2024-01-01", "2026-03-01").strftime("%m/%d/%Y").to_numpy(dtype=object)
+
+    address = rng.integers(0, len(addresses), rows)
+    date = rng.integers(0, len(dates), rows)
+    text = rng.integers(0, len(texts), rows)
+    messy = rng.random(rows) < 0.1
+    violations = pd.DataFrame({
+        "ID": np.arange(rows).astype(str),
+        "ADDRESS": np.where(messy, " " + np.char.lower(addresses[address].astype(str)), addresses[address]),
+        "VIOLATION DATE": dates[date],
+        "VIOLATION DESCRIPTION": np.where(messy, np.char.lower(texts[text].astype(str)) + " ", texts[text]),
+    })
+    violations.loc[rng.random(rows) < 0.01, "VIOLATION DATE"] = None
+
+    hearings = max(rows // 3, 1)
+    source = rng.integers(0, rows, hearings)
+    ordinance = pd.DataFrame({
+        "ADDRESS": addresses[address[source]],
+        "VIOLATION DATE": violations["VIOLATION DATE"].to_numpy()[source],
+        "VIOLATION DESCRIPTION": codes[text[source]] + " " + texts[text[source]] + ".",
+        # distinct timestamps, so the reference's unstable sort has no ties
+        "HEARING DATE": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.permutation(hearings) * 60, unit="s"),
+        "CASE DISPOSITION": pd.Categorical(rng.choice(["Liable", "Not Liable", "Default", "Continuance"], hearings)),
+        "IMPOSED FINE": rng.integers(0, 5000, hearings).astype(np.float32),
+    })
+    ordinance.loc[rng.random(hearings) < 0.01, "HEARING DATE"] = pd.NaT
+    return violations, ordinance
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_merge_ordinance_matches_pandas_merge(seed):
+    violations, ordinance = synthetic_tables(20_000, seed)
+    expected = benchmark.merge_ordinance_pandas(violations, ordinance)
+    result = ordinance_join.merge_ordinance(violations, ordinance)
+    assert result["CASE DISPOSITION"].notna().any()
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_merge_ordinance_rejects_keys_duplicated_after_cleaning():
+    violations = pd.DataFrame({
+        "ADDRESS": ["1 W MADISON ST"],
+        "VIOLATION DATE": ["01/02/2024"],
+        "VIOLATION DESCRIPTION": ["REPAIR PORCH"],
+    })
+    # two codes for the same description: distinct before cleaning, equal after
+    ordinance = pd.DataFrame({
+        "ADDRESS": ["1 W MADISON ST"] * 2,
+        "VIOLATION DATE": ["01/02/2024"] * 2,
+        "VIOLATION DESCRIPTION": ["CN190001 REPAIR PORCH.", "CN190002 REPAIR PORCH."],
+        "HEARING DATE": pd.to_datetime(["2024-03-01", "2024-04-01"]),
+        "CASE DISPOSITION": ["Liable", "Default"],
+        "IMPOSED FINE": [100.0, 200.0],
+    })
+    with pytest.raises(pd.errors.MergeError):
+        benchmark.merge_ordinance_pandas(violations, ordinance)
+    with pytest.raises(pd.errors.MergeError):
+        ordinance_join.merge_ordinance(violations, ordinance)
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+import partitions
+import preprocessing
+
+
+def month_table(month, counts, population):
+    # one tract-month part as aggregate_tract_month returns it
+    df = pd.DataFrame({"GEOID": ["17031000100", "17031000200"], "year_month": month, **counts})
+    df["violations_count"] = sum(counts.values())
+    df["population"] = population
+    df["per_cap_inc"] = 30000.0
+    df["violations_per_1000"] = df["violations_count"] / df["population"] * 1000
+    for col in counts:
+        df[f"{col}_per_1000"] = df[col] / df["population"] * 1000
+    return df
+
+
+def test_merge_tract_month_fills_counts_not_rates():
+    # tract 200 has no population: its rates are inf, or NaN for 0/0
+    population = [1000.0, 0.0]
+    parts = [
+        month_table("2024-01", {"Electrical": np.array([2.0, 1.0])}, population),
+        month_table("2024-02", {"Plumbing & Water": np.array([4.0, 3.0])}, population),
+    ]
+    merged = preprocessing.merge_tract_month(parts).set_index(["GEOID", "year_month"])
+
+    assert merged.loc[("17031000100", "2024-02"), "Electrical"] == 0
+    assert merged.loc[("17031000100", "2024-02"), "Electrical_per_1000"] == 0
+    assert np.isnan(merged.loc[("17031000200", "2024-02"), "Electrical_per_1000"])
+    assert np.isinf(merged.loc[("17031000200", "2024-01"), "Electrical_per_1000"])
+
+
+def test_undated_rows_get_the_missing_month_partition(tmp_path):
+    dates = pd.Series(["01/15/2024", None, "not a date"])
+    assert partitions.year_month(dates).isna().tolist() == [False, True, True]
+    assert partitions.partition_dir(tmp_path, np.nan).name == f"year_month={partitions.MISSING_MONTH}"
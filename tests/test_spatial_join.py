@@ -0,0 +1,72 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+import spatial_join
+import tract_lookup
+
+CRS = "ESRI:102003"
+
+
+def tracts():
+    # a 4 x 4 grid of 1 km tracts plus one that overlaps four of them, so
+    # some points fall in two tracts
+    boxes = [shapely.box(x * 1000, y * 1000, (x + 1) * 1000, (y + 1) * 1000) for x in range(4) for y in range(4)]
+    boxes.append(shapely.box(1500, 1500, 2500, 2500))
+    return gpd.GeoDataFrame(
+        {"GEOID": [f"17031{i:06d}" for i in range(len(boxes))], "population": np.arange(len(boxes)) * 100.0},
+        geometry=boxes,
+        crs=CRS
+    )
+
+
+def points(rows=2000, seed=0):
+    # points inside, on the edges of and outside the grid, repeated
+    # locations, and points without coordinates
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(-500, 4500, rows)
+    y = rng.uniform(-500, 4500, rows)
+    x[:100], y[:100] = rng.integers(0, 5, 100) * 1000.0, rng.uniform(0, 4000, 100)
+    x[100:200], y[100:200] = x[200:300], y[200:300]
+    x[300:320] = y[300:320] = np.nan
+    return gpd.GeoDataFrame(
+        {"ID": np.arange(rows).astype(str), "LONGITUDE": x, "LATITUDE": y},
+        geometry=gpd.points_from_xy(x, y),
+        crs=CRS
+    )
+
+
+def geoids(joined):
+    # the (point, GEOID) pairs of a join, in a fixed order
+    return (
+        joined[["ID", "GEOID"]]
+        .astype(object)
+        .fillna("")
+        .sort_values(["ID", "GEOID"])
+        .reset_index(drop=True)
+    )
+
+
+@pytest.fixture(scope="module")
+def expected():
+    return geoids(gpd.sjoin(points(), tracts(), how="left", predicate="within"))
+
+
+@pytest.mark.parametrize("workers, chunksize", [(1, 250_000), (2, 300)])
+def test_sjoin_within_matches_geopandas(expected, workers, chunksize):
+    joined = spatial_join.sjoin_within(points(), tracts(), workers=workers, chunksize=chunksize)
+    assert len(joined) == len(expected)
+    pd.testing.assert_frame_equal(geoids(joined), expected)
+
+
+def test_tract_lookup_matches_geopandas(expected, tmp_path):
+    lookup = tract_lookup.TractLookup(tmp_path / "lookup.npz", "tracts")
+    pd.testing.assert_frame_equal(geoids(lookup.sjoin_within(points(), tracts(), workers=1)), expected)
+    lookup.save()
+
+    # a second run served from the saved table
+    cached = tract_lookup.TractLookup(tmp_path / "lookup.npz", "tracts")
+    pd.testing.assert_frame_equal(geoids(cached.sjoin_within(points(), tracts(), workers=1)), expected)
+    assert cached.stats[-1]["hit_rate"] == 1